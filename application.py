@@ -1,7 +1,11 @@
-import re
+import cProfile
+import io
+import pstats
 import sys
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import tempfile
+import time
+from flask import Flask, Response, g, redirect, request, jsonify, send_from_directory
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -10,18 +14,182 @@ load_dotenv()
 # Add the parent directory to sys.path to access the scripts package
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '')))
 
-from scripts.modeling.whisky_recommender_model import recommend_whisky
+from scripts.feedback.aggregation import DEFAULT_PUBLISH_INTERVAL_SECONDS, FeedbackAggregator, S3FeedbackArchive
+from scripts.feedback.feedback_sink import (
+    DEFAULT_MAX_BATCH_SECONDS, DEFAULT_MAX_BATCH_SIZE, FeedbackSink, LocalFeedbackWriter, S3FeedbackWriter,
+)
+from scripts.modeling.ann_index import DEFAULT_N_PROBE
+from scripts.modeling.dataset_snapshot import DEFAULT_CHECK_INTERVAL_SECONDS, SnapshotReloader
+from scripts.modeling.recommendation_cache import DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL_SECONDS
+from scripts.modeling.single_flight import DEFAULT_COALESCE_TIMEOUT_SECONDS
+from scripts.monitoring.metrics import REGISTRY, render_prometheus
+from scripts.monitoring.startup import STARTUP
+from scripts.serving.catalog import DEFAULT_AUTOCOMPLETE_LIMIT, Catalog
+from scripts.serving.http_cache import (
+    DEFAULT_RECOMMEND_MAX_AGE_SECONDS, canonical_recommendation, etag_matches, parse_recommend_query,
+)
+from scripts.serving.validation import (
+    is_whisky_name_list, mode_error, num_recommendations_error, parse_feedback, parse_mode,
+    parse_num_recommendations, parse_recommend_request,
+)
+
+# Interpreter startup and imports. Serving a feature store imports NumPy but neither pandas nor
+# scikit-learn, which only the offline pipeline needs.
+STARTUP.record_phase('imports', time.time() - STARTUP.started_at)
 
 application = Flask(__name__, static_url_path='', static_folder='./frontend')
 
 # Environment setup
 IS_LOCAL = os.getenv('IS_LOCAL', 'True') == 'True'
 S3_BUCKET = os.getenv('S3_BUCKET')  # Only necessary when not local
+# Features CSV, feature store, or snapshot root whose CURRENT pointer names the served snapshot
+WHISKY_DATA_FILE = os.getenv(
+    'WHISKY_DATA_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'processed', '2023_09', 'whisky_features_100.csv')
+)
+# Distillery -> whisky table written by the data pipeline, served by /catalog and /autocomplete
+CATALOG_FILE = os.getenv(
+    'CATALOG_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'distillery_data.csv')
+)
+
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+MAX_RECOMMENDATIONS = int(os.getenv('MAX_RECOMMENDATIONS', '50'))
+# Time browsers and CDNs may serve GET /recommend responses before revalidating them
+RECOMMEND_MAX_AGE = int(os.getenv('RECOMMEND_MAX_AGE', str(DEFAULT_RECOMMEND_MAX_AGE_SECONDS)))
+MAX_AUTOCOMPLETE_RESULTS = int(os.getenv('MAX_AUTOCOMPLETE_RESULTS', '50'))
+ANN_N_PROBE = int(os.getenv('ANN_N_PROBE', str(DEFAULT_N_PROBE)))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', str(DEFAULT_CACHE_SIZE)))
+RECOMMENDATION_CACHE_TTL = float(os.getenv('RECOMMENDATION_CACHE_TTL', str(DEFAULT_CACHE_TTL_SECONDS)))
+# Longest time a request waits for an identical recommendation in flight before computing it
+COALESCE_TIMEOUT = float(os.getenv('COALESCE_TIMEOUT', str(DEFAULT_COALESCE_TIMEOUT_SECONDS)))
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', str(DEFAULT_CHECK_INTERVAL_SECONDS)))
+# Directory shared by the gunicorn workers to aggregate their metrics
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'whisky_metrics'))
+# Requests sent with the X-Profile header get a cProfile summary in the logs when enabled
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILE_HEADER = 'X-Profile'
+# Feedback is written in batches of at most this many entries, at least every this many seconds
+FEEDBACK_BATCH_SIZE = int(os.getenv('FEEDBACK_BATCH_SIZE', str(DEFAULT_MAX_BATCH_SIZE)))
+FEEDBACK_BATCH_SECONDS = float(os.getenv('FEEDBACK_BATCH_SECONDS', str(DEFAULT_MAX_BATCH_SECONDS)))
+# Local directory the batches that could not be written after retries are spilled to
+FEEDBACK_SPILL_DIR = os.getenv('FEEDBACK_SPILL_DIR', os.path.join('data', 'feedback', 'spill'))
+# Feedback statistics snapshot, and how often new feedback is published to the ranking
+FEEDBACK_STATS_FILE = os.getenv('FEEDBACK_STATS_FILE', os.path.join('data', 'feedback', 'feedback_stats.json'))
+FEEDBACK_PUBLISH_INTERVAL = float(os.getenv('FEEDBACK_PUBLISH_INTERVAL', str(DEFAULT_PUBLISH_INTERVAL_SECONDS)))
+# Weight of the feedback scores in the ranking; 0 ranks on tasting notes only
+FEEDBACK_WEIGHT = float(os.getenv('FEEDBACK_WEIGHT', '0'))
+
+REGISTRY.metrics_dir = METRICS_DIR
 
 # Define the directories and files based on whether the app is running locally or on AWS
 if IS_LOCAL:
     FEEDBACK_DIR = os.path.join('', 'data', 'feedback', '2024_05')
-    os.makedirs(FEEDBACK_DIR, exist_ok=True)
+    feedback_writer = LocalFeedbackWriter(FEEDBACK_DIR)
+    feedback_archive = None
+else:
+    feedback_writer = S3FeedbackWriter(S3_BUCKET)
+    feedback_archive = S3FeedbackArchive(S3_BUCKET)
+
+# Feedback statistics, restored from their snapshot and the feedback files written since (by
+# any worker: every worker reads the whole archive, so the shared snapshot is complete)
+with STARTUP.phase('feedback_statistics'):
+    feedback_aggregator = FeedbackAggregator.restore(
+        [FEEDBACK_DIR] if IS_LOCAL else [],
+        FEEDBACK_STATS_FILE,
+        publish_interval_seconds=FEEDBACK_PUBLISH_INTERVAL,
+        archive=feedback_archive,
+    )
+
+# Load the feature dataset once per process (i.e. once per gunicorn worker). Newly published
+# snapshots are swapped in by every worker without a restart.
+with STARTUP.phase('dataset'):
+    dataset = SnapshotReloader(
+        WHISKY_DATA_FILE,
+        check_interval_seconds=SNAPSHOT_CHECK_INTERVAL,
+        ann_n_probe=ANN_N_PROBE,
+        cache_size=RECOMMENDATION_CACHE_SIZE,
+        cache_ttl_seconds=RECOMMENDATION_CACHE_TTL,
+        coalesce_timeout_seconds=COALESCE_TIMEOUT,
+        feedback=feedback_aggregator,
+        feedback_weight=FEEDBACK_WEIGHT,
+    )
+
+# Build the catalog document and autocomplete index once per process
+with STARTUP.phase('catalog'):
+    catalog = Catalog.from_csv(CATALOG_FILE)
+
+
+def count_written_feedback(entries, location):
+    # Runs in the sink's thread: requests never wait on the statistics or the archive
+    feedback_aggregator.add_batch(entries, location)
+    feedback_aggregator.refresh()
+
+
+feedback_sink = FeedbackSink(
+    feedback_writer, max_batch_size=FEEDBACK_BATCH_SIZE, max_batch_seconds=FEEDBACK_BATCH_SECONDS,
+    on_written=count_written_feedback, fallback_writer=LocalFeedbackWriter(FEEDBACK_SPILL_DIR),
+)
+STARTUP.mark_ready()
+
+@application.before_request
+def start_request_instrumentation():
+    g.request_start = time.perf_counter()
+    STARTUP.record_request()
+    g.profiler = None
+    if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@application.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REGISTRY.observe('whisky_request_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+    REGISTRY.increment('whisky_requests_total', endpoint=endpoint, status=str(response.status_code))
+    REGISTRY.maybe_flush()
+
+    if g.get('profiler') is not None:
+        g.profiler.disable()
+        summary = io.StringIO()
+        pstats.Stats(g.profiler, stream=summary).sort_stats('cumulative').print_stats(30)
+        print(f"Profile of {request.method} {request.path}:\n{summary.getvalue()}")
+    return response
+
+
+# Prometheus metrics of all the workers
+@application.route('/metrics')
+def metrics():
+    return Response(render_prometheus(REGISTRY.collect()), mimetype='text/plain; version=0.0.4')
+
+
+# Startup phase timings and time to first request of the worker answering
+@application.route('/startup')
+def startup():
+    return jsonify(STARTUP.report())
+
+
+# Distillery -> whisky catalog, gzip-compressed and revalidated by ETag
+@application.route('/catalog')
+def catalog_endpoint():
+    etag = f'"{catalog.etag}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if catalog.etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    if 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+        return Response(catalog.compressed_document, mimetype='application/json', headers=headers)
+    return Response(catalog.document, mimetype='application/json', headers=headers)
+
+
+# Completion of partially typed distillery and whisky names
+@application.route('/autocomplete')
+def autocomplete_endpoint():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', DEFAULT_AUTOCOMPLETE_LIMIT, type=int)
+    if not 1 <= limit <= MAX_AUTOCOMPLETE_RESULTS:
+        return jsonify({'error': f'Invalid input, limit must be an integer between 1 and {MAX_AUTOCOMPLETE_RESULTS}'}), 400
+    return jsonify(catalog.autocomplete(query, limit))
+
 
 # Main page
 @application.route('/')
@@ -33,55 +201,126 @@ def index():
 @application.route('/submitFeedback', methods=['POST'])
 def submit_feedback():
     data = request.get_json()
-    required_fields = ['whisky1', 'whisky2', 'whisky3', 'recommendedWhisky', 'feedback1', 'timestamp']
-    optional_fields = ['rating', 'feedback2', 'experience']
+    entry, error = parse_feedback(data)
+    if error:
+        return jsonify({'error': error}), 400
 
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing data'}), 400
+    # Log incoming data
+    print(data)
+
+    # Only queue the entry: the sink writes it with the rest of its batch in the background
+    if not feedback_sink.submit(entry):
+        return jsonify({'error': 'Feedback queue is full, please retry later'}), 503
+
+    return jsonify({'message': 'Feedback submitted successfully'}), 200
+
+# Recommendation endpoint. Responses carry a strong ETag, and the canonical GET URL of the same
+# recommendation for clients and caches to use
+@application.route('/recommend', methods=['POST'])
+def recommend_whisky_endpoint():
+    parameters, error = parse_recommend_request(request.get_json(), MAX_RECOMMENDATIONS)
+    if error:
+        return jsonify({'error': error}), 400
 
     try:
-        # Log incoming data
-        print(data)
-
-        # Prepare feedback data for CSV
-        header = required_fields + optional_fields
-        feedback_entries = [data.get(field, '') for field in header]
-
-        # Construct CSV content
-        csv_content = ','.join(['"{}"'.format(entry) for entry in header]) + '\n'  # Header row
-        csv_content += ','.join(['"{}"'.format(entry) for entry in feedback_entries])  # Data row
-
-        # Sanitize timestamp and create a filename
-        sanitized_timestamp = re.sub(r'[^a-zA-Z0-9]', '_', data['timestamp'])
-        feedback_file_name = f'feedback_{sanitized_timestamp}.csv'
-
-        # Decide storage based on environment
-        if IS_LOCAL:
-            feedback_file = os.path.join(FEEDBACK_DIR, feedback_file_name)
-            with open(feedback_file, 'w', newline='') as file:
-                file.write(csv_content)
-            print(f"Feedback written to local file: {feedback_file}")
-        else:
-            import boto3
-            s3 = boto3.client('s3')
-            s3.put_object(Bucket=S3_BUCKET, Key=feedback_file_name, Body=csv_content.encode('utf-8'))
-            print(f"Feedback written to S3 bucket {S3_BUCKET}")
-
-        return jsonify({'message': 'Feedback submitted successfully'}), 200
+        recommender = dataset.current()
+        _, query, etag = canonical_recommendation(recommender, parameters)
+        recommended_whisky = recommender.recommend(**parameters)
+        response = jsonify({'recommended_whisky': recommended_whisky})
+        response.headers['ETag'] = f'"{etag}"'
+        response.headers['Content-Location'] = f'/recommend?{query}'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error occurred: {e}")
         return jsonify({'error': str(e)}), 500
 
-# Recommendation endpoint
-@application.route('/recommend', methods=['POST'])
-def recommend_whisky_endpoint():
+# Cacheable recommendation endpoint: requests are redirected to their canonical URL, and
+# conditional requests for a current ETag get a 304 without computing the recommendation
+@application.route('/recommend', methods=['GET'])
+def recommend_whisky_get_endpoint():
+    data, error = parse_recommend_query(request.args.items(multi=True))
+    if error:
+        return jsonify({'error': error}), 400
+    parameters, error = parse_recommend_request(data, MAX_RECOMMENDATIONS)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        recommender = dataset.current()
+        selection, query, etag = canonical_recommendation(recommender, parameters)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': f'public, max-age={RECOMMEND_MAX_AGE}'}
+        if selection and query != request.query_string.decode('utf-8'):
+            return redirect(f'/recommend?{query}', code=302), {'Cache-Control': headers['Cache-Control']}
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            return Response(status=304, headers=headers)
+
+        recommended_whisky = recommender.recommend(**parameters)
+        return jsonify({'recommended_whisky': recommended_whisky}), headers
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# "More like this" endpoint, answered from the precomputed neighbour table when available
+@application.route('/similar', methods=['GET'])
+def similar_whiskies_endpoint():
+    whisky_name = request.args.get('whisky')
+    if not whisky_name:
+        return jsonify({'error': 'Invalid input, whisky name expected'}), 400
+    k = parse_num_recommendations({'k': request.args.get('k', 10, type=int)}, MAX_RECOMMENDATIONS)
+    if k is None:
+        return jsonify({'error': num_recommendations_error(MAX_RECOMMENDATIONS)}), 400
+
+    try:
+        recommender = dataset.current()
+        similar_whiskies = recommender.recommend([whisky_name], k=k)
+        return jsonify({'similar_whiskies': similar_whiskies})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Name resolution endpoint: maps free-text names to catalog names, with suggestions for misses
+@application.route('/resolve', methods=['POST'])
+def resolve_whisky_names_endpoint():
     data = request.get_json()
-    if 'whisky_names' not in data or not isinstance(data['whisky_names'], list):
+    whisky_names = data.get('whisky_names') if isinstance(data, dict) else None
+    if not is_whisky_name_list(whisky_names):
         return jsonify({'error': 'Invalid input, list of whisky names expected'}), 400
+    if len(whisky_names) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many names, at most {MAX_BATCH_SIZE} per request'}), 400
+
+    recommender = dataset.current()
+    return jsonify({'resolved_whiskies': recommender.name_resolver.resolve_many(whisky_names)})
+
+# Batch recommendation endpoint
+@application.route('/recommend/batch', methods=['POST'])
+def recommend_whisky_batch_endpoint():
+    data = request.get_json()
+    whisky_name_lists = data.get('whisky_name_lists') if isinstance(data, dict) else None
+    if not isinstance(whisky_name_lists, list) or not all(is_whisky_name_list(names) for names in whisky_name_lists):
+        return jsonify({'error': 'Invalid input, list of whisky name lists expected'}), 400
+    if len(whisky_name_lists) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Too many selections, at most {MAX_BATCH_SIZE} per batch'}), 400
+    k = parse_num_recommendations(data, MAX_RECOMMENDATIONS)
+    if k is None:
+        return jsonify({'error': num_recommendations_error(MAX_RECOMMENDATIONS)}), 400
+    mode = parse_mode(data)
+    if mode is None:
+        return jsonify({'error': mode_error()}), 400
 
     try:
-        recommended_whisky = recommend_whisky(data['whisky_names'])
-        return jsonify({'recommended_whisky': recommended_whisky})
+        recommender = dataset.current()
+        recommended_whiskies = recommender.recommend_many(
+            whisky_name_lists, k=k, mode=mode, filters=data.get('filters')
+        )
+        return jsonify({'recommended_whiskies': recommended_whiskies})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error occurred: {e}")
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,29 @@
+import os
+
+# The configuration, dataset, catalog and feedback sink are the ones of the Flask app, so that
+# both serving modes answer from the same data with the same settings
+from application import (
+    MAX_RECOMMENDATIONS, RECOMMEND_MAX_AGE, application as flask_application, catalog, dataset,
+    feedback_sink,
+)
+from scripts.monitoring.startup import STARTUP
+from scripts.serving.asgi_app import DEFAULT_MAX_CONCURRENCY, AsyncWhiskyApp
+
+# Recommendation requests in flight beyond which requests are rejected with a 429 status
+ASYNC_MAX_CONCURRENCY = int(os.getenv('ASYNC_MAX_CONCURRENCY', str(DEFAULT_MAX_CONCURRENCY)))
+# Threads scoring recommendations in each worker, by default one per CPU
+ASYNC_SCORING_THREADS = int(os.getenv('ASYNC_SCORING_THREADS', '0')) or None
+
+# Asynchronous serving mode, run with e.g.
+#   gunicorn --workers=3 --preload -k uvicorn.workers.UvicornWorker asgi_application:application
+application = AsyncWhiskyApp(
+    dataset,
+    feedback_sink,
+    catalog,
+    static_folder=flask_application.static_folder,
+    max_recommendations=MAX_RECOMMENDATIONS,
+    max_concurrency=ASYNC_MAX_CONCURRENCY,
+    scoring_threads=ASYNC_SCORING_THREADS,
+    recommend_max_age=RECOMMEND_MAX_AGE,
+    startup_report=STARTUP,
+)
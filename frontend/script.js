@@ -1,24 +1,28 @@
-// Add this JavaScript code to dynamically load unique distillery options from the CSV file
+// Distillery -> whisky catalog, fetched from the server once per page load. The server
+// answers with gzip-compressed JSON and an ETag, so the browser cache revalidates it cheaply.
+let catalogPromise = null;
+
+function loadCatalog() {
+    if (!catalogPromise) {
+        catalogPromise = fetch('/catalog').then(response => {
+            if (!response.ok) throw new Error(`Failed to load catalog, status: ${response.status}`);
+            return response.json();
+        }).catch(error => {
+            catalogPromise = null; // Retry on the next call
+            throw error;
+        });
+    }
+    return catalogPromise;
+}
 
-// Function to load distillery options from the CSV file
+// Function to load distillery options from the catalog
 async function loadDistilleryOptions() {
     try {
-        const response = await fetch('distillery_data.csv');
-        if (!response.ok) throw new Error('Failed to load CSV data');
-
-        const data = await response.text();
-        const distilleries = new Set(); // Use a Set to store unique distilleries
-
-        // Parse the CSV data and extract distilleries
-        const rows = data.split('\n').slice(1); // Skip the header
-        rows.forEach(row => {
-            const [distillery] = row.split(','); // Only get the first column
-            if (distillery) distilleries.add(distillery.trim());
-        });
+        const catalog = await loadCatalog();
 
         // Populate distillery dropdowns
         const distillerySelects = document.querySelectorAll('.distillery-select');
-        distilleries.forEach((distillery) => {
+        Object.keys(catalog.distilleries).forEach((distillery) => {
             distillerySelects.forEach((select) => {
                 const option = document.createElement("option");
                 option.value = distillery;
@@ -37,23 +41,8 @@ async function updateWhiskyDropdown(selectedDistillerySelect, whiskySelectId) {
     const whiskySelect = document.getElementById(whiskySelectId);
 
     try {
-        // Fetch the CSV data
-        const response = await fetch('distillery_data.csv');
-        if (!response.ok) throw new Error('Failed to load CSV data');
-
-        const data = await response.text();
-
-        // Parse the CSV data into an object mapping distilleries to whiskies
-        const distilleryWhiskies = {};
-        const rows = data.split('\n');
-
-        for (let i = 1; i < rows.length; i++) {
-            const [distillery, whiskyName] = rows[i].split(',').map(str => str.trim());
-            if (!distilleryWhiskies[distillery]) {
-                distilleryWhiskies[distillery] = [];
-            }
-            distilleryWhiskies[distillery].push(whiskyName);
-        }
+        const catalog = await loadCatalog();
+        const distilleryWhiskies = catalog.distilleries;
 
         // Update the whisky dropdown based on the selected distillery
         whiskySelect.innerHTML = ""; // Clear the current options
@@ -118,12 +107,10 @@ async function recommendWhisky() {
     console.log("Stringified", JSON.stringify(data));
 
     try {
-        // Send the data to the backend for recommendations
-        const response = await fetch('/recommend', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(data)
-        });
+        // Send the data to the backend for recommendations. The GET variant is redirected to
+        // one canonical URL per selection, so repeat queries are served by the browser cache
+        const query = new URLSearchParams(data.whisky_names.map(name => ['whisky', name]));
+        const response = await fetch(`/recommend?${query}`);
 
         if (!response.ok) throw new Error(`Failed to fetch recommendation, status: ${response.status}`);
 
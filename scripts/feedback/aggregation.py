@@ -0,0 +1,489 @@
+"""
+Feedback Aggregation Module
+
+This module keeps running statistics of the feedback, so that the recommender can use it
+without ever reading feedback files while answering a request:
+
+    - per whisky (the recommended whisky of the submissions): number of submissions, of users
+      who knew it, of ratings and the sum of the ratings;
+    - per (selection, recommendation) pair, the selection being the normalized, sorted names
+      of the submitted whisky1..3: number of submissions, of ratings and their sum.
+
+Each entry updates a handful of counters in O(1). Entries are counted once they are written
+to the feedback archive (the `FeedbackSink` reports every batch it wrote, see
+`FeedbackAggregator.add_batch`), and every archive file is counted once: the aggregator
+remembers the files it counted, so feedback written by other processes is picked up by
+reading only the archive files it has not seen yet, listed in the local feedback directories
+or, for an S3 archive, by listing the object keys (`S3FeedbackArchive`). Every process thus
+counts the feedback of all the processes, and any of them can snapshot the statistics to the
+shared snapshot file: a snapshot lists the files it counted, so a process restoring an older
+one still reads the files missing from it. The statistics are periodically
+snapshotted to disk with that list of files, and a process starting from a snapshot only
+reads the files written since; without a snapshot, they are rebuilt from the whole archive
+in one streaming pass.
+
+Readers use the scores published by `publish`: the shrunk mean rating of each whisky and
+pair mapped to [-1, 1], with a version that changes with every publication, so that cached
+recommendations blending them are not served once they change.
+
+Classes:
+    FeedbackAggregator: Incremental feedback statistics and the scores published from them.
+    S3FeedbackArchive: Lists and reads the feedback files of an S3 archive.
+
+Functions:
+    parse_rating(value): Returns a submitted rating, or None if it is missing or invalid.
+    selection_key(whisky_names): Returns the canonical form of a selected whisky list.
+"""
+
+import csv
+import fnmatch
+import glob
+import io
+import json
+import os
+import threading
+import time
+
+from scripts.feedback.feedback_sink import SOURCE_FILE_PATTERN
+from scripts.modeling.name_index import normalize_name
+
+SNAPSHOT_VERSION = 1
+SELECTION_FIELDS = ("whisky1", "whisky2", "whisky3")
+KNOWN_FEEDBACK = "know"
+
+MIN_RATING = 1
+MAX_RATING = 5
+NEUTRAL_RATING = 3
+# Number of neutral ratings every mean is shrunk towards, so that one rating moves little
+PRIOR_RATINGS = 5
+
+DEFAULT_PUBLISH_INTERVAL_SECONDS = 60.0
+
+
+def parse_rating(value):
+    """
+    Return a submitted rating.
+
+    Parameters:
+    value (object): Rating as submitted, e.g. "4", 4 or None.
+
+    Returns:
+    int: The rating, or None if it is missing, not an integer or out of range.
+    """
+    try:
+        rating = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not rating.is_integer() or not MIN_RATING <= rating <= MAX_RATING:
+        return None
+    return int(rating)
+
+
+def selection_key(whisky_names):
+    """
+    Return the canonical form of a selection: its normalized names, sorted, each once.
+
+    Parameters:
+    whisky_names (iterable of str): Selected whisky names; empty names are ignored.
+
+    Returns:
+    tuple of str: Canonical selection.
+    """
+    return tuple(sorted({normalize_name(name) for name in whisky_names} - {""}))
+
+
+def _shrunk_score(rating_count, rating_sum):
+    """Map the mean of some ratings, shrunk towards neutral, to [-1, 1]."""
+    mean = (rating_sum + PRIOR_RATINGS * NEUTRAL_RATING) / (
+        rating_count + PRIOR_RATINGS
+    )
+    return (mean - NEUTRAL_RATING) / (MAX_RATING - NEUTRAL_RATING)
+
+
+def _source_name(location):
+    """Name an archive file by its directory and file name, e.g. "2024_05/feedback_x.csv"."""
+    return "/".join(location.replace(os.sep, "/").split("/")[-2:])
+
+
+class S3FeedbackArchive:
+    """
+    Lists and reads the feedback files of an S3 archive, e.g. the objects written by an
+    `S3FeedbackWriter`.
+
+    Parameters:
+    bucket (str): Archive bucket.
+    prefix (str): Prefix of the object keys.
+    client (object): S3 client; by default a boto3 client is created on first use in each
+                     process, since the archive is first read before gunicorn forks.
+    """
+
+    def __init__(self, bucket, prefix="", client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+        self._client_pid = None
+
+    @property
+    def client(self):
+        if self._client is None or self._client_pid not in (None, os.getpid()):
+            import boto3
+
+            self._client = boto3.client("s3")
+            self._client_pid = os.getpid()
+        return self._client
+
+    def keys(self):
+        """
+        List the feedback files of the archive.
+
+        Returns:
+        list of str: Sorted keys of the objects named like feedback files.
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        keys = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                name = item["Key"].rsplit("/", 1)[-1]
+                if fnmatch.fnmatch(name, SOURCE_FILE_PATTERN):
+                    keys.append(item["Key"])
+        return sorted(keys)
+
+    def read(self, key):
+        """
+        Read the entries of a feedback file.
+
+        Parameters:
+        key (str): Key of the object.
+
+        Returns:
+        list of dict: Feedback entries.
+        """
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        return list(csv.DictReader(io.StringIO(body.decode("utf-8"), newline="")))
+
+
+class FeedbackAggregator:
+    """
+    Incremental feedback statistics, and the ranking scores published from them.
+
+    Parameters:
+    source_dirs (list of str): Local feedback directories (the archive) whose files not
+                               counted yet are read by `refresh`; none for an S3 archive.
+    snapshot_path (str): File the statistics are snapshotted to by `refresh`, or None. It
+                         may be shared by several processes.
+    publish_interval_seconds (float): Minimum time between two `refresh` publications.
+    clock (callable): Function returning the current time in seconds.
+    archive (S3FeedbackArchive): S3 archive whose files not counted yet are read by
+                                 `refresh`, or None.
+    """
+
+    def __init__(
+        self,
+        source_dirs=(),
+        snapshot_path=None,
+        publish_interval_seconds=DEFAULT_PUBLISH_INTERVAL_SECONDS,
+        clock=time.monotonic,
+        archive=None,
+    ):
+        self.source_dirs = list(source_dirs)
+        self.snapshot_path = snapshot_path
+        self.archive = archive
+        self.publish_interval_seconds = publish_interval_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+        # name -> [submissions, known, ratings, rating sum]
+        self.whiskies = {}
+        # (selection, name) -> [submissions, ratings, rating sum]
+        self.pairs = {}
+        self.sources = set()
+        self.entries = 0
+
+        self.version = 0
+        self._whisky_scores = {}
+        self._pair_scores = {}
+        self._published_entries = 0
+        self._published_at = None
+
+    def update(self, entry):
+        """
+        Count one feedback entry, in O(1).
+
+        Parameters:
+        entry (dict): Feedback fields, as validated by `parse_feedback`.
+        """
+        with self._lock:
+            self._count(entry)
+
+    def _count(self, entry):
+        """Count one feedback entry; the caller holds the lock."""
+        recommended = normalize_name(entry.get("recommendedWhisky") or "")
+        if not recommended:
+            return
+        rating = parse_rating(entry.get("rating"))
+        pair = (
+            selection_key(entry.get(field) or "" for field in SELECTION_FIELDS),
+            recommended,
+        )
+        whisky = self.whiskies.setdefault(recommended, [0, 0, 0, 0])
+        whisky[0] += 1
+        whisky[1] += entry.get("feedback1") == KNOWN_FEEDBACK
+        counts = self.pairs.setdefault(pair, [0, 0, 0])
+        counts[0] += 1
+        if rating is not None:
+            whisky[2] += 1
+            whisky[3] += rating
+            counts[1] += 1
+            counts[2] += rating
+        self.entries += 1
+
+    def add_batch(self, entries, location):
+        """
+        Count a batch of entries written to the archive, unless its file was counted already.
+        Meant to be passed as the `on_written` callback of a `FeedbackSink`.
+
+        Parameters:
+        entries (list of dict): Feedback entries of the batch.
+        location (str): Path or object key the batch was written to.
+        """
+        source = _source_name(location)
+        # One update with the file, so that a snapshot never lists a file partly counted
+        with self._lock:
+            if source in self.sources:
+                return
+            self.sources.add(source)
+            for entry in entries:
+                self._count(entry)
+
+    def ingest_archive(self, source_dirs=None):
+        """
+        Count the archive files not counted yet, streaming each of them once: the files of
+        the local directories, then those of the S3 archive.
+
+        Parameters:
+        source_dirs (list of str): Feedback directories; `source_dirs` by default.
+
+        Returns:
+        int: Number of files read.
+        """
+        source_dirs = self.source_dirs if source_dirs is None else source_dirs
+        files_read = 0
+        for source_dir in source_dirs:
+            for path in sorted(
+                glob.glob(os.path.join(source_dir, SOURCE_FILE_PATTERN))
+            ):
+                if _source_name(path) in self.sources:
+                    continue
+                try:
+                    with open(path, newline="", encoding="utf-8") as file:
+                        entries = list(csv.DictReader(file))
+                except (OSError, csv.Error, UnicodeDecodeError) as e:
+                    print(f"Skipping unreadable feedback file {path}: {e}")
+                    continue
+                self.add_batch(entries, path)
+                files_read += 1
+        if self.archive is not None:
+            files_read += self._ingest_s3_archive()
+        return files_read
+
+    def _ingest_s3_archive(self):
+        """Count the files of the S3 archive not counted yet."""
+        try:
+            keys = self.archive.keys()
+        except Exception as e:
+            print(f"Could not list the feedback archive: {e}")
+            return 0
+        files_read = 0
+        for key in keys:
+            if _source_name(key) in self.sources:
+                continue
+            try:
+                entries = self.archive.read(key)
+            except Exception as e:
+                print(f"Skipping unreadable feedback file {key}: {e}")
+                continue
+            self.add_batch(entries, key)
+            files_read += 1
+        return files_read
+
+    def publish(self):
+        """
+        Publish the scores of the current statistics for `whisky_score` and `pair_score`.
+        The version only changes if entries were counted since the last publication.
+
+        Returns:
+        int: Version of the published scores.
+        """
+        with self._lock:
+            if self.entries == self._published_entries and self.version:
+                return self.version
+            whisky_scores = {
+                name: _shrunk_score(counts[2], counts[3])
+                for name, counts in self.whiskies.items()
+                if counts[2]
+            }
+            pair_scores = {}
+            for (selection, name), counts in self.pairs.items():
+                if counts[1]:
+                    pair_scores.setdefault(selection, {})[name] = _shrunk_score(
+                        counts[1], counts[2]
+                    )
+            self._published_entries = self.entries
+        # Readers get the new scores and version at once, without locking
+        self._whisky_scores, self._pair_scores = whisky_scores, pair_scores
+        self.version += 1
+        return self.version
+
+    def refresh(self, force=False):
+        """
+        Count the new archive files, publish the scores and snapshot the statistics, at most
+        once per `publish_interval_seconds`. Never called on a request path.
+
+        Parameters:
+        force (bool): Refresh even if the interval has not elapsed.
+
+        Returns:
+        bool: True if the statistics were refreshed.
+        """
+        now = self._clock()
+        if (
+            not force
+            and self._published_at is not None
+            and now - self._published_at < self.publish_interval_seconds
+        ):
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._published_at = now
+            self.ingest_archive()
+            self.publish()
+            if self.snapshot_path:
+                self.save(self.snapshot_path)
+        finally:
+            self._refresh_lock.release()
+        return True
+
+    def whisky_score(self, name):
+        """
+        Return the published score of a whisky.
+
+        Parameters:
+        name (str): Whisky name.
+
+        Returns:
+        float: Shrunk mean rating mapped to [-1, 1]; 0 without ratings.
+        """
+        return self._whisky_scores.get(normalize_name(name), 0.0)
+
+    def pair_scores(self, selection):
+        """
+        Return the published scores of the recommendations rated for a selection.
+
+        Parameters:
+        selection (iterable of str): Selected whisky names.
+
+        Returns:
+        dict: Normalized name of a recommended whisky -> score in [-1, 1].
+        """
+        return self._pair_scores.get(selection_key(selection), {})
+
+    def stats(self, name):
+        """
+        Return the statistics of a whisky.
+
+        Parameters:
+        name (str): Whisky name.
+
+        Returns:
+        dict: Number of "submissions", of them by users who knew the whisky ("known"), of
+              "ratings", and the "mean_rating" (None without ratings).
+        """
+        with self._lock:
+            submissions, known, ratings, rating_sum = self.whiskies.get(
+                normalize_name(name), [0, 0, 0, 0]
+            )
+        return {
+            "submissions": submissions,
+            "known": known,
+            "ratings": ratings,
+            "mean_rating": rating_sum / ratings if ratings else None,
+        }
+
+    def save(self, path):
+        """
+        Snapshot the statistics and the counted archive files, atomically.
+
+        Parameters:
+        path (str): Snapshot file.
+        """
+        with self._lock:
+            snapshot = {
+                "snapshot_version": SNAPSHOT_VERSION,
+                "entries": self.entries,
+                "sources": sorted(self.sources),
+                "whiskies": self.whiskies,
+                "pairs": [
+                    [list(selection), name, counts]
+                    for (selection, name), counts in self.pairs.items()
+                ],
+            }
+            content = json.dumps(snapshot, separators=(",", ":"))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write(content)
+        os.replace(temporary_path, path)
+
+    def load(self, path):
+        """
+        Replace the statistics with a snapshot.
+
+        Parameters:
+        path (str): Snapshot file written by `save`.
+
+        Raises:
+        ValueError: If the snapshot has an unsupported version.
+        """
+        with open(path) as file:
+            snapshot = json.load(file)
+        if snapshot.get("snapshot_version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported feedback snapshot version in {path}: "
+                f"{snapshot.get('snapshot_version')}"
+            )
+        with self._lock:
+            self.entries = snapshot["entries"]
+            self.sources = set(snapshot["sources"])
+            self.whiskies = snapshot["whiskies"]
+            self.pairs = {
+                (tuple(selection), name): counts
+                for selection, name, counts in snapshot["pairs"]
+            }
+            self._published_entries = -1
+
+    @classmethod
+    def restore(cls, source_dirs=(), snapshot_path=None, **options):
+        """
+        Build an aggregator from its snapshot, if there is a readable one, and the archive
+        files written since (or the whole archive), and publish its scores.
+
+        Parameters:
+        source_dirs (list of str): Local feedback directories.
+        snapshot_path (str): Snapshot file, or None.
+        **options: Other arguments passed to `FeedbackAggregator`.
+
+        Returns:
+        FeedbackAggregator: The restored aggregator.
+        """
+        aggregator = cls(source_dirs, snapshot_path, **options)
+        if snapshot_path and os.path.isfile(snapshot_path):
+            try:
+                aggregator.load(snapshot_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Rebuilding feedback statistics, unreadable snapshot: {e}")
+                aggregator = cls(source_dirs, snapshot_path, **options)
+        aggregator.refresh(force=True)
+        return aggregator
@@ -0,0 +1,366 @@
+"""
+Feedback Compaction Module
+
+This module merges the feedback CSV files, written one per submission (`feedback_<timestamp>.csv`)
+or one per batch (`feedback_batch_*.csv`), into date-partitioned columnar files, and loads them
+back for analysis. Reading a month of compacted feedback opens one file per requested column
+and day instead of one file per submission.
+
+The compacted directory holds a manifest and one directory per day of the feedback timestamps
+(UTC), with one `.npy` array per column:
+
+    manifest.json               schema version, column types, the directory and rows of each
+                                partition and the names of the source files already compacted
+    date=2024-05-01.3/rating.npy
+                                int16 ratings, MISSING_RATING where none was given or the
+                                rating is not an integer from 1 to 5
+    date=2024-05-01.3/timestamp.npy
+                                datetime64[ms] UTC timestamps
+    date=2024-05-01.3/<text column>.npy
+                                fixed-width strings
+    date=unknown.1/...          entries whose timestamp cannot be parsed
+
+Compaction is incremental: source files listed in the manifest are skipped, and only the
+partitions receiving new entries are rewritten. It is also crash-safe: rewritten partitions go
+to new directories, suffixed with the generation of the run, and only the atomic replacement
+of the manifest makes them and their source files current. A run interrupted before that
+leaves the manifest pointing at the previous directories, and the next run discards the
+directories it left behind and compacts the same source files again, without duplicating
+their entries.
+
+Functions:
+    compact_feedback(source_dirs, compacted_dir): Merges new feedback files into the partitions.
+    list_partitions(compacted_dir): Returns the partitions of a compacted directory.
+    load_feedback(compacted_dir, columns, start_date, end_date): Loads selected columns and days.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from scripts.feedback.aggregation import MAX_RATING, MIN_RATING
+from scripts.feedback.feedback_sink import FEEDBACK_FIELDS, SOURCE_FILE_PATTERN
+
+SCHEMA_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+PARTITION_PREFIX = "date="
+UNKNOWN_PARTITION = f"{PARTITION_PREFIX}unknown"
+
+MISSING_RATING = -1
+COLUMN_TYPES = {
+    field: "str" for field in FEEDBACK_FIELDS if field not in ("rating", "timestamp")
+}
+COLUMN_TYPES["rating"] = "int16"
+COLUMN_TYPES["timestamp"] = "datetime64[ms]"
+
+
+def _read_manifest(compacted_dir):
+    path = os.path.join(compacted_dir, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return {
+            "schema_version": SCHEMA_VERSION,
+            "columns": COLUMN_TYPES,
+            "generation": 0,
+            "partitions": {},
+            "sources": [],
+        }
+    with open(path) as file:
+        manifest = json.load(file)
+    if manifest.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(
+            f"Unsupported compacted feedback schema version in {compacted_dir}: "
+            f"{manifest.get('schema_version')}"
+        )
+    return manifest
+
+
+def _write_manifest(compacted_dir, manifest):
+    path = os.path.join(compacted_dir, MANIFEST_FILE)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def _read_source_file(path):
+    """Return the entries of a feedback CSV file, one dict per data row."""
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.DictReader(file))
+
+
+def parse_ratings(values):
+    """
+    Convert rating strings to integers.
+
+    Parameters:
+    values (list of str): Ratings as submitted; empty, "None", non-numeric, non-integer and
+                          out of range values are missing, like in `parse_rating`.
+
+    Returns:
+    np.ndarray: int16 ratings, MISSING_RATING where the rating is missing.
+    """
+    ratings = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(
+        dtype=np.float64
+    )
+    valid = (ratings % 1 == 0) & (ratings >= MIN_RATING) & (ratings <= MAX_RATING)
+    return np.where(valid, ratings, MISSING_RATING).astype(np.int16)
+
+
+def parse_timestamps(values):
+    """
+    Parse ISO 8601 timestamps.
+
+    Parameters:
+    values (list of str): Timestamps as submitted, e.g. "2024-05-01T12:00:00.000Z".
+
+    Returns:
+    np.ndarray: datetime64[ms] UTC timestamps, NaT where the timestamp cannot be parsed.
+    """
+    timestamps = pd.to_datetime(
+        pd.Series(values, dtype=object), utc=True, errors="coerce", format="ISO8601"
+    )
+    return timestamps.dt.tz_localize(None).to_numpy().astype("datetime64[ms]")
+
+
+def _typed_columns(entries):
+    """Convert feedback entries to one typed array per column."""
+    columns = {}
+    for column in COLUMN_TYPES:
+        values = [entry.get(column) or "" for entry in entries]
+        if column == "rating":
+            columns[column] = parse_ratings(values)
+        elif column == "timestamp":
+            columns[column] = parse_timestamps(values)
+        else:
+            columns[column] = np.array(values, dtype=str)
+    return columns
+
+
+def _partition_names(timestamps):
+    """Return the partition of each entry, named after the UTC day of its timestamp."""
+    days = np.datetime_as_string(timestamps.astype("datetime64[D]"))
+    return np.where(
+        np.isnat(timestamps),
+        UNKNOWN_PARTITION,
+        np.char.add(PARTITION_PREFIX, days),
+    )
+
+
+def _partition_dir(compacted_dir, manifest, partition):
+    """Return the directory of a partition listed in a manifest."""
+    directory = manifest["partitions"][partition].get("directory", partition)
+    return os.path.join(compacted_dir, directory)
+
+
+def _load_partition(partition_dir, columns):
+    return {
+        column: np.load(os.path.join(partition_dir, f"{column}.npy"), mmap_mode="r")
+        for column in columns
+    }
+
+
+def _write_partition(partition_dir, columns):
+    """
+    Write the columns of a partition to a temporary directory and move it into place, so
+    that a directory without the temporary suffix is always complete.
+    """
+    temporary_dir = f"{partition_dir}.tmp"
+    shutil.rmtree(temporary_dir, ignore_errors=True)
+    os.makedirs(temporary_dir)
+    for column, values in columns.items():
+        np.save(os.path.join(temporary_dir, f"{column}.npy"), values)
+    shutil.rmtree(partition_dir, ignore_errors=True)
+    os.rename(temporary_dir, partition_dir)
+
+
+def _remove_unlisted_partitions(compacted_dir, manifest):
+    """Remove the partition directories the manifest does not point at."""
+    listed = {
+        details.get("directory", partition)
+        for partition, details in manifest["partitions"].items()
+    }
+    for name in os.listdir(compacted_dir):
+        path = os.path.join(compacted_dir, name)
+        if (
+            name.startswith(PARTITION_PREFIX)
+            and name not in listed
+            and os.path.isdir(path)
+        ):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def compact_feedback(source_dirs, compacted_dir):
+    """
+    Merge the feedback files not compacted yet into the date partitions.
+
+    Parameters:
+    source_dirs (list of str): Directories holding feedback CSV files, e.g. data/feedback/2024_05.
+    compacted_dir (str): Compacted directory, created if needed.
+
+    Returns:
+    dict: Updated manifest.
+    """
+    os.makedirs(compacted_dir, exist_ok=True)
+    manifest = _read_manifest(compacted_dir)
+    compacted_sources = set(manifest["sources"])
+    # Leftovers of an interrupted run, whose source files are compacted again below
+    _remove_unlisted_partitions(compacted_dir, manifest)
+
+    new_sources = []
+    entries = []
+    for source_dir in source_dirs:
+        for path in sorted(glob.glob(os.path.join(source_dir, SOURCE_FILE_PATTERN))):
+            source = os.path.relpath(path, os.path.dirname(os.path.abspath(source_dir)))
+            if source in compacted_sources:
+                continue
+            try:
+                entries.extend(_read_source_file(path))
+            except (OSError, csv.Error, UnicodeDecodeError) as e:
+                print(f"Skipping unreadable feedback file {path}: {e}")
+                continue
+            new_sources.append(source)
+
+    if not new_sources:
+        return manifest
+
+    # Rewritten partitions go to new directories; the current ones stay untouched until the
+    # new manifest replaces the current one
+    generation = manifest.get("generation", 0) + 1
+    new_partitions = dict(manifest["partitions"])
+    new_columns = _typed_columns(entries)
+    partitions = _partition_names(new_columns["timestamp"])
+    for partition in np.unique(partitions):
+        selected = partitions == partition
+        columns = {column: values[selected] for column, values in new_columns.items()}
+
+        if partition in manifest["partitions"]:
+            existing = _load_partition(
+                _partition_dir(compacted_dir, manifest, partition), COLUMN_TYPES
+            )
+            columns = {
+                column: np.concatenate([existing[column], values])
+                for column, values in columns.items()
+            }
+
+        order = np.argsort(columns["timestamp"], kind="stable")
+        directory = f"{partition}.{generation}"
+        _write_partition(
+            os.path.join(compacted_dir, directory),
+            {column: values[order] for column, values in columns.items()},
+        )
+        new_partitions[partition] = {"directory": directory, "rows": len(order)}
+
+    manifest = {
+        **manifest,
+        "generation": generation,
+        "partitions": dict(sorted(new_partitions.items())),
+        "sources": sorted(compacted_sources.union(new_sources)),
+    }
+    _write_manifest(compacted_dir, manifest)
+    _remove_unlisted_partitions(compacted_dir, manifest)
+    print(
+        f"Compacted {len(entries)} feedback entries from {len(new_sources)} files "
+        f"into {len(np.unique(partitions))} partitions"
+    )
+    return manifest
+
+
+def list_partitions(compacted_dir):
+    """
+    Return the partitions of a compacted feedback directory.
+
+    Parameters:
+    compacted_dir (str): Compacted directory.
+
+    Returns:
+    dict: Partition name (e.g. "date=2024-05-01") -> number of rows.
+    """
+    manifest = _read_manifest(compacted_dir)
+    return {
+        partition: details["rows"]
+        for partition, details in manifest["partitions"].items()
+    }
+
+
+def _select_partitions(partitions, start_date, end_date):
+    if start_date is None and end_date is None:
+        return list(partitions)
+    start = str(pd.Timestamp(start_date).date()) if start_date is not None else None
+    end = str(pd.Timestamp(end_date).date()) if end_date is not None else None
+    selected = []
+    for partition in partitions:
+        if partition == UNKNOWN_PARTITION:
+            continue
+        day = partition[len(PARTITION_PREFIX) :]
+        if (start is None or day >= start) and (end is None or day <= end):
+            selected.append(partition)
+    return selected
+
+
+def load_feedback(compacted_dir, columns=None, start_date=None, end_date=None):
+    """
+    Load compacted feedback, reading only the requested columns and days.
+
+    Parameters:
+    compacted_dir (str): Compacted directory.
+    columns (list of str): Columns to load; all of them by default.
+    start_date (str or date): First day to load, inclusive; no lower bound by default.
+    end_date (str or date): Last day to load, inclusive; no upper bound by default. Entries
+                            with an unparseable timestamp are only loaded without date bounds.
+
+    Returns:
+    pd.DataFrame: Feedback entries ordered by day, with the rating as a nullable integer and
+                  the timestamp as a UTC datetime.
+    """
+    columns = list(COLUMN_TYPES) if columns is None else list(columns)
+    unknown_columns = [column for column in columns if column not in COLUMN_TYPES]
+    if unknown_columns:
+        raise ValueError(f"Unknown feedback columns: {unknown_columns}")
+
+    manifest = _read_manifest(compacted_dir)
+    partitions = _select_partitions(manifest["partitions"], start_date, end_date)
+    loaded = [
+        _load_partition(_partition_dir(compacted_dir, manifest, partition), columns)
+        for partition in partitions
+    ]
+
+    data = {}
+    for column in columns:
+        if loaded:
+            values = np.concatenate([partition[column] for partition in loaded])
+        else:
+            values = np.array([], dtype=COLUMN_TYPES[column])
+        if column == "rating":
+            data[column] = pd.arrays.IntegerArray(
+                np.asarray(values, dtype=np.int16), values == MISSING_RATING
+            )
+        elif column == "timestamp":
+            data[column] = pd.to_datetime(values).tz_localize("UTC")
+        else:
+            data[column] = values.astype(str)
+    return pd.DataFrame(data, columns=columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compact feedback CSV files into date-partitioned columnar files."
+    )
+    parser.add_argument(
+        "source_dirs",
+        nargs="+",
+        help="Feedback directories, e.g. data/feedback/2024_05",
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join("data", "feedback", "compacted"),
+        help="Compacted directory",
+    )
+    args = parser.parse_args()
+
+    compact_feedback(args.source_dirs, args.output)
@@ -0,0 +1,334 @@
+"""
+Feedback Sink Module
+
+This module stores user feedback in the background. Requests only put the feedback entry on
+an in-memory queue and return; a worker thread collects the entries into batches, closed when
+they reach `max_batch_size` entries or `max_batch_seconds` after their first entry, and writes
+each batch as one CSV file (a header row and one row per entry) either to a local directory or
+to S3 through a single, reused client. Pending entries are flushed when the process exits.
+
+A failed write is retried with exponential backoff. A batch that still cannot be written is
+spilled to a fallback writer, typically a `LocalFeedbackWriter` on local disk, as an ordinary
+batch file that can be copied to the archive once it is reachable again; only if that fails
+too are its entries lost.
+
+Classes:
+    FeedbackSink: Queue and worker thread batching feedback entries.
+    LocalFeedbackWriter: Writes batches as files in a local directory.
+    S3FeedbackWriter: Writes batches as objects in an S3 bucket.
+
+Functions:
+    serialize_batch(entries, fields): Formats a batch of entries as CSV text.
+"""
+
+import atexit
+import csv
+import io
+import itertools
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from scripts.monitoring.metrics import REGISTRY
+
+REQUIRED_FIELDS = [
+    "whisky1",
+    "whisky2",
+    "whisky3",
+    "recommendedWhisky",
+    "feedback1",
+    "timestamp",
+]
+OPTIONAL_FIELDS = ["rating", "feedback2", "experience"]
+FEEDBACK_FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+# Feedback files, written one per submission (feedback_<timestamp>.csv) or one per batch
+SOURCE_FILE_PATTERN = "feedback_*.csv"
+
+DEFAULT_MAX_BATCH_SIZE = 500
+DEFAULT_MAX_BATCH_SECONDS = 5.0
+DEFAULT_MAX_QUEUE_SIZE = 100000
+DEFAULT_CLOSE_TIMEOUT_SECONDS = 10.0
+DEFAULT_WRITE_ATTEMPTS = 3
+# Wait before the first retry of a failed write, doubled before every further retry
+DEFAULT_RETRY_BACKOFF_SECONDS = 0.5
+
+STAGE_SECONDS_METRIC = "whisky_feedback_stage_seconds"
+# Metric counting the batches per outcome: "written", "spilled" (to the fallback writer) or
+# "failed" (lost)
+BATCHES_METRIC = "whisky_feedback_batches_total"
+
+_STOP = object()
+_batch_numbers = itertools.count()
+
+
+def serialize_batch(entries, fields=FEEDBACK_FIELDS):
+    """
+    Format a batch of feedback entries as CSV text, every value quoted.
+
+    Parameters:
+    entries (list of dict): Feedback entries.
+    fields (list of str): Columns, in order; missing values are written as empty strings.
+
+    Returns:
+    str: CSV text with a header row and one row per entry.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    writer.writerow(fields)
+    writer.writerows([[entry.get(field, "") for field in fields] for entry in entries])
+    return buffer.getvalue()
+
+
+def batch_file_name():
+    """
+    Return a unique name for a batch file: the UTC time, the process id and a sequence number.
+
+    Returns:
+    str: File name such as "feedback_batch_20240501T120000123456_42_0.csv".
+    """
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return f"feedback_batch_{timestamp}_{os.getpid()}_{next(_batch_numbers)}.csv"
+
+
+class LocalFeedbackWriter:
+    """
+    Writes feedback batches as CSV files in a local directory.
+
+    Parameters:
+    directory (str): Destination directory, created if needed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, csv_content):
+        """
+        Write one batch, atomically so that readers never see a partial file.
+
+        Parameters:
+        csv_content (str): Batch formatted by `serialize_batch`.
+
+        Returns:
+        str: Path of the written file.
+        """
+        path = os.path.join(self.directory, batch_file_name())
+        temporary_path = f"{path}.tmp"
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="local_write"):
+            with open(temporary_path, "w", newline="") as file:
+                file.write(csv_content)
+            os.replace(temporary_path, path)
+        return path
+
+
+class S3FeedbackWriter:
+    """
+    Writes feedback batches as CSV objects in an S3 bucket, reusing one client (and its
+    connection pool) for every batch.
+
+    Parameters:
+    bucket (str): Destination bucket.
+    prefix (str): Prefix of the object keys.
+    client (object): S3 client; by default a boto3 client is created on first use.
+    """
+
+    def __init__(self, bucket, prefix="", client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3")
+        return self._client
+
+    def write(self, csv_content):
+        """
+        Upload one batch.
+
+        Parameters:
+        csv_content (str): Batch formatted by `serialize_batch`.
+
+        Returns:
+        str: Key of the uploaded object.
+        """
+        key = f"{self.prefix}{batch_file_name()}"
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="s3_put"):
+            self.client.put_object(
+                Bucket=self.bucket, Key=key, Body=csv_content.encode("utf-8")
+            )
+        return key
+
+
+class FeedbackSink:
+    """
+    Batches feedback entries in a background thread and hands each batch to a writer.
+
+    The worker thread is started on the first submission of each process, so a sink created
+    before gunicorn forks its workers gets one thread per worker.
+
+    Parameters:
+    writer (object): Object with a `write(csv_content)` method, e.g. `LocalFeedbackWriter`.
+    max_batch_size (int): Number of entries that closes a batch.
+    max_batch_seconds (float): Time after its first entry that closes a batch.
+    max_queue_size (int): Number of pending entries beyond which submissions are rejected.
+    on_written (callable): Called in the worker thread with the entries and the location
+                           (returned by the writer) of every batch written, e.g.
+                           `FeedbackAggregator.add_batch`; not called for spilled batches.
+    write_attempts (int): Number of times a batch is handed to the writer before it is
+                          spilled.
+    retry_backoff_seconds (float): Wait before the first retry, doubled for every retry.
+    fallback_writer (object): Writer the batches that could not be written are spilled to,
+                              e.g. a `LocalFeedbackWriter`; None loses them.
+    """
+
+    def __init__(
+        self,
+        writer,
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+        max_batch_seconds=DEFAULT_MAX_BATCH_SECONDS,
+        max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+        on_written=None,
+        write_attempts=DEFAULT_WRITE_ATTEMPTS,
+        retry_backoff_seconds=DEFAULT_RETRY_BACKOFF_SECONDS,
+        fallback_writer=None,
+    ):
+        self.writer = writer
+        self.max_batch_size = max_batch_size
+        self.max_batch_seconds = max_batch_seconds
+        self.max_queue_size = max_queue_size
+        self.on_written = on_written
+        self.write_attempts = max(1, write_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.fallback_writer = fallback_writer
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._queue = None
+
+        self.submitted = 0
+        self.rejected = 0
+        self.written = 0
+        self.spilled = 0
+        self.failed_batches = 0
+
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._thread = threading.Thread(
+                target=self._run, name="feedback-sink", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, entry):
+        """
+        Queue a feedback entry without waiting for it to be written.
+
+        Parameters:
+        entry (dict): Feedback fields.
+
+        Returns:
+        bool: False if the queue is full and the entry was rejected.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _run(self):
+        pending = self._queue
+        stopping = False
+        while not stopping:
+            entry = pending.get()
+            if entry is _STOP:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.max_batch_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="serialization"):
+            csv_content = serialize_batch(batch)
+        for attempt in range(self.write_attempts):
+            if attempt:
+                time.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+            try:
+                location = self.writer.write(csv_content)
+                break
+            except Exception as e:
+                print(
+                    f"Attempt {attempt + 1} of {self.write_attempts} to write a batch of "
+                    f"{len(batch)} feedback entries failed: {e}"
+                )
+        else:
+            self._spill(batch, csv_content)
+            return
+
+        self.written += len(batch)
+        REGISTRY.increment(BATCHES_METRIC, outcome="written")
+        if self.on_written is not None:
+            try:
+                self.on_written(batch, location)
+            except Exception as e:
+                print(f"Failed to process a written batch of feedback entries: {e}")
+
+    def _spill(self, batch, csv_content):
+        """Hand a batch that could not be written to the fallback writer."""
+        if self.fallback_writer is not None:
+            try:
+                location = self.fallback_writer.write(csv_content)
+            except Exception as e:
+                print(f"Failed to spill a batch of {len(batch)} feedback entries: {e}")
+            else:
+                self.spilled += len(batch)
+                REGISTRY.increment(BATCHES_METRIC, outcome="spilled")
+                print(f"Spilled a batch of {len(batch)} feedback entries to {location}")
+                return
+        self.failed_batches += 1
+        REGISTRY.increment(BATCHES_METRIC, outcome="failed")
+        print(f"Lost a batch of {len(batch)} feedback entries")
+
+    def close(self, timeout=DEFAULT_CLOSE_TIMEOUT_SECONDS):
+        """
+        Write the pending entries and stop the worker thread of this process.
+
+        Parameters:
+        timeout (float): Maximum time to wait for the pending entries to be written.
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("Feedback queue still full on shutdown, pending entries are lost")
+            return
+        self._thread.join(timeout)
+        self._thread = None
@@ -0,0 +1,340 @@
+"""
+Approximate Nearest Neighbour Index Module
+
+This module provides an inverted-file (IVF) index over the normalized tasting note features,
+implemented with NumPy only. The catalog is partitioned into clusters with spherical k-means;
+a query only scores the whiskies in the few clusters whose centroids are closest to the user
+profile instead of scanning the whole catalog.
+
+The index is persisted as a `.ivf.npz` file next to the processed features file, and a
+recall-vs-latency report compares the approximate search against the exact scan so that
+`n_lists` / `n_probe` can be chosen for a given catalog size.
+
+Classes:
+    IVFIndex: Inverted-file index returning candidate rows for a profile.
+
+Functions:
+    ann_index_path(whisky_data_file): Returns where the index of a features file is stored.
+    make_synthetic_features(num_rows, num_features, num_styles, seed): Generates a clustered,
+    normalized feature matrix for benchmarking.
+    recall_latency_report(normalized_features, profiles, k, n_probe_values, n_lists): Measures
+    recall@k and latency of the index against the exact scan.
+
+Example usage shown in bottom of script.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+DEFAULT_N_PROBE = 16
+ASSIGNMENT_CHUNK_SIZE = 65536
+TRAINING_ROWS_PER_LIST = 256
+
+
+def ann_index_path(whisky_data_file):
+    """
+    Return the path of the ANN index stored next to a processed features file.
+
+    Parameters:
+    whisky_data_file (str): Path to the processed features file or feature store.
+
+    Returns:
+    str: Path of the `.ivf.npz` index file.
+    """
+    # Next to a feature store directory, not inside it: it is replaced on every rebuild
+    return os.path.splitext(whisky_data_file.rstrip(os.sep))[0] + ".ivf.npz"
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _assign_to_centroids(normalized_features, centroids):
+    """Return the closest centroid of every row, scoring the rows in bounded chunks."""
+    assignments = np.empty(len(normalized_features), dtype=np.int64)
+    for start in range(0, len(normalized_features), ASSIGNMENT_CHUNK_SIZE):
+        chunk = normalized_features[start : start + ASSIGNMENT_CHUNK_SIZE]
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file index over L2-normalized feature rows.
+
+    Rows are grouped by their closest centroid; `list_rows[list_offsets[i]:list_offsets[i+1]]`
+    holds the row numbers of cluster i. The index does not keep a copy of the features: the
+    caller scores the candidate rows against its own matrix.
+
+    Parameters:
+    centroids (np.ndarray): Unit-length cluster centroids, one per row.
+    list_offsets (np.ndarray): Start of each cluster in `list_rows`, plus the total length.
+    list_rows (np.ndarray): Row numbers of the catalog, grouped by cluster.
+    dataset_version (str): Version of the dataset the index was built on, or None if
+                           unknown.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, dataset_version=None):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.dataset_version = dataset_version
+
+    @property
+    def num_lists(self):
+        return len(self.centroids)
+
+    @property
+    def num_rows(self):
+        return len(self.list_rows)
+
+    @classmethod
+    def build(
+        cls, normalized_features, n_lists=None, n_iter=10, seed=0, dataset_version=None
+    ):
+        """
+        Cluster the catalog with spherical k-means and build the inverted lists.
+
+        Large catalogs are clustered on a random sample of `TRAINING_ROWS_PER_LIST` rows per
+        list; every row is then assigned to its closest centroid.
+
+        Parameters:
+        normalized_features (np.ndarray): L2-normalized feature matrix, one row per whisky.
+        n_lists (int): Number of clusters. Defaults to about 4 * sqrt(number of rows).
+        n_iter (int): Number of k-means iterations.
+        seed (int): Seed of the random generator used for sampling and initialization.
+        dataset_version (str): Version of the dataset of the features, saved with the index.
+
+        Returns:
+        IVFIndex: The built index.
+        """
+        num_rows = len(normalized_features)
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(num_rows))
+        n_lists = max(1, min(n_lists, num_rows))
+        rng = np.random.default_rng(seed)
+
+        training_size = min(num_rows, n_lists * TRAINING_ROWS_PER_LIST)
+        training_rows = np.sort(rng.choice(num_rows, size=training_size, replace=False))
+        training_features = np.asarray(normalized_features[training_rows])
+
+        centroids = training_features[
+            rng.choice(training_size, size=n_lists, replace=False)
+        ].copy()
+        for _ in range(n_iter):
+            assignments = _assign_to_centroids(training_features, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, training_features)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            # Re-seed empty clusters with random training rows
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = training_features[rng.choice(training_size, size=len(empty))]
+            centroids = _normalize_rows(sums)
+
+        assignments = _assign_to_centroids(normalized_features, centroids)
+        list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+
+        return cls(
+            centroids.astype(np.float32), list_offsets, list_rows, dataset_version
+        )
+
+    def probe(self, profile, n_probe=DEFAULT_N_PROBE):
+        """
+        Return the candidate rows of the clusters closest to a profile.
+
+        Parameters:
+        profile (np.ndarray): Unit-length user profile.
+        n_probe (int): Number of clusters to scan; at least one is scanned.
+
+        Returns:
+        np.ndarray: Row numbers of the candidate whiskies.
+        """
+        n_probe = max(1, min(n_probe, self.num_lists))
+        centroid_sim = self.centroids @ profile
+        probed = np.argpartition(-centroid_sim, n_probe - 1)[:n_probe]
+        return np.concatenate(
+            [
+                self.list_rows[
+                    self.list_offsets[cluster] : self.list_offsets[cluster + 1]
+                ]
+                for cluster in probed
+            ]
+        )
+
+    def save(self, path):
+        """
+        Save the index, and the version of its dataset, as a NumPy `.npz` archive.
+
+        Parameters:
+        path (str): Destination file.
+        """
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+            dataset_version=np.array(self.dataset_version or ""),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index saved with `save`.
+
+        Parameters:
+        path (str): Index file.
+
+        Returns:
+        IVFIndex: The loaded index; its dataset version is None if it was not saved.
+        """
+        with np.load(path) as archive:
+            dataset_version = (
+                str(archive["dataset_version"])
+                if "dataset_version" in archive.files
+                else ""
+            )
+            return cls(
+                archive["centroids"],
+                archive["list_offsets"],
+                archive["list_rows"],
+                dataset_version or None,
+            )
+
+
+def make_synthetic_features(num_rows, num_features, num_styles=50, seed=0):
+    """
+    Generate a clustered, non-negative feature matrix resembling tasting note scores.
+
+    Each synthetic whisky is a noisy variation of one of `num_styles` style profiles, which
+    mimics the way real whiskies group into smoky, sherried, fruity, ... styles.
+
+    Parameters:
+    num_rows (int): Number of whiskies.
+    num_features (int): Number of tasting notes.
+    num_styles (int): Number of underlying styles.
+    seed (int): Seed of the random generator.
+
+    Returns:
+    np.ndarray: L2-normalized float32 matrix of shape (num_rows, num_features).
+    """
+    rng = np.random.default_rng(seed)
+    styles = rng.gamma(0.5, 2.0, size=(num_styles, num_features)).astype(np.float32)
+    features = styles[rng.integers(num_styles, size=num_rows)]
+    features += rng.gamma(0.5, 1.0, size=(num_rows, num_features)).astype(np.float32)
+    return _normalize_rows(features)
+
+
+def recall_latency_report(
+    normalized_features,
+    profiles,
+    k=10,
+    n_probe_values=(1, 2, 4, 8, 16, 32),
+    n_lists=None,
+):
+    """
+    Measure recall@k and per-query latency of the IVF index against the exact scan.
+
+    Parameters:
+    normalized_features (np.ndarray): L2-normalized feature matrix, one row per whisky.
+    profiles (np.ndarray): Unit-length query profiles, one row per query.
+    k (int): Number of neighbours compared between the exact and approximate results.
+    n_probe_values (tuple of int): Numbers of probed clusters to evaluate.
+    n_lists (int): Number of clusters of the index (defaults to the `IVFIndex.build` default).
+
+    Returns:
+    dict: Catalog size, index build time, exact-scan latency and, for each `n_probe`, the
+          mean recall@k, mean / p95 latency in milliseconds and speed-up over the exact scan.
+    """
+    build_start = time.perf_counter()
+    index = IVFIndex.build(normalized_features, n_lists=n_lists)
+    build_seconds = time.perf_counter() - build_start
+
+    exact_top = []
+    exact_latencies = []
+    for profile in profiles:
+        start = time.perf_counter()
+        cosine_sim = normalized_features @ profile
+        exact_top.append(set(np.argpartition(-cosine_sim, k - 1)[:k].tolist()))
+        exact_latencies.append(time.perf_counter() - start)
+    exact_ms = 1000 * float(np.mean(exact_latencies))
+
+    settings = []
+    for n_probe in n_probe_values:
+        recalls = []
+        latencies = []
+        for profile, expected in zip(profiles, exact_top):
+            start = time.perf_counter()
+            candidates = index.probe(profile, n_probe)
+            cosine_sim = normalized_features[candidates] @ profile
+            top_k = min(k, len(candidates))
+            found = candidates[np.argpartition(-cosine_sim, top_k - 1)[:top_k]]
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(expected.intersection(found.tolist())) / k)
+
+        mean_ms = 1000 * float(np.mean(latencies))
+        settings.append(
+            {
+                "n_probe": n_probe,
+                "recall_at_k": float(np.mean(recalls)),
+                "mean_latency_ms": mean_ms,
+                "p95_latency_ms": 1000 * float(np.percentile(latencies, 95)),
+                "speedup": exact_ms / mean_ms if mean_ms > 0 else float("inf"),
+            }
+        )
+
+    return {
+        "num_rows": len(normalized_features),
+        "num_features": normalized_features.shape[1],
+        "num_lists": index.num_lists,
+        "k": k,
+        "build_seconds": build_seconds,
+        "exact_mean_latency_ms": exact_ms,
+        "settings": settings,
+    }
+
+
+# Example usage:
+#   python ann_index.py --rows 100000 1000000 --features 90 --output ann_report.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recall-vs-latency report of the IVF index on synthetic catalogs."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000])
+    parser.add_argument("--features", type=int, default=90)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Optional JSON output file")
+    args = parser.parse_args()
+
+    reports = []
+    for num_rows in args.rows:
+        features = make_synthetic_features(num_rows, args.features)
+        query_rows = np.random.default_rng(1).choice(num_rows, size=args.queries)
+        report = recall_latency_report(
+            features, features[query_rows], k=args.k, n_lists=args.n_lists
+        )
+        reports.append(report)
+
+        print(
+            f"{report['num_rows']} whiskies, {report['num_lists']} lists, built in "
+            f"{report['build_seconds']:.1f}s, exact scan {report['exact_mean_latency_ms']:.2f} ms"
+        )
+        for setting in report["settings"]:
+            print(
+                f"  n_probe={setting['n_probe']:>3}  recall@{args.k}={setting['recall_at_k']:.3f}  "
+                f"mean={setting['mean_latency_ms']:.2f} ms  p95={setting['p95_latency_ms']:.2f} ms  "
+                f"speedup={setting['speedup']:.1f}x"
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(reports, file, indent=2)
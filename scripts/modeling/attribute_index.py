@@ -0,0 +1,203 @@
+"""
+Attribute Index Module
+
+This module precomputes boolean indexes over the whisky metadata, so that recommendation
+filters (country, region, type, bottler, ABV range, minimum rating and number of ratings,
+post-treatment flags) are answered by combining precomputed masks instead of filtering a
+DataFrame on every request:
+
+    categorical columns   one boolean mask per distinct value, OR-ed across the requested
+                          values
+    numeric columns       row numbers sorted by value, so a range is two binary searches
+    post-treatment flags  one boolean mask per flag column
+
+The masks of the different filters are AND-ed, and the recommender only scores the rows left
+in the result.
+
+Classes:
+    AttributeIndex: Boolean indexes over the metadata of a dataset.
+
+Functions:
+    canonical_filters(filters): Returns a hashable, order-independent form of filters.
+"""
+
+import numpy as np
+
+CATEGORICAL_FILTERS = ("country", "region", "whisky_type", "bottler")
+
+# Filter name -> (numeric column, bound), the bound being inclusive
+RANGE_FILTERS = {
+    "min_abv": ("alcohol_pct", "min"),
+    "max_abv": ("alcohol_pct", "max"),
+    "min_rating": ("whisky_rating", "min"),
+    "min_num_ratings": ("num_ratings", "min"),
+}
+
+POST_TREATMENT_FILTER = "post_treatment"
+
+FILTER_NAMES = CATEGORICAL_FILTERS + tuple(RANGE_FILTERS) + (POST_TREATMENT_FILTER,)
+
+
+def is_post_treatment_column(column):
+    """
+    Check whether a metadata column is a one-hot post-treatment flag, e.g.
+    "Chill filtration - Without".
+
+    Parameters:
+    column (str): Metadata column name.
+
+    Returns:
+    bool: True for post-treatment flag columns.
+    """
+    return " - " in column or "_-_" in column
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def canonical_filters(filters):
+    """
+    Return a hashable form of filters that does not depend on the order of keys or values,
+    used in cache keys.
+
+    Parameters:
+    filters (dict): Filter name -> value or list of values.
+
+    Returns:
+    tuple: Sorted (filter name, sorted values) pairs; empty when there are no filters. Each
+           value is kept with its type, e.g. ("int", "46"), so that values rejected by
+           `AttributeIndex.mask` (such as the string "46" for "min_abv") never share the
+           key of valid ones.
+    """
+    if not filters:
+        return ()
+    if not isinstance(filters, dict):
+        raise ValueError("Invalid filters, a dictionary is expected")
+    return tuple(
+        sorted(
+            (
+                name,
+                tuple(
+                    sorted(
+                        {(type(item).__name__, repr(item)) for item in _as_list(value)}
+                    )
+                ),
+            )
+            for name, value in filters.items()
+        )
+    )
+
+
+class AttributeIndex:
+    """
+    Boolean indexes over the metadata of a dataset.
+
+    Parameters:
+    metadata (dict): Metadata column name -> array with one value per whisky.
+    """
+
+    def __init__(self, metadata):
+        self.num_rows = len(metadata["full_name"])
+
+        self.categorical_masks = {}
+        for column in CATEGORICAL_FILTERS:
+            if column not in metadata:
+                continue
+            values, inverse = np.unique(
+                np.asarray(metadata[column]).astype(str), return_inverse=True
+            )
+            self.categorical_masks[column] = {
+                value: inverse == value_id for value_id, value in enumerate(values)
+            }
+
+        # Rows with a known value, sorted by that value
+        self.sorted_numeric = {}
+        for column, _ in RANGE_FILTERS.values():
+            if column not in metadata or column in self.sorted_numeric:
+                continue
+            values = np.asarray(metadata[column], dtype=np.float64)
+            known_rows = np.flatnonzero(~np.isnan(values))
+            order = known_rows[np.argsort(values[known_rows], kind="stable")]
+            self.sorted_numeric[column] = (order, values[order])
+
+        self.post_treatment_masks = {
+            column: np.asarray(values) == 1
+            for column, values in metadata.items()
+            if is_post_treatment_column(column)
+        }
+
+    def _range_mask(self, filter_name, bound):
+        column, kind = RANGE_FILTERS[filter_name]
+        if column not in self.sorted_numeric:
+            raise ValueError(f"The dataset has no {column} column to filter on")
+        if isinstance(bound, bool) or not isinstance(bound, (int, float)):
+            raise ValueError(f"Invalid filter {filter_name}, a number is expected")
+
+        order, sorted_values = self.sorted_numeric[column]
+        if kind == "min":
+            selected = order[np.searchsorted(sorted_values, bound, side="left") :]
+        else:
+            selected = order[: np.searchsorted(sorted_values, bound, side="right")]
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[selected] = True
+        return mask
+
+    def _categorical_mask(self, column, values):
+        if column not in self.categorical_masks:
+            raise ValueError(f"The dataset has no {column} column to filter on")
+        value_masks = self.categorical_masks[column]
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for value in _as_list(values):
+            if not isinstance(value, str):
+                raise ValueError(f"Invalid filter {column}, strings are expected")
+            if value in value_masks:
+                mask |= value_masks[value]
+        return mask
+
+    def _post_treatment_mask(self, flags):
+        mask = np.ones(self.num_rows, dtype=bool)
+        for flag in _as_list(flags):
+            if flag not in self.post_treatment_masks:
+                raise ValueError(
+                    f"Unknown post-treatment {flag!r}, expected one of "
+                    f"{', '.join(sorted(self.post_treatment_masks))}"
+                )
+            mask &= self.post_treatment_masks[flag]
+        return mask
+
+    def mask(self, filters):
+        """
+        Return the rows matching all the filters.
+
+        Categorical filters accept a value or a list of values (any of which matches);
+        "post_treatment" accepts a flag or a list of flags (all of which must be set).
+
+        Parameters:
+        filters (dict): Filter name -> value, e.g. {"region": ["Islay", "Islands"],
+                        "min_abv": 46, "post_treatment": "Chill filtration - Without"}.
+
+        Returns:
+        np.ndarray: Boolean mask of the eligible rows, or None if there are no filters.
+
+        Raises:
+        ValueError: If a filter is unknown or has an invalid value.
+        """
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise ValueError("Invalid filters, a dictionary is expected")
+
+        mask = np.ones(self.num_rows, dtype=bool)
+        for name, value in filters.items():
+            if name in CATEGORICAL_FILTERS:
+                mask &= self._categorical_mask(name, value)
+            elif name in RANGE_FILTERS:
+                mask &= self._range_mask(name, value)
+            elif name == POST_TREATMENT_FILTER:
+                mask &= self._post_treatment_mask(value)
+            else:
+                raise ValueError(
+                    f"Unknown filter {name!r}, expected one of {', '.join(FILTER_NAMES)}"
+                )
+        return mask
@@ -0,0 +1,244 @@
+"""
+Dataset Snapshot Module
+
+This module swaps the dataset served by the app without restarting it. Datasets are published
+as snapshots under a snapshot root directory (e.g. `data/processed`), and a `CURRENT` pointer
+file in the root names the active snapshot, e.g. `2024_05/feature_store`. Publishing a snapshot
+first loads and validates it, then atomically replaces the pointer file, so workers never see a
+half-written pointer or an invalid dataset.
+
+Each gunicorn worker holds a `SnapshotReloader`. A background thread of the worker checks the
+pointer once per interval and loads and validates the new snapshot into a fresh
+`WhiskyRecommender` before swapping it in, so requests never wait for a check or a load: they
+only read a reference to the current engine when they start, and in-flight requests finish on
+the dataset they started with. Feature store matrices and neighbour tables are memory-mapped,
+so every worker shares the same page-cache pages and memory stays flat as workers are added.
+
+Classes:
+    SnapshotReloader: Holds the current engine and swaps in newly published snapshots.
+
+Functions:
+    is_snapshot_root(path): Checks whether a path is a snapshot root.
+    current_snapshot(snapshot_root): Returns the path of the active snapshot.
+    validate_snapshot(snapshot_path): Loads a snapshot and checks that it can be served.
+    publish_snapshot(snapshot_root, snapshot_name): Validates a snapshot and makes it active.
+"""
+
+import argparse
+import os
+import threading
+
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+
+CURRENT_POINTER_FILE = "CURRENT"
+DEFAULT_CHECK_INTERVAL_SECONDS = 5.0
+
+
+def is_snapshot_root(path):
+    """
+    Check whether a path is a snapshot root, i.e. a directory with a `CURRENT` pointer file.
+
+    Parameters:
+    path (str): Path to check.
+
+    Returns:
+    bool: True if the path holds a pointer file.
+    """
+    return os.path.isfile(os.path.join(path, CURRENT_POINTER_FILE))
+
+
+def current_snapshot(snapshot_root):
+    """
+    Return the path of the active snapshot of a snapshot root.
+
+    Parameters:
+    snapshot_root (str): Snapshot root directory.
+
+    Returns:
+    str: Path of the features CSV or feature store named by the pointer file.
+    """
+    with open(os.path.join(snapshot_root, CURRENT_POINTER_FILE)) as file:
+        snapshot_name = file.read().strip()
+    return os.path.join(snapshot_root, snapshot_name)
+
+
+def validate_snapshot(snapshot_path, **recommender_options):
+    """
+    Load a snapshot and check that it can be served.
+
+    Parameters:
+    snapshot_path (str): Features CSV or feature store to validate.
+    **recommender_options: Arguments passed to `WhiskyRecommender`.
+
+    Returns:
+    WhiskyRecommender: Engine holding the validated snapshot.
+
+    Raises:
+    ValueError: If the snapshot has no whiskies or cannot answer a recommendation.
+    """
+    recommender = WhiskyRecommender(snapshot_path, **recommender_options)
+    if len(recommender) < 2:
+        raise ValueError(f"{snapshot_path} has fewer than two whiskies")
+
+    # A recommendation exercises the features, the name index and the neighbour table
+    recommender.compute_recommendation([recommender.names[0]], k=1)
+    return recommender
+
+
+def publish_snapshot(snapshot_root, snapshot_name):
+    """
+    Validate a snapshot and make it the active snapshot of a snapshot root.
+
+    The pointer file is replaced atomically, and only once the snapshot is valid.
+
+    Parameters:
+    snapshot_root (str): Snapshot root directory.
+    snapshot_name (str): Path of the snapshot relative to the root.
+
+    Returns:
+    str: Path of the published snapshot.
+    """
+    snapshot_path = os.path.join(snapshot_root, snapshot_name)
+    validate_snapshot(snapshot_path, cache_size=0)
+
+    pointer_path = os.path.join(snapshot_root, CURRENT_POINTER_FILE)
+    temporary_path = f"{pointer_path}.tmp"
+    with open(temporary_path, "w") as file:
+        file.write(f"{snapshot_name}\n")
+    os.replace(temporary_path, pointer_path)
+    return snapshot_path
+
+
+class SnapshotReloader:
+    """
+    Holds the engine of the active snapshot and swaps in newly published snapshots.
+
+    When `data_path` is a plain features file or feature store rather than a snapshot root,
+    the engine is loaded once and never reloaded.
+
+    The pointer file is checked by a thread started on the first `current()` call of each
+    process, so a reloader created before gunicorn forks its workers (`--preload`) gets one
+    thread per worker.
+
+    Parameters:
+    data_path (str): Snapshot root, features CSV or feature store.
+    check_interval_seconds (float): Time between two checks of the pointer file.
+    **recommender_options: Arguments passed to `WhiskyRecommender`.
+    """
+
+    def __init__(
+        self,
+        data_path,
+        check_interval_seconds=DEFAULT_CHECK_INTERVAL_SECONDS,
+        **recommender_options,
+    ):
+        self.data_path = data_path
+        self.check_interval_seconds = check_interval_seconds
+        self.recommender_options = recommender_options
+        self._reload_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self.reloads = 0
+        self.failed_reloads = 0
+
+        self.snapshot_path = self._active_snapshot_path()
+        self.recommender = WhiskyRecommender(self.snapshot_path, **recommender_options)
+
+    def _active_snapshot_path(self):
+        if is_snapshot_root(self.data_path):
+            return current_snapshot(self.data_path)
+        return self.data_path
+
+    def current(self):
+        """
+        Return the engine to serve a request with. Never waits: newly published snapshots
+        are loaded in the background.
+
+        Returns:
+        WhiskyRecommender: Engine of the active snapshot.
+        """
+        if self._pid != os.getpid():
+            self._start_watching()
+        return self.recommender
+
+    def _start_watching(self):
+        with self._start_lock:
+            if self._pid == os.getpid() or not is_snapshot_root(self.data_path):
+                return
+            # A lock held by a thread of the parent would never be released in this process
+            self._reload_lock = threading.Lock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._watch, name="snapshot-reloader", daemon=True
+            )
+            self._thread.start()
+
+    def _watch(self):
+        while not self._stopped.wait(self.check_interval_seconds):
+            try:
+                self.maybe_reload()
+            except Exception as e:
+                print(f"Failed to check snapshot pointer in {self.data_path}: {e}")
+
+    def close(self):
+        """
+        Stop checking for new snapshots.
+        """
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+
+    def maybe_reload(self):
+        """
+        Load and swap in the active snapshot if the pointer file changed.
+
+        Only one thread reloads at a time; the other threads keep serving the previous engine
+        meanwhile. A snapshot that fails to load is logged and the previous engine is kept.
+
+        Returns:
+        bool: True if a new engine was swapped in.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            if not is_snapshot_root(self.data_path):
+                return False
+            snapshot_path = current_snapshot(self.data_path)
+            if snapshot_path == self.snapshot_path:
+                return False
+
+            try:
+                recommender = validate_snapshot(
+                    snapshot_path, **self.recommender_options
+                )
+            except Exception as e:
+                self.failed_reloads += 1
+                print(f"Failed to load snapshot {snapshot_path}: {e}")
+                return False
+
+            # Rebinding the attributes is atomic; in-flight requests keep the old engine
+            self.recommender = recommender
+            self.snapshot_path = snapshot_path
+            self.reloads += 1
+            print(f"Loaded snapshot {snapshot_path} ({recommender.dataset_version})")
+            return True
+        finally:
+            self._reload_lock.release()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Validate a dataset snapshot and make it the one served by the app."
+    )
+    parser.add_argument("snapshot_root", help="Snapshot root, e.g. data/processed")
+    parser.add_argument(
+        "snapshot_name",
+        help="Snapshot path relative to the root, e.g. 2024_05/feature_store",
+    )
+    args = parser.parse_args()
+
+    published_path = publish_snapshot(args.snapshot_root, args.snapshot_name)
+    print(f"Published snapshot {published_path}")
@@ -0,0 +1,172 @@
+"""
+Whisky Name Index Module
+
+This module resolves free-text whisky names to the names used in the dataset. Names are
+normalized once at load time (accents removed, case folded, punctuation and repeated spaces
+collapsed), so that "ardbeg  10 ten" or "Ardbeg 10 TEN " resolve to "Ardbeg 10 TEN" with a
+single dictionary lookup. Names that do not resolve get best-match suggestions from an inverted
+index of character trigrams: the candidate names sharing trigrams with the query are counted
+with one `np.bincount` over the index's posting lists, without scanning the catalog.
+
+Classes:
+    NameResolver: Normalized exact map and trigram index over the names of a dataset.
+
+Functions:
+    normalize_name(name): Returns the normalized form of a whisky name.
+    name_trigrams(normalized_name): Returns the character trigrams of a normalized name.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+
+DEFAULT_NUM_SUGGESTIONS = 5
+DEFAULT_MIN_SIMILARITY = 0.3
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(name):
+    """
+    Return the normalized form of a whisky name, used to compare names.
+
+    Parameters:
+    name (str): Whisky name.
+
+    Returns:
+    str: Name without accents, case folded, with runs of punctuation and whitespace
+         replaced by a single space.
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return NON_ALPHANUMERIC.sub(" ", without_accents.casefold()).strip()
+
+
+def name_trigrams(normalized_name):
+    """
+    Return the character trigrams of a normalized name, padded so that short names and word
+    boundaries also produce trigrams.
+
+    Parameters:
+    normalized_name (str): Name returned by `normalize_name`.
+
+    Returns:
+    set of str: Distinct trigrams of the name.
+    """
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class NameResolver:
+    """
+    Resolves free-text whisky names to dataset names and suggests close matches.
+
+    Parameters:
+    names (iterable of str): Whisky names of the dataset; duplicates are allowed.
+    """
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+
+        # Normalized name -> dataset name (the first one in dataset order on collisions)
+        self.exact_index = {}
+        for name in self.names:
+            self.exact_index.setdefault(normalize_name(name), name)
+
+        # Trigram -> ids of the names containing it
+        postings = {}
+        self.num_trigrams = np.empty(len(self.names), dtype=np.int32)
+        for name_id, name in enumerate(self.names):
+            trigrams = name_trigrams(normalize_name(name))
+            self.num_trigrams[name_id] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(name_id)
+        self.trigram_index = {
+            trigram: np.array(name_ids, dtype=np.int32)
+            for trigram, name_ids in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.names)
+
+    def resolve(self, name):
+        """
+        Resolve a whisky name to the dataset name with the same normalized form.
+
+        Parameters:
+        name (str): Whisky name as typed by the user.
+
+        Returns:
+        str: The dataset name, or None if no name matches.
+        """
+        return self.exact_index.get(normalize_name(name))
+
+    def suggest(
+        self,
+        name,
+        num_suggestions=DEFAULT_NUM_SUGGESTIONS,
+        min_similarity=DEFAULT_MIN_SIMILARITY,
+    ):
+        """
+        Suggest the dataset names closest to a whisky name.
+
+        Names are ranked by the Dice coefficient of their trigram sets with the query's.
+
+        Parameters:
+        name (str): Whisky name as typed by the user.
+        num_suggestions (int): Maximum number of suggestions.
+        min_similarity (float): Minimum similarity of a suggestion, between 0 and 1.
+
+        Returns:
+        list of tuple: (dataset name, similarity) pairs, best first.
+        """
+        query_trigrams = name_trigrams(normalize_name(name))
+        posting_lists = [
+            self.trigram_index[trigram]
+            for trigram in query_trigrams
+            if trigram in self.trigram_index
+        ]
+        if not posting_lists or num_suggestions <= 0:
+            return []
+
+        shared = np.bincount(np.concatenate(posting_lists), minlength=len(self.names))
+        similarity = 2 * shared / (len(query_trigrams) + self.num_trigrams)
+        candidates = np.flatnonzero(similarity >= min_similarity)
+        if len(candidates) > num_suggestions:
+            candidates = candidates[
+                np.argpartition(-similarity[candidates], num_suggestions - 1)[
+                    :num_suggestions
+                ]
+            ]
+        candidates = candidates[np.argsort(-similarity[candidates], kind="stable")]
+        return [
+            (self.names[name_id], round(float(similarity[name_id]), 4))
+            for name_id in candidates
+        ]
+
+    def resolve_many(self, names, num_suggestions=DEFAULT_NUM_SUGGESTIONS):
+        """
+        Resolve a batch of whisky names, with suggestions for those that do not resolve.
+
+        Parameters:
+        names (list of str): Whisky names as typed by the user.
+        num_suggestions (int): Maximum number of suggestions per unresolved name.
+
+        Returns:
+        list of dict: For each name, the query, the resolved dataset name (None if it did not
+                      resolve) and the suggestions (empty when it resolved).
+        """
+        results = []
+        for name in names:
+            resolved = self.resolve(name)
+            suggestions = []
+            if resolved is None:
+                suggestions = [
+                    {"Whisky": suggestion, "Similarity": similarity}
+                    for suggestion, similarity in self.suggest(name, num_suggestions)
+                ]
+            results.append(
+                {"query": name, "whisky": resolved, "suggestions": suggestions}
+            )
+        return results
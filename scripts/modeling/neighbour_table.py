@@ -0,0 +1,191 @@
+"""
+Neighbour Table Module
+
+This module precomputes, for every whisky, its most similar whiskies and their cosine
+similarity, and stores them in a compact binary file. The app memory-maps the file, so
+"more like this" requests and single-whisky recommendations become a table lookup, and all
+gunicorn workers share the same page-cache pages instead of each holding a copy.
+
+The similarities are computed in blocks of rows, so the full n x n similarity matrix is never
+held in memory.
+
+File layout (little-endian):
+    header: magic b"WHNT", format version (uint32), number of rows (uint64), neighbours per
+            row (uint32), dataset version (16 ASCII bytes), zero padding up to 64 bytes
+    rows:   int32 matrix (number of rows x neighbours per row), best neighbour first
+    scores: float32 matrix (number of rows x neighbours per row)
+
+Classes:
+    NeighbourTable: Memory-mapped neighbour table.
+
+Functions:
+    neighbour_table_path(whisky_data_file): Returns where the table of a features file is stored.
+    compute_neighbours(normalized_features, top_n, max_block_bytes): Computes the table.
+    write_neighbour_table(path, neighbour_rows, neighbour_scores, dataset_version): Saves it.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from scripts.modeling.sparse_features import score_profiles, to_dense
+
+DEFAULT_TOP_N_NEIGHBOURS = 20
+DEFAULT_MAX_BLOCK_BYTES = 256 * 1024 * 1024
+
+MAGIC = b"WHNT"
+FORMAT_VERSION = 1
+HEADER_FORMAT = "<4sIQI16s"
+HEADER_SIZE = 64
+
+
+def neighbour_table_path(whisky_data_file):
+    """
+    Return the path of the neighbour table stored next to a processed features file.
+
+    Parameters:
+    whisky_data_file (str): Path to the processed features file or feature store.
+
+    Returns:
+    str: Path of the `.neighbours.bin` table file.
+    """
+    # Next to a feature store directory, not inside it: it is replaced on every rebuild
+    return os.path.splitext(whisky_data_file.rstrip(os.sep))[0] + ".neighbours.bin"
+
+
+def compute_neighbours(
+    normalized_features,
+    top_n=DEFAULT_TOP_N_NEIGHBOURS,
+    max_block_bytes=DEFAULT_MAX_BLOCK_BYTES,
+):
+    """
+    Compute the most similar whiskies of every whisky, one block of rows at a time.
+
+    Each block is scored against the whole catalog with one matrix multiplication; the block
+    size is chosen so that the block's similarity matrix stays under `max_block_bytes`.
+
+    Parameters:
+    normalized_features (np.ndarray or CSRMatrix): L2-normalized feature matrix, one row
+                                                   per whisky.
+    top_n (int): Number of neighbours kept per whisky.
+    max_block_bytes (int): Memory budget of one block of similarities.
+
+    Returns:
+    tuple: int32 matrix of neighbour row numbers and float32 matrix of their cosine
+           similarity, one row per whisky, best neighbour first. A whisky is never its own
+           neighbour.
+    """
+    num_rows = len(normalized_features)
+    top_n = max(0, min(top_n, num_rows - 1))
+    block_size = max(1, max_block_bytes // (4 * max(num_rows, 1)))
+
+    neighbour_rows = np.empty((num_rows, top_n), dtype=np.int32)
+    neighbour_scores = np.empty((num_rows, top_n), dtype=np.float32)
+    if top_n == 0:
+        return neighbour_rows, neighbour_scores
+
+    for start in range(0, num_rows, block_size):
+        block = to_dense(normalized_features[start : start + block_size])
+        cosine_sim = score_profiles(normalized_features, block)
+        block_rows = np.arange(len(block))
+        cosine_sim[block_rows, start + block_rows] = -np.inf
+
+        # Partial selection of the best neighbours, then a sort of only those
+        top_rows = np.argpartition(-cosine_sim, top_n - 1, axis=1)[:, :top_n]
+        top_scores = np.take_along_axis(cosine_sim, top_rows, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        neighbour_rows[start : start + len(block)] = np.take_along_axis(
+            top_rows, order, axis=1
+        )
+        neighbour_scores[start : start + len(block)] = np.take_along_axis(
+            top_scores, order, axis=1
+        )
+
+    return neighbour_rows, neighbour_scores
+
+
+def write_neighbour_table(path, neighbour_rows, neighbour_scores, dataset_version):
+    """
+    Write a neighbour table file, atomically replacing any previous version.
+
+    Parameters:
+    path (str): Destination file.
+    neighbour_rows (np.ndarray): Neighbour row numbers, one row per whisky.
+    neighbour_scores (np.ndarray): Cosine similarity of each neighbour.
+    dataset_version (str): Version of the dataset the table was computed on.
+    """
+    num_rows, top_n = neighbour_rows.shape
+    header = struct.pack(
+        HEADER_FORMAT,
+        MAGIC,
+        FORMAT_VERSION,
+        num_rows,
+        top_n,
+        dataset_version.encode("ascii")[:16],
+    )
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        np.ascontiguousarray(neighbour_rows, dtype="<i4").tofile(file)
+        np.ascontiguousarray(neighbour_scores, dtype="<f4").tofile(file)
+    os.replace(temporary_path, path)
+
+
+class NeighbourTable:
+    """
+    Read-only, memory-mapped neighbour table.
+
+    Parameters:
+    path (str): Table file written by `write_neighbour_table`.
+
+    Raises:
+    ValueError: If the file is not a neighbour table of a supported format version.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            header = file.read(struct.calcsize(HEADER_FORMAT))
+        magic, format_version, num_rows, top_n, dataset_version = struct.unpack(
+            HEADER_FORMAT, header
+        )
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} is not a neighbour table in format {FORMAT_VERSION}"
+            )
+
+        self.path = path
+        self.top_n = top_n
+        self.dataset_version = dataset_version.rstrip(b"\0").decode("ascii")
+        if num_rows * top_n == 0:
+            # Empty files cannot be memory-mapped
+            self.rows = np.empty((num_rows, top_n), dtype="<i4")
+            self.scores = np.empty((num_rows, top_n), dtype="<f4")
+            return
+
+        self.rows = np.memmap(
+            path, dtype="<i4", mode="r", offset=HEADER_SIZE, shape=(num_rows, top_n)
+        )
+        self.scores = np.memmap(
+            path,
+            dtype="<f4",
+            mode="r",
+            offset=HEADER_SIZE + 4 * num_rows * top_n,
+            shape=(num_rows, top_n),
+        )
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, row):
+        """
+        Return the precomputed neighbours of a whisky.
+
+        Parameters:
+        row (int): Row number of the whisky.
+
+        Returns:
+        tuple: Neighbour row numbers and their cosine similarity, best first.
+        """
+        return np.asarray(self.rows[row], dtype=np.intp), np.asarray(self.scores[row])
@@ -0,0 +1,70 @@
+"""
+Tasting Note Explanation Module
+
+This module explains recommendations in terms of tasting notes: the notes that score high
+both in the user's profile and in the recommended whisky, and the other notes that stand out
+in the recommended whisky. It works on whole batches of recommendations at once with boolean
+masks and a single argsort over note indices, instead of comparing notes one by one.
+
+Functions:
+    explain_recommendations(recommended_notes, user_profiles, note_names, high_note_threshold,
+    top_n): Returns the common high notes and additional notes of each recommendation.
+"""
+
+import numpy as np
+
+DEFAULT_HIGH_NOTE_THRESHOLD = 8
+DEFAULT_TOP_N_NOTES = 3
+
+
+def explain_recommendations(
+    recommended_notes,
+    user_profiles,
+    note_names,
+    high_note_threshold=DEFAULT_HIGH_NOTE_THRESHOLD,
+    top_n=DEFAULT_TOP_N_NOTES,
+):
+    """
+    Identify the common high tasting notes and the additional tasting notes of a batch of
+    recommendations.
+
+    A note is a common high note when it reaches `high_note_threshold` both in the user's
+    profile (the mean of the selected whiskies) and in the recommended whisky. The remaining
+    notes are additional notes. Both lists are ranked by their score in the recommended
+    whisky, ties keeping the dataset's note order.
+
+    Parameters:
+    recommended_notes (np.ndarray): Raw note scores of the recommended whiskies, one row per
+                                    recommendation (a single vector is also accepted).
+    user_profiles (np.ndarray): Raw mean note scores of the matching user selections.
+    note_names (np.ndarray): Name of each note column.
+    high_note_threshold (float): Minimum score of a high note.
+    top_n (int): Number of notes returned in each list.
+
+    Returns:
+    list of tuple: For each recommendation, the top_n common high notes and the top_n
+                   additional notes, as lists of note names.
+    """
+    recommended_notes = np.atleast_2d(recommended_notes)
+    user_profiles = np.atleast_2d(user_profiles)
+    note_names = np.asarray(note_names)
+
+    common_high = (recommended_notes >= high_note_threshold) & (
+        user_profiles >= high_note_threshold
+    )
+
+    # Note indices ranked by score in the recommended whisky, and the matching masks
+    order = np.argsort(-recommended_notes, axis=1, kind="stable")
+    common_ranked = np.take_along_axis(common_high, order, axis=1)
+
+    # Keep the first top_n notes of each kind by counting them along the ranking
+    keep_common = common_ranked & (np.cumsum(common_ranked, axis=1) <= top_n)
+    keep_additional = ~common_ranked & (np.cumsum(~common_ranked, axis=1) <= top_n)
+
+    return [
+        (
+            note_names[row_order[common]].tolist(),
+            note_names[row_order[additional]].tolist(),
+        )
+        for row_order, common, additional in zip(order, keep_common, keep_additional)
+    ]
@@ -0,0 +1,168 @@
+"""
+Recommendation Cache Module
+
+This module provides a bounded, thread-safe LRU cache with an optional time-to-live for
+recommendation results. Entries are keyed on the canonical form of a whisky selection (the
+de-duplicated, sorted names), the request options and the version of the dataset, so that the
+same selection in a different order is served from the cache and a new dataset never returns
+results computed on the previous one.
+
+Classes:
+    RecommendationCache: LRU/TTL cache with hit, miss, eviction and expiration counters.
+
+Functions:
+    make_cache_key(dataset_version, user_whiskies, **options): Builds the canonical cache key.
+    file_version(path): Returns a content hash identifying a dataset file.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_CACHE_TTL_SECONDS = 3600
+
+
+def make_cache_key(dataset_version, user_whiskies, **options):
+    """
+    Build the cache key of a recommendation request.
+
+    Parameters:
+    dataset_version (str): Version of the dataset the recommendation is computed on.
+    user_whiskies (list of str): List of whiskies selected by the user, in any order.
+    **options: Other arguments changing the result (k, mode, ...).
+
+    Returns:
+    tuple: Hashable key, identical for selections that only differ by order or duplicates.
+    """
+    return (
+        dataset_version,
+        tuple(sorted(set(user_whiskies))),
+        tuple(sorted(options.items())),
+    )
+
+
+def file_version(path, chunk_size=1 << 20):
+    """
+    Return a short content hash of a file, used as the version of a dataset.
+
+    Parameters:
+    path (str): Path of the file.
+    chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+    str: First 16 hexadecimal characters of the SHA-256 of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class RecommendationCache:
+    """
+    Bounded least-recently-used cache whose entries expire after a time-to-live.
+
+    Parameters:
+    max_size (int): Maximum number of entries; 0 disables the cache.
+    ttl_seconds (float): Lifetime of an entry in seconds, or None for no expiry.
+    clock (callable): Function returning the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        max_size=DEFAULT_CACHE_SIZE,
+        ttl_seconds=DEFAULT_CACHE_TTL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the cached value of a key and mark it as recently used.
+
+        Parameters:
+        key (tuple): Cache key built with `make_cache_key`.
+
+        Returns:
+        object: The cached value, or None if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used entries beyond `max_size`.
+
+        Parameters:
+        key (tuple): Cache key built with `make_cache_key`.
+        value (object): Value to cache.
+        """
+        if self.max_size <= 0:
+            return
+
+        expires_at = None
+        if self.ttl_seconds is not None:
+            expires_at = self._clock() + self.ttl_seconds
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry, e.g. because a new dataset was loaded.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        dict: Current size and number of hits, misses, evictions, expirations and
+              invalidations.
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,119 @@
+"""
+Single-Flight Module
+
+This module coalesces concurrent identical computations. When many identical recommendation
+requests arrive at once (e.g. right after a newsletter goes out), they all miss the result
+cache until the first one is computed; instead of each of them computing the same result,
+the first request of a key computes it and the others wait for it and share its result.
+
+A waiting request gives up after a timeout and computes the result itself, so that one slow
+computation never holds its followers longer than the timeout.
+
+Classes:
+    SingleFlight: Runs at most one computation per key at a time.
+"""
+
+import threading
+
+from scripts.monitoring.metrics import REGISTRY
+
+DEFAULT_COALESCE_TIMEOUT_SECONDS = 5.0
+
+# Metric counting the calls per role: "leader" (computed the result), "coalesced" (shared the
+# leader's result) or "timeout" (stopped waiting and computed the result itself)
+COALESCING_METRIC = "whisky_recommendation_coalescing_total"
+
+
+class _Call:
+    """Computation in flight, and the result or exception it ended with."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time, sharing its result with the concurrent
+    callers of the same key.
+
+    Parameters:
+    timeout_seconds (float): Longest time a caller waits for the computation of another
+                             caller before computing the result itself; None waits forever.
+    """
+
+    def __init__(self, timeout_seconds=DEFAULT_COALESCE_TIMEOUT_SECONDS):
+        self.timeout_seconds = timeout_seconds
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, function):
+        """
+        Return the result of a computation, sharing it with concurrent calls of the same key.
+
+        Parameters:
+        key (hashable): Identifies the computation, e.g. a cache key.
+        function (callable): Computes the result; called without arguments.
+
+        Returns:
+        object: Result of `function`, computed by this call or by a concurrent call of the
+                same key. Callers sharing a result must not modify it.
+
+        Raises:
+        Exception: The exception raised by `function`, also for the callers sharing it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            REGISTRY.increment(COALESCING_METRIC, role="leader")
+            try:
+                call.result = function()
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(self.timeout_seconds):
+            with self._lock:
+                self.coalesced -= 1
+                self.timeouts += 1
+            REGISTRY.increment(COALESCING_METRIC, role="timeout")
+            return function()
+
+        REGISTRY.increment(COALESCING_METRIC, role="coalesced")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """
+        Return the coalescing counters.
+
+        Returns:
+        dict: Number of computations in flight, and of calls that computed their result
+              ("leaders"), shared another call's result ("coalesced") or stopped waiting for
+              it ("timeouts").
+        """
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,231 @@
+"""
+Sparse Features Module
+
+This module provides a compressed sparse row (CSR) matrix implemented with NumPy only, used
+for tasting note matrices that are mostly zeros. Once the note vocabulary grows into the
+hundreds, each whisky only scores a small fraction of the notes, and storing the non-zero
+scores only cuts both the memory of the matrix and the cost of cosine scoring, which becomes
+proportional to the number of non-zero scores instead of the catalog size times the number of
+notes.
+
+A CSR matrix stores, for each row, the column numbers (`indices`) and values (`data`) of its
+non-zero entries, the entries of row i being `indptr[i]:indptr[i + 1]`.
+
+Classes:
+    CSRMatrix: Read-only CSR matrix supporting row selection and products with dense arrays.
+
+Functions:
+    is_sparse_enough(features, density_threshold): Chooses between the dense and sparse layouts.
+    to_dense(matrix): Returns a dense array of a dense or sparse matrix.
+    score_profiles(matrix, profiles): Scores several profiles against every row of a matrix.
+"""
+
+import numpy as np
+
+# Matrices with at most this fraction of non-zero entries are stored in CSR format
+DEFAULT_SPARSE_DENSITY_THRESHOLD = 0.25
+DEFAULT_MAX_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+class CSRMatrix:
+    """
+    Read-only compressed sparse row matrix.
+
+    Parameters:
+    indptr (np.ndarray): Offsets of each row's entries, of length number of rows + 1.
+    indices (np.ndarray): Column number of each non-zero entry.
+    data (np.ndarray): Value of each non-zero entry.
+    shape (tuple): Number of rows and columns.
+    """
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = tuple(int(size) for size in shape)
+        self._row_ids = None
+
+    @classmethod
+    def from_dense(cls, dense, dtype=np.float32):
+        """
+        Build a CSR matrix from a dense matrix.
+
+        Parameters:
+        dense (np.ndarray): Dense matrix.
+        dtype (np.dtype): Type of the stored values.
+
+        Returns:
+        CSRMatrix: Matrix holding the non-zero entries of `dense`.
+        """
+        dense = np.asarray(dense, dtype=dtype)
+        rows, columns = np.nonzero(dense)
+        indptr = np.zeros(dense.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=dense.shape[0]), out=indptr[1:])
+        return cls(indptr, columns.astype(np.int32), dense[rows, columns], dense.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def density(self):
+        return self.nnz / max(self.shape[0] * self.shape[1], 1)
+
+    @property
+    def row_ids(self):
+        """Row number of each non-zero entry, computed on first use."""
+        if self._row_ids is None:
+            self._row_ids = np.repeat(
+                np.arange(self.shape[0], dtype=np.intp), np.diff(self.indptr)
+            )
+        return self._row_ids
+
+    def __getitem__(self, rows):
+        """
+        Select rows, given as a slice or an array of row numbers.
+
+        Returns:
+        CSRMatrix: Matrix holding the selected rows, in the requested order.
+        """
+        rows = np.arange(self.shape[0])[rows]
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        # Position of each selected entry in the original arrays
+        entries = np.repeat(starts - indptr[:-1], counts) + np.arange(indptr[-1])
+        return CSRMatrix(
+            indptr,
+            self.indices[entries],
+            self.data[entries],
+            (len(rows), self.shape[1]),
+        )
+
+    def __matmul__(self, other):
+        """
+        Multiply by a dense vector or matrix.
+
+        Parameters:
+        other (np.ndarray): Vector of length number of columns, or matrix with that number
+                            of rows.
+
+        Returns:
+        np.ndarray: Dense product.
+        """
+        other = np.asarray(other)
+        result_type = np.result_type(self.data, other)
+        if other.ndim == 1:
+            products = self.data * other[self.indices]
+            return np.bincount(
+                self.row_ids, weights=products, minlength=self.shape[0]
+            ).astype(result_type)
+
+        result = np.zeros((self.shape[0], other.shape[1]), dtype=result_type)
+        row_bytes = max(other.shape[1] * result.itemsize, 1)
+        max_entries = max(1, DEFAULT_MAX_BLOCK_BYTES // row_bytes)
+
+        # Blocks of rows holding at most max_entries non-zero entries, so that the
+        # entry-by-column products stay within the memory budget
+        start = 0
+        while start < self.shape[0]:
+            stop = np.searchsorted(
+                self.indptr, self.indptr[start] + max_entries, side="right"
+            )
+            stop = min(max(stop - 1, start + 1), self.shape[0])
+            first, last = self.indptr[start], self.indptr[stop]
+            if last > first:
+                products = (
+                    self.data[first:last, np.newaxis] * other[self.indices[first:last]]
+                )
+                offsets = self.indptr[start:stop] - first
+                non_empty = np.diff(self.indptr[start : stop + 1]) > 0
+                result[start:stop][non_empty] = np.add.reduceat(
+                    products, offsets[non_empty], axis=0
+                )
+            start = stop
+        return result
+
+    def toarray(self):
+        """
+        Return the matrix as a dense array.
+
+        Returns:
+        np.ndarray: Dense matrix.
+        """
+        dense = np.zeros(self.shape, dtype=self.dtype)
+        dense[self.row_ids, self.indices] = self.data
+        return dense
+
+    def normalize_rows(self):
+        """
+        Scale each row to unit length, leaving all-zero rows at zero.
+
+        Returns:
+        CSRMatrix: Matrix with L2-normalized rows, sharing the structure of this one.
+        """
+        squared_norms = np.bincount(
+            self.row_ids, weights=self.data.astype(np.float64) ** 2, minlength=len(self)
+        )
+        norms = np.sqrt(squared_norms).astype(self.dtype)
+        return CSRMatrix(
+            self.indptr,
+            self.indices,
+            self.data / norms[self.row_ids],
+            self.shape,
+        )
+
+
+def is_sparse_enough(features, density_threshold=DEFAULT_SPARSE_DENSITY_THRESHOLD):
+    """
+    Check whether a feature matrix is sparse enough to be stored in CSR format.
+
+    Parameters:
+    features (np.ndarray): Dense feature matrix.
+    density_threshold (float): Maximum fraction of non-zero entries, or None to always
+                               keep the dense layout.
+
+    Returns:
+    bool: True if the matrix should be stored in CSR format.
+    """
+    if density_threshold is None or features.size == 0:
+        return False
+    return np.count_nonzero(features) / features.size <= density_threshold
+
+
+def to_dense(matrix):
+    """
+    Return a dense array of a dense or CSR matrix.
+
+    Parameters:
+    matrix (np.ndarray or CSRMatrix): Matrix to convert.
+
+    Returns:
+    np.ndarray: Dense matrix.
+    """
+    if isinstance(matrix, CSRMatrix):
+        return matrix.toarray()
+    return np.asarray(matrix)
+
+
+def score_profiles(matrix, profiles):
+    """
+    Compute the dot product of several profiles with every row of a matrix.
+
+    Parameters:
+    matrix (np.ndarray or CSRMatrix): Feature matrix, one row per whisky.
+    profiles (np.ndarray): Dense profiles, one row per profile.
+
+    Returns:
+    np.ndarray: Scores, one row per profile and one column per whisky.
+    """
+    if isinstance(matrix, CSRMatrix):
+        return (matrix @ profiles.T).T
+    return profiles @ matrix.T
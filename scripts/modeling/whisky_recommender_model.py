@@ -5,98 +5,940 @@ This module provides functionality to recommend whiskies based on user-selected
 and their tasting notes. It uses cosine similarity to find the most similar whisky in the
 dataset to the user's profile and identifies common and additional tasting notes.
 
+The dataset is loaded once into a `WhiskyRecommender` engine, which keeps the tasting note
+features as a row-normalized float32 matrix (in CSR format when it is mostly zeros) together
+with a name-to-row index, so that a recommendation only costs a single matrix-vector product.
+
+Classes:
+    WhiskyRecommender: In-memory recommendation engine built from a features CSV file or
+    feature store.
+
 Functions:
-    recommend_whisky(whisky_data_file, user_whiskies): Recommends a whisky and identifies common
-    and additional tasting notes.
+    select_top_k(cosine_sim, k): Selects the k best scores per row with a partial sort.
+    validate_mode(mode): Checks that a recommendation mode is supported.
+    get_recommender(whisky_data_file): Returns the (cached) engine for a features file.
+    build_ann_index(whisky_data_file, n_lists): Builds and saves the approximate nearest
+    neighbour index used by mode="approx".
+    build_neighbour_table(whisky_data_file, top_n): Precomputes and saves the neighbour table
+    used to answer single-whisky selections.
+    recommend_whisky(whisky_data_file, user_whiskies, k, mode): Recommends the top k whiskies
+    and identifies common and additional tasting notes.
+    recommend_many(whisky_data_file, list_of_whisky_lists, k, mode): Recommends whiskies for
+    many selections, scoring them together with one matrix multiplication per chunk.
 
 Example usage shown in bottom of script.
 """
 
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import copy
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from scripts.modeling.ann_index import DEFAULT_N_PROBE, IVFIndex, ann_index_path
+from scripts.modeling.attribute_index import AttributeIndex, canonical_filters
+from scripts.modeling.name_index import NameResolver, normalize_name
+from scripts.modeling.neighbour_table import (
+    DEFAULT_TOP_N_NEIGHBOURS,
+    NeighbourTable,
+    compute_neighbours,
+    neighbour_table_path,
+    write_neighbour_table,
+)
+from scripts.modeling.note_explanation import (
+    DEFAULT_HIGH_NOTE_THRESHOLD,
+    DEFAULT_TOP_N_NOTES,
+    explain_recommendations,
+)
+from scripts.modeling.recommendation_cache import (
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CACHE_TTL_SECONDS,
+    RecommendationCache,
+    file_version,
+    make_cache_key,
+)
+from scripts.modeling.sparse_features import (
+    DEFAULT_SPARSE_DENSITY_THRESHOLD,
+    CSRMatrix,
+    is_sparse_enough,
+    score_profiles,
+    to_dense,
+)
+from scripts.modeling.single_flight import (
+    DEFAULT_COALESCE_TIMEOUT_SECONDS,
+    SingleFlight,
+)
+from scripts.monitoring.metrics import REGISTRY
+from scripts.processing.feature_store import (
+    NOTE_PREFIX,
+    FeatureStoreSchemaError,
+    is_feature_store,
+    load_feature_store,
+    normalize_rows,
+)
+
+NO_MATCHING_WHISKIES_MESSAGE = "None of the selected whiskies were found in the dataset"
+NO_CANDIDATES_MESSAGE = "No whiskies left to recommend outside the user's selection"
 
-def recommend_whisky(whisky_data_file, user_whiskies):
+# Metrics recorded in the registry of `scripts.monitoring.metrics`
+STAGE_SECONDS_METRIC = "whisky_recommendation_stage_seconds"
+CACHE_LOOKUPS_METRIC = "whisky_recommendation_cache_lookups_total"
+
+# "exact" scans the whole catalog, "approx" only scores the candidates of the ANN index
+RECOMMENDATION_MODES = ("exact", "approx")
+
+# Feedback scores are blended into the ranking of this many best cosine matches
+DEFAULT_FEEDBACK_CANDIDATES = 50
+
+
+def select_top_k(cosine_sim, k):
     """
-    Recommend a whisky based on user-selected whiskies and identify common and additional
-    tasting notes.
+    Select the k highest scores of each row without sorting the whole catalog.
+
+    The candidates are found with `np.argpartition` in O(n) and only those k candidates are
+    sorted. Excluded whiskies are expected to have a score of -inf and are never returned.
 
     Parameters:
-    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes.
-    user_whiskies (list of str): List of whiskies selected by the user.
+    cosine_sim (np.ndarray): Scores, either a vector or a matrix with one row per user.
+    k (int): Number of whiskies to select.
 
     Returns:
-    dict: A dictionary containing the recommended whisky, top three common high tasting notes,
-          and top three additional tasting notes in the recommended whisky.
+    list of tuple: For each row of scores, the row numbers of the selected whiskies and
+                   their scores, ranked from most to least similar.
     """
-    # Load the whisky DataFrame
-    whisky_df = pd.read_csv(whisky_data_file)
+    cosine_sim = np.atleast_2d(cosine_sim)
+    k = min(k, cosine_sim.shape[1])
+    if k == 0:
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=cosine_sim.dtype))
+        return [empty] * len(cosine_sim)
 
-    # Filter the DataFrame to get the data for the user's selected whiskies
-    user_whisky_data = whisky_df[whisky_df["full_name"].isin(user_whiskies)]
+    top_rows = np.argpartition(-cosine_sim, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(cosine_sim, top_rows, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top_rows = np.take_along_axis(top_rows, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
 
-    # Drop any duplicate rows (in case the user selected the same whisky multiple times)
-    user_whisky_data = user_whisky_data.drop_duplicates(subset="full_name")
+    ranked = []
+    for rows, scores in zip(top_rows, top_scores):
+        keep = np.isfinite(scores)
+        ranked.append((rows[keep], scores[keep]))
+    return ranked
 
-    # Extract the tasting note features and scores
-    user_features = user_whisky_data.iloc[:, 18:]
 
-    # Calculate the mean of the user's selected whiskies' feature vectors
-    user_profile = user_features.mean(axis=0)
+class WhiskyRecommender:
+    """
+    Recommendation engine holding the whisky feature dataset in memory.
 
-    # Calculate cosine similarity between the user profile and all whiskies in the dataset
-    cosine_sim = cosine_similarity([user_profile], whisky_df.iloc[:, 18:])
+    The dataset is loaded once on construction, either from the processed features CSV or,
+    much faster, from the binary feature store written by the processing pipeline (see
+    `scripts.processing.feature_store`). Tasting note features are kept both as
+    raw scores (used to explain a recommendation) and as L2-normalized rows (used to score
+    cosine similarity with a single matrix-vector product). When several rows share a
+    `full_name`, the first one is used for the user's profile and all of them are excluded
+    from the recommendation.
+    Selected names are resolved with a `NameResolver` built at load time, so that case,
+    accent or spacing differences do not drop a whisky from the selection. Recommendations
+    can be restricted with filters on the metadata (see `AttributeIndex.mask`), answered from
+    boolean indexes built at load time; only the eligible rows are then scored.
 
-    # Convert cosine similarity results to a DataFrame
-    similarity_df = pd.DataFrame(
-        {"full_name": whisky_df["full_name"], "Cosine_Similarity": cosine_sim[0]}
-    )
+    The approximate nearest neighbour index used by `mode="approx"` is loaded from next to
+    the features file on first use (see `build_ann_index`), or built in memory if it is
+    missing or was built for a different dataset. If a neighbour table was precomputed next
+    to the features file (see `build_neighbour_table`), it is memory-mapped and answers
+    single-whisky selections without any similarity computation.
+
+    Results are cached in an LRU/TTL cache keyed on the canonical selection, the options
+    and the dataset version (a hash of the features file). Loading a new dataset with
+    `load_dataset` clears the cache. Concurrent cache misses for the same resolved selection
+    and options are coalesced: one of them computes the result and the others share it (see
+    `scripts.modeling.single_flight`).
+
+    With a feedback aggregator and a positive `feedback_weight`, the best cosine matches are
+    re-ranked by their cosine similarity plus `feedback_weight` times the mean of their
+    published feedback scores (for the whisky, and for the whisky recommended for this
+    selection, see `scripts.feedback.aggregation`). The scores are read from memory, and
+    their version is part of the cache key (see `ranking_version`).
+
+    Parameters:
+    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes,
+                            or to a feature store directory.
+    expected_feature_names (list of str): Tasting note features to load, in this order.
+                                          Defaults to all the features of the dataset.
+    ann_n_probe (int): Number of index clusters scanned per approximate query.
+    cache_size (int): Maximum number of cached results; 0 disables the cache.
+    cache_ttl_seconds (float): Lifetime of a cached result, or None for no expiry.
+    coalesce_timeout_seconds (float): Longest time a request waits for an identical request
+                                      in flight before computing its result itself.
+    feedback (FeedbackAggregator): Source of the published feedback scores, or None.
+    feedback_weight (float): Weight of the feedback scores in the ranking; 0 ignores them.
+    feedback_candidates (int): Number of best cosine matches re-ranked with the feedback
+                               scores (at least k).
+    high_note_threshold (float): Minimum score of a common high tasting note.
+    top_n_notes (int): Number of common and additional tasting notes returned.
+    sparse_density_threshold (float): Features read from a CSV file with at most this
+                                      fraction of non-zero scores are kept in CSR format
+                                      (see `scripts.modeling.sparse_features`); None keeps
+                                      them dense. Feature stores keep the format they were
+                                      written in.
+    """
+
+    def __init__(
+        self,
+        whisky_data_file,
+        expected_feature_names=None,
+        ann_n_probe=DEFAULT_N_PROBE,
+        cache_size=DEFAULT_CACHE_SIZE,
+        cache_ttl_seconds=DEFAULT_CACHE_TTL_SECONDS,
+        coalesce_timeout_seconds=DEFAULT_COALESCE_TIMEOUT_SECONDS,
+        feedback=None,
+        feedback_weight=0.0,
+        feedback_candidates=DEFAULT_FEEDBACK_CANDIDATES,
+        high_note_threshold=DEFAULT_HIGH_NOTE_THRESHOLD,
+        top_n_notes=DEFAULT_TOP_N_NOTES,
+        sparse_density_threshold=DEFAULT_SPARSE_DENSITY_THRESHOLD,
+    ):
+        self.expected_feature_names = expected_feature_names
+        self.sparse_density_threshold = sparse_density_threshold
+        self.ann_n_probe = ann_n_probe
+        self.high_note_threshold = high_note_threshold
+        self.top_n_notes = top_n_notes
+        self.cache = RecommendationCache(cache_size, cache_ttl_seconds)
+        self.single_flight = SingleFlight(coalesce_timeout_seconds)
+        self.feedback = feedback
+        self.feedback_weight = feedback_weight
+        self.feedback_candidates = feedback_candidates
+        self.dataset_version = None
+        self.load_dataset(whisky_data_file)
+
+    def load_dataset(self, whisky_data_file):
+        """
+        Load a features file or feature store, replacing the current dataset.
+
+        Tasting note features are selected by name: the columns starting with "Note_" of
+        a CSV file, or the features listed in a feature store's manifest. Every other column
+        is kept as metadata. Cached results are dropped when the content of the dataset
+        changed.
+
+        Parameters:
+        whisky_data_file (str): Path to the CSV file containing whisky data with tasting
+                                notes, or to a feature store directory.
+
+        Raises:
+        FeatureStoreSchemaError: If the dataset does not have the expected features, or
+                                 has no "full_name" column.
+        """
+        if is_feature_store(whisky_data_file):
+            store = load_feature_store(
+                whisky_data_file, feature_names=self.expected_feature_names
+            )
+            dataset_version = store.dataset_version
+            feature_names = store.feature_names
+            features = store.features
+            normalized_features = store.normalized_features
+            metadata = store.metadata
+        else:
+            # Only CSV datasets need pandas; serving a feature store only needs NumPy
+            import pandas as pd
+
+            whisky_df = pd.read_csv(whisky_data_file)
+            dataset_version = file_version(whisky_data_file)
+            feature_names = self.expected_feature_names or [
+                column for column in whisky_df.columns if column.startswith(NOTE_PREFIX)
+            ]
+            missing = [name for name in feature_names if name not in whisky_df.columns]
+            if not feature_names or missing:
+                raise FeatureStoreSchemaError(
+                    f"{whisky_data_file} is missing tasting note features "
+                    f"{', '.join(missing)}"
+                )
+            feature_names = np.array(feature_names, dtype=object)
+            features = whisky_df[feature_names].to_numpy(dtype=np.float32)
+
+            # Normalize each row once so that cosine similarity becomes a dot product.
+            # All-zero rows stay zero, which gives them a similarity of 0 like sklearn.
+            if is_sparse_enough(features, self.sparse_density_threshold):
+                features = CSRMatrix.from_dense(features)
+                normalized_features = features.normalize_rows()
+            else:
+                normalized_features = normalize_rows(features)
+            metadata = {
+                column: whisky_df[column].to_numpy()
+                for column in whisky_df.columns
+                if column not in feature_names
+            }
+
+        if "full_name" not in metadata:
+            raise FeatureStoreSchemaError(f"{whisky_data_file} has no full_name column")
+
+        self.whisky_data_file = whisky_data_file
+        self.names = metadata["full_name"].astype(object)
+        self.feature_names = feature_names
+        self.features = features
+        self.normalized_features = normalized_features
+        self.metadata = metadata
+
+        # Map each whisky name to all of its row numbers (in dataset order)
+        name_rows = {}
+        for row, name in enumerate(self.names):
+            name_rows.setdefault(name, []).append(row)
+        self.name_index = {
+            name: np.array(rows, dtype=np.intp) for name, rows in name_rows.items()
+        }
+        self.name_resolver = NameResolver(self.name_index)
+        self.attribute_index = AttributeIndex(metadata)
+
+        self.ann_index = None
+        if dataset_version != self.dataset_version:
+            if self.dataset_version is not None:
+                self.cache.clear()
+            self.dataset_version = dataset_version
+        self.neighbour_table = self.load_neighbour_table()
+
+    def load_neighbour_table(self):
+        """
+        Memory-map the precomputed neighbour table of the dataset, if there is one.
+
+        Returns:
+        NeighbourTable: The table, or None if it is missing or was built for another
+                        version of the dataset.
+        """
+        table_path = neighbour_table_path(self.whisky_data_file)
+        if not os.path.exists(table_path):
+            return None
+        table = NeighbourTable(table_path)
+        if table.dataset_version != self.dataset_version or len(table) != len(self):
+            print(
+                f"Ignoring neighbour table {table_path} built for a different dataset"
+            )
+            return None
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def blends_feedback(self):
+        return self.feedback is not None and self.feedback_weight > 0
+
+    @property
+    def ranking_version(self):
+        """
+        Version of everything the ranking depends on: the dataset, and the published
+        feedback scores when they are blended in.
+        """
+        if not self.blends_feedback:
+            return self.dataset_version
+        return f"{self.dataset_version}+feedback.{self.feedback.version}"
+
+    def candidate_count(self, k):
+        """Return the number of whiskies to rank before blending in the feedback scores."""
+        return max(k, self.feedback_candidates) if self.blends_feedback else k
+
+    def blend_feedback(self, user_whiskies, ranked_rows, ranked_scores, k):
+        """
+        Re-rank cosine matches by their cosine similarity plus the weighted feedback scores.
+
+        Parameters:
+        user_whiskies (list of str): List of whiskies selected by the user.
+        ranked_rows (np.ndarray): Row numbers of the best cosine matches.
+        ranked_scores (np.ndarray): Their cosine similarity.
+        k (int): Number of whiskies to keep.
+
+        Returns:
+        tuple: Row numbers of the k best whiskies, best first, and their cosine similarity.
+        """
+        if not self.blends_feedback:
+            return ranked_rows[:k], ranked_scores[:k]
+        pair_scores = self.feedback.pair_scores(self.canonical_selection(user_whiskies))
+        feedback_scores = np.array(
+            [
+                (
+                    self.feedback.whisky_score(name)
+                    + pair_scores.get(normalize_name(name), 0.0)
+                )
+                / 2
+                for name in self.names[ranked_rows]
+            ],
+            dtype=np.float64,
+        )
+        blended = ranked_scores + self.feedback_weight * feedback_scores
+        order = np.argsort(-blended, kind="stable")[:k]
+        return ranked_rows[order], ranked_scores[order]
+
+    def resolve_names(self, user_whiskies):
+        """
+        Map whisky names to the names used in the dataset.
+
+        Parameters:
+        user_whiskies (list of str): List of whiskies selected by the user.
+
+        Returns:
+        list of str: Dataset names of the selected whiskies found in the dataset, each once,
+                     in the order of the selection.
+        """
+        resolved_names = [
+            name if name in self.name_index else self.name_resolver.resolve(name)
+            for name in dict.fromkeys(user_whiskies)
+        ]
+        return [name for name in dict.fromkeys(resolved_names) if name is not None]
+
+    def canonical_selection(self, user_whiskies):
+        """
+        Return the canonical form of a selection: the sorted dataset names it resolves to.
+        Selections with the same canonical form get the same recommendations.
+
+        Parameters:
+        user_whiskies (list of str): List of whiskies selected by the user.
+
+        Returns:
+        tuple of str: Sorted dataset names of the selected whiskies found in the dataset.
+        """
+        return tuple(sorted(self.resolve_names(user_whiskies)))
+
+    def lookup_rows(self, user_whiskies):
+        """
+        Map whisky names to their row numbers in the dataset.
+
+        Names are resolved with the name index, so differences in case, accents, punctuation
+        or spacing do not make a selection miss.
+
+        Parameters:
+        user_whiskies (list of str): List of whiskies selected by the user.
+
+        Returns:
+        tuple: Sorted row numbers of the first occurrence of each selected whisky found in
+               the dataset, and row numbers of every occurrence of the selected whiskies.
+        """
+        matches = [self.name_index[name] for name in self.resolve_names(user_whiskies)]
+        if not matches:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        profile_rows = np.sort([rows[0] for rows in matches])
+        return profile_rows, np.concatenate(matches)
+
+    def build_profiles(self, profile_rows_list):
+        """
+        Build the taste profiles of several selections at once.
+
+        Parameters:
+        profile_rows_list (list of np.ndarray): Profile row numbers of each selection, as
+                                                returned by `lookup_rows`. Must not be empty.
+
+        Returns:
+        tuple: Matrix with the mean feature vector of each selection, and the same matrix
+               with L2-normalized rows (used for cosine similarity).
+        """
+        counts = np.array([len(rows) for rows in profile_rows_list])
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        all_rows = np.concatenate(profile_rows_list)
+
+        # Mean of each selection's feature vectors, computed with one segmented sum
+        profiles = np.add.reduceat(to_dense(self.features[all_rows]), offsets, axis=0)
+        profiles /= counts[:, np.newaxis]
+
+        return profiles, normalize_rows(profiles)
+
+    def get_ann_index(self):
+        """
+        Return the approximate nearest neighbour index, loading or building it on first use.
+        A saved index built for another version of the dataset is ignored and rebuilt.
+
+        Returns:
+        IVFIndex: Index over the normalized features of this dataset.
+        """
+        if self.ann_index is None:
+            index_path = ann_index_path(self.whisky_data_file)
+            index = IVFIndex.load(index_path) if os.path.exists(index_path) else None
+            if index is not None and (
+                index.dataset_version != self.dataset_version
+                or index.num_rows != len(self)
+            ):
+                print(f"Ignoring ANN index {index_path} built for a different dataset")
+                index = None
+            if index is None:
+                index = IVFIndex.build(
+                    to_dense(self.normalized_features),
+                    dataset_version=self.dataset_version,
+                )
+            self.ann_index = index
+        return self.ann_index
+
+    def rank_from_neighbour_table(self, user_row, excluded_rows, k):
+        """
+        Rank the recommendations of a single-whisky selection with the neighbour table.
+
+        Parameters:
+        user_row (int): Row number of the selected whisky.
+        excluded_rows (np.ndarray): Row numbers that must not be recommended.
+        k (int): Number of whiskies to select.
+
+        Returns:
+        tuple: Row numbers of the selected whiskies and their scores, best first, or None
+               if there is no table or it does not hold enough neighbours.
+        """
+        if self.neighbour_table is None:
+            return None
+        neighbour_rows, neighbour_scores = self.neighbour_table.lookup(user_row)
+        keep = ~np.isin(neighbour_rows, excluded_rows)
+        neighbour_rows, neighbour_scores = neighbour_rows[keep], neighbour_scores[keep]
+
+        # A truncated table may miss neighbours beyond its last entry
+        table_is_complete = self.neighbour_table.top_n >= len(self) - 1
+        if len(neighbour_rows) < k and not table_is_complete:
+            return None
+        return neighbour_rows[:k], neighbour_scores[:k]
+
+    def rank_approximate(self, user_profile, excluded_rows, k, eligible=None):
+        """
+        Rank the candidates returned by the ANN index for a profile.
+
+        Parameters:
+        user_profile (np.ndarray): Unit-length user profile.
+        excluded_rows (np.ndarray): Row numbers that must not be recommended.
+        k (int): Number of whiskies to select.
+        eligible (np.ndarray): Boolean mask of the rows allowed by the filters, or None.
+
+        Returns:
+        tuple: Row numbers of the selected whiskies and their scores, best first.
+        """
+        candidate_rows = self.get_ann_index().probe(user_profile, self.ann_n_probe)
+        if eligible is not None:
+            candidate_rows = candidate_rows[eligible[candidate_rows]]
+        cosine_sim = self.normalized_features[candidate_rows] @ user_profile
+        cosine_sim[np.isin(candidate_rows, excluded_rows)] = -np.inf
+        ranked_rows, ranked_scores = select_top_k(cosine_sim, k)[0]
+        return candidate_rows[ranked_rows], ranked_scores
+
+    def rank_eligible(self, user_profile, excluded_rows, k, eligible):
+        """
+        Rank all the whiskies allowed by the filters for a profile.
+
+        Parameters:
+        user_profile (np.ndarray): Unit-length user profile.
+        excluded_rows (np.ndarray): Row numbers that must not be recommended.
+        k (int): Number of whiskies to select.
+        eligible (np.ndarray): Boolean mask of the rows allowed by the filters; not modified.
+
+        Returns:
+        tuple: Row numbers of the selected whiskies and their scores, best first.
+        """
+        eligible = eligible.copy()
+        eligible[excluded_rows] = False
+        candidate_rows = np.flatnonzero(eligible)
+        cosine_sim = self.normalized_features[candidate_rows] @ user_profile
+        ranked_rows, ranked_scores = select_top_k(cosine_sim, k)[0]
+        return candidate_rows[ranked_rows], ranked_scores
+
+    def recommend(self, user_whiskies, k=1, mode="exact", filters=None):
+        """
+        Recommend whiskies based on user-selected whiskies and identify common and additional
+        tasting notes of the best match, using the result cache when possible.
+
+        Parameters:
+        user_whiskies (list of str): List of whiskies selected by the user.
+        k (int): Number of ranked recommendations to return.
+        mode (str): "exact" or "approx", see `compute_recommendation`.
+        filters (dict): Restrictions on the recommended whiskies, see `AttributeIndex.mask`.
+
+        Returns:
+        dict: The result of `compute_recommendation`.
+        """
+        validate_mode(mode)
+        options = {"k": k, "mode": mode, "filters": canonical_filters(filters)}
+        ranking_version = self.ranking_version
+        key = make_cache_key(ranking_version, user_whiskies, **options)
+        result = self.cache.get(key)
+        REGISTRY.increment(
+            CACHE_LOOKUPS_METRIC, result="miss" if result is None else "hit"
+        )
+        if result is None:
+
+            def compute():
+                computed = self.compute_recommendation(
+                    user_whiskies, k=k, mode=mode, filters=filters
+                )
+                # Cached before the call leaves the in-flight table, so that no request
+                # arriving in between computes it again
+                self.cache.put(key, computed)
+                return computed
+
+            # Identical requests in flight share one computation. They are matched on the
+            # resolved selection, so that spelling variants of the same names coalesce too.
+            flight_key = make_cache_key(
+                ranking_version, self.canonical_selection(user_whiskies), **options
+            )
+            result = self.single_flight.do(flight_key, compute)
+
+        # Callers get their own copy so that cached results cannot be modified
+        return copy.deepcopy(result)
 
-    # Sort whiskies by similarity in descending order
-    similarity_df = similarity_df.sort_values(by="Cosine_Similarity", ascending=False)
+    def compute_recommendation(self, user_whiskies, k=1, mode="exact", filters=None):
+        """
+        Recommend whiskies based on user-selected whiskies and identify common and additional
+        tasting notes of the best match.
 
-    # Recommend the top whisky (excluding the user's selections)
-    recommended_whisky = similarity_df[
-        ~similarity_df["full_name"].isin(user_whiskies)
-    ].iloc[0]["full_name"]
+        Parameters:
+        user_whiskies (list of str): List of whiskies selected by the user.
+        k (int): Number of ranked recommendations to return.
+        mode (str): "exact" to scan the whole catalog, "approx" to only score the
+                    candidates of the approximate nearest neighbour index.
+        filters (dict): Restrictions on the recommended whiskies, see `AttributeIndex.mask`.
+                        Only the eligible whiskies are scored.
 
-    # Extract tasting notes for the recommended whisky
-    recommended_whisky_notes = whisky_df.loc[
-        whisky_df["full_name"] == recommended_whisky, user_features.columns
-    ].values[0]
+        Returns:
+        dict: A dictionary containing the recommended whisky, top three common high tasting
+              notes, top three additional tasting notes in the recommended whisky, and the
+              top k recommendations with their cosine similarity.
 
-    # Extract tasting notes for the user's selected whiskies
-    user_selected_notes = user_features.values[0]
+        Raises:
+        ValueError: If the mode or a filter is invalid, if none of the selected whiskies
+                    are in the dataset, or if there is nothing left to recommend.
+        """
+        validate_mode(mode)
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="filtering"):
+            eligible = self.attribute_index.mask(filters)
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="name_lookup"):
+            user_rows, excluded_rows = self.lookup_rows(user_whiskies)
+        if len(user_rows) == 0:
+            raise ValueError(NO_MATCHING_WHISKIES_MESSAGE)
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="profile_build"):
+            user_profiles, normalized_profiles = self.build_profiles([user_rows])
+            user_profile = normalized_profiles[0]
 
-    # Find the common high tasting notes between the recommended whisky and user-selected whiskies
-    common_high_notes = []
-    for idx, (recommended_note, user_note) in enumerate(
-        zip(recommended_whisky_notes, user_selected_notes)
+        # Blending in the feedback scores re-ranks a larger pool of the best cosine matches
+        num_ranked = self.candidate_count(k)
+
+        # Single-whisky selections are a lookup in the precomputed neighbour table, which
+        # only holds the unfiltered neighbours
+        ranked = None
+        if len(user_rows) == 1 and eligible is None:
+            with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="neighbour_lookup"):
+                ranked = self.rank_from_neighbour_table(
+                    user_rows[0], excluded_rows, num_ranked
+                )
+
+        if ranked is None and mode == "approx":
+            with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="ann_search"):
+                ranked = self.rank_approximate(
+                    user_profile, excluded_rows, num_ranked, eligible
+                )
+            # Heavily filtered queries may leave too few candidates in the probed clusters
+            if eligible is not None and len(ranked[0]) < k:
+                ranked = None
+
+        if ranked is not None:
+            ranked_rows, ranked_scores = ranked
+        elif eligible is None:
+            # Cosine similarity between the user profile and all whiskies in the dataset
+            with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="similarity"):
+                cosine_sim = self.normalized_features @ user_profile
+
+            # Recommend the top whiskies (excluding the user's selections)
+            with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="ranking"):
+                cosine_sim[excluded_rows] = -np.inf
+                ranked_rows, ranked_scores = select_top_k(cosine_sim, num_ranked)[0]
+        else:
+            # Only score the eligible whiskies that the user did not select
+            with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="similarity"):
+                eligible[excluded_rows] = False
+                candidate_rows = np.flatnonzero(eligible)
+                cosine_sim = self.normalized_features[candidate_rows] @ user_profile
+            with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="ranking"):
+                ranked_rows, ranked_scores = select_top_k(cosine_sim, num_ranked)[0]
+                ranked_rows = candidate_rows[ranked_rows]
+
+        if len(ranked_rows) == 0:
+            raise ValueError(NO_CANDIDATES_MESSAGE)
+        ranked_rows, ranked_scores = self.blend_feedback(
+            user_whiskies, ranked_rows, ranked_scores, k
+        )
+
+        with REGISTRY.timer(STAGE_SECONDS_METRIC, stage="explanation"):
+            return self.describe_recommendations(
+                [(ranked_rows, ranked_scores)], user_profiles
+            )[0]
+
+    def recommend_many(
+        self, list_of_whisky_lists, k=1, mode="exact", chunk_size=1024, filters=None
     ):
-        if recommended_note >= 8 and user_note >= 8:
-            common_high_notes.append(user_features.columns[idx])
+        """
+        Recommend a whisky for each of many user selections.
+
+        The profiles of up to `chunk_size` selections are stacked into one matrix and scored
+        against the whole dataset (or only the whiskies allowed by the filters) with a single
+        matrix multiplication, which keeps the similarity matrix held in memory at
+        `chunk_size` x catalog size.
+
+        Parameters:
+        list_of_whisky_lists (list of list of str): Whisky selections, one list per user.
+        k (int): Number of ranked recommendations to return per selection.
+        mode (str): "exact" or "approx", see `recommend`.
+        chunk_size (int): Number of selections scored per matrix multiplication.
+        filters (dict): Restrictions applied to every selection, see `AttributeIndex.mask`.
+
+        Returns:
+        list of dict: One result per selection, in input order, in the format returned by
+                      `recommend`. Selections without any known whisky, or with nothing left
+                      to recommend, get a dictionary with an "error" message instead.
+        """
+        validate_mode(mode)
+        num_ranked = self.candidate_count(k)
+        eligible = self.attribute_index.mask(filters)
+        if eligible is None:
+            candidate_rows = None
+            candidate_features = self.normalized_features
+        else:
+            # Column of each eligible row in the filtered similarity matrix, -1 if filtered out
+            candidate_rows = np.flatnonzero(eligible)
+            candidate_features = self.normalized_features[candidate_rows]
+            candidate_columns = np.full(len(self), -1, dtype=np.intp)
+            candidate_columns[candidate_rows] = np.arange(len(candidate_rows))
+
+        results = [None] * len(list_of_whisky_lists)
+        lookups = [
+            self.lookup_rows(user_whiskies) for user_whiskies in list_of_whisky_lists
+        ]
+
+        valid_positions = []
+        for position, (user_rows, _) in enumerate(lookups):
+            if len(user_rows) == 0:
+                results[position] = {"error": NO_MATCHING_WHISKIES_MESSAGE}
+            else:
+                valid_positions.append(position)
+
+        for start in range(0, len(valid_positions), chunk_size):
+            batch = valid_positions[start : start + chunk_size]
+            user_profiles, profiles = self.build_profiles(
+                [lookups[position][0] for position in batch]
+            )
+            excluded = [lookups[position][1] for position in batch]
+
+            if mode == "approx":
+                ranked = []
+                for profile, excluded_rows in zip(profiles, excluded):
+                    ranked_rows, ranked_scores = self.rank_approximate(
+                        profile, excluded_rows, num_ranked, eligible
+                    )
+                    # Heavily filtered queries may leave too few candidates in the
+                    # probed clusters, like in `compute_recommendation`
+                    if eligible is not None and len(ranked_rows) < k:
+                        ranked_rows, ranked_scores = self.rank_eligible(
+                            profile, excluded_rows, num_ranked, eligible
+                        )
+                    ranked.append((ranked_rows, ranked_scores))
+            else:
+                # One GEMM for the whole chunk: (chunk x notes) @ (notes x catalog)
+                cosine_sim = score_profiles(candidate_features, profiles)
+
+                # Exclude every user's own selections
+                batch_rows = np.repeat(
+                    np.arange(len(batch)), [len(rows) for rows in excluded]
+                )
+                excluded_columns = np.concatenate(excluded)
+                if candidate_rows is not None:
+                    excluded_columns = candidate_columns[excluded_columns]
+                    scored = excluded_columns >= 0
+                    batch_rows = batch_rows[scored]
+                    excluded_columns = excluded_columns[scored]
+                cosine_sim[batch_rows, excluded_columns] = -np.inf
+                ranked = select_top_k(cosine_sim, num_ranked)
+                if candidate_rows is not None:
+                    ranked = [
+                        (candidate_rows[ranked_rows], ranked_scores)
+                        for ranked_rows, ranked_scores in ranked
+                    ]
+
+            ranked = [
+                self.blend_feedback(
+                    list_of_whisky_lists[position], ranked_rows, ranked_scores, k
+                )
+                for position, (ranked_rows, ranked_scores) in zip(batch, ranked)
+            ]
+
+            # Explain all the recommendations of the chunk at once
+            served = [
+                batch_row
+                for batch_row, (ranked_rows, _) in enumerate(ranked)
+                if len(ranked_rows) > 0
+            ]
+            for batch_row, position in enumerate(batch):
+                results[position] = {"error": NO_CANDIDATES_MESSAGE}
+            if served:
+                described = self.describe_recommendations(
+                    [ranked[batch_row] for batch_row in served], user_profiles[served]
+                )
+                for batch_row, result in zip(served, described):
+                    results[batch[batch_row]] = result
+
+        return results
+
+    def describe_recommendations(self, ranked, user_profiles):
+        """
+        Build the results of a batch of recommendations: the ranked whiskies and the tasting
+        note explanation of the best match of each selection.
+
+        Parameters:
+        ranked (list of tuple): For each selection, the non-empty row numbers of the
+                                recommended whiskies (best first) and their cosine similarity.
+        user_profiles (np.ndarray): Raw mean note scores of each selection.
+
+        Returns:
+        list of dict: For each selection, a dictionary containing the recommended whisky, the
+                      common high tasting notes, the additional tasting notes in the
+                      recommended whisky, and the ranked recommendations with their cosine
+                      similarity. The note lists hold `top_n_notes` notes (three by default).
+        """
+        best_rows = np.array([ranked_rows[0] for ranked_rows, _ in ranked])
+        explanations = explain_recommendations(
+            to_dense(self.features[best_rows]),
+            user_profiles,
+            self.feature_names,
+            high_note_threshold=self.high_note_threshold,
+            top_n=self.top_n_notes,
+        )
+
+        return [
+            {
+                "Recommended Whisky": self.names[ranked_rows[0]],
+                "Top Three Common High Tasting Notes": common_high_notes,
+                "Top Three Additional Tasting Notes in Recommended Whisky": additional_notes,
+                "Top Recommendations": [
+                    {"Whisky": self.names[row], "Cosine Similarity": float(score)}
+                    for row, score in zip(ranked_rows, ranked_scores)
+                ],
+            }
+            for (ranked_rows, ranked_scores), (
+                common_high_notes,
+                additional_notes,
+            ) in zip(ranked, explanations)
+        ]
+
+
+def validate_mode(mode):
+    """
+    Check that a recommendation mode is supported.
+
+    Parameters:
+    mode (str): Requested mode.
+
+    Raises:
+    ValueError: If the mode is not one of `RECOMMENDATION_MODES`.
+    """
+    if mode not in RECOMMENDATION_MODES:
+        raise ValueError(
+            f"Unknown mode {mode!r}, expected one of {', '.join(RECOMMENDATION_MODES)}"
+        )
+
+
+@lru_cache(maxsize=None)
+def get_recommender(whisky_data_file):
+    """
+    Return the recommendation engine for a features file, loading it on first use.
+
+    Parameters:
+    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes,
+                            or to a feature store directory.
+
+    Returns:
+    WhiskyRecommender: Engine holding the dataset in memory.
+    """
+    return WhiskyRecommender(whisky_data_file)
 
-    # Sort the common high notes by their values in the recommended whisky
-    common_high_notes.sort(
-        key=lambda x: recommended_whisky_notes[user_features.columns.get_loc(x)],
-        reverse=True,
+
+def build_ann_index(whisky_data_file, n_lists=None):
+    """
+    Build the approximate nearest neighbour index of a features file and save it next to it.
+
+    Parameters:
+    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes,
+                            or to a feature store directory.
+    n_lists (int): Number of index clusters (defaults to the `IVFIndex.build` default).
+
+    Returns:
+    str: Path of the saved index file.
+    """
+    recommender = get_recommender(whisky_data_file)
+    index = IVFIndex.build(
+        to_dense(recommender.normalized_features),
+        n_lists=n_lists,
+        dataset_version=recommender.dataset_version,
     )
+    index_path = ann_index_path(whisky_data_file)
+    index.save(index_path)
+    recommender.ann_index = index
+    return index_path
+
+
+def build_neighbour_table(whisky_data_file, top_n=DEFAULT_TOP_N_NEIGHBOURS):
+    """
+    Precompute the neighbour table of a features file and save it next to it.
 
-    # Get the top three additional tasting notes with the highest values in the recommended whisky
-    additional_notes = [
-        note for note in user_features.columns if note not in common_high_notes
-    ]
-    additional_notes.sort(
-        key=lambda x: recommended_whisky_notes[user_features.columns.get_loc(x)],
-        reverse=True,
+    Parameters:
+    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes,
+                            or to a feature store directory.
+    top_n (int): Number of neighbours stored per whisky.
+
+    Returns:
+    str: Path of the saved table file.
+    """
+    recommender = WhiskyRecommender(whisky_data_file, cache_size=0)
+    neighbour_rows, neighbour_scores = compute_neighbours(
+        recommender.normalized_features, top_n=top_n
+    )
+    table_path = neighbour_table_path(whisky_data_file)
+    write_neighbour_table(
+        table_path, neighbour_rows, neighbour_scores, recommender.dataset_version
+    )
+    return table_path
+
+
+def recommend_whisky(whisky_data_file, user_whiskies, k=1, mode="exact", filters=None):
+    """
+    Recommend whiskies based on user-selected whiskies and identify common and additional
+    tasting notes.
+
+    The features file is only read the first time it is used; later calls reuse the
+    in-memory engine returned by `get_recommender`.
+
+    Parameters:
+    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes,
+                            or to a feature store directory.
+    user_whiskies (list of str): List of whiskies selected by the user.
+    k (int): Number of ranked recommendations to return.
+    mode (str): "exact" to scan the whole catalog, "approx" to use the ANN index.
+    filters (dict): Restrictions on the recommended whiskies, e.g. {"region": "Islay"}.
+
+    Returns:
+    dict: A dictionary containing the recommended whisky, top three common high tasting notes,
+          top three additional tasting notes in the recommended whisky, and the top k
+          recommendations with their cosine similarity.
+    """
+    return get_recommender(whisky_data_file).recommend(
+        user_whiskies, k=k, mode=mode, filters=filters
+    )
+
+
+def recommend_many(
+    whisky_data_file, list_of_whisky_lists, k=1, mode="exact", filters=None
+):
+    """
+    Recommend a whisky for each of many user selections in one batch.
+
+    Parameters:
+    whisky_data_file (str): Path to the CSV file containing whisky data with tasting notes,
+                            or to a feature store directory.
+    list_of_whisky_lists (list of list of str): Whisky selections, one list per user.
+    k (int): Number of ranked recommendations to return per selection.
+    mode (str): "exact" to scan the whole catalog, "approx" to use the ANN index.
+    filters (dict): Restrictions applied to every selection.
+
+    Returns:
+    list of dict: One result per selection, in input order, in the format returned by
+                  `recommend_whisky`, or a dictionary with an "error" message for selections
+                  that cannot be served.
+    """
+    return get_recommender(whisky_data_file).recommend_many(
+        list_of_whisky_lists, k=k, mode=mode, filters=filters
     )
-    top_additional_notes = additional_notes[:3]
-
-    # Return modeling details as a dictionary
-    return {
-        "Recommended Whisky": recommended_whisky,
-        "Top Three Common High Tasting Notes": common_high_notes[:3],
-        "Top Three Additional Tasting Notes in Recommended Whisky": top_additional_notes,
-    }
 
 
 # Example usage:
@@ -0,0 +1,416 @@
+"""
+Metrics Module
+
+This module keeps in-process latency histograms and counters, and exposes them in the
+Prometheus text format. Each gunicorn worker records into its own `MetricsRegistry` and
+periodically writes a JSON snapshot of it to a shared metrics directory (one file per process
+id); the `/metrics` endpoint merges the snapshots of all workers, so a scrape served by any
+worker reports the totals of the whole container. The snapshot of a process that is no longer
+running, e.g. a worker restarted by gunicorn, is added to an accumulated snapshot of the
+stopped processes (`metrics_dead.json`) before being deleted, so that the merged counters and
+histograms never decrease, which Prometheus would read as a counter reset.
+
+Timings use `time.perf_counter` and a lock-protected dictionary update, which costs a few
+microseconds per observation.
+
+Classes:
+    MetricsRegistry: Thread-safe histograms and counters of one process.
+
+Functions:
+    merge_snapshots(snapshots): Sums the histograms and counters of several processes.
+    load_snapshots(metrics_dir): Reads the snapshots written by every process.
+    render_prometheus(snapshot): Formats a snapshot in the Prometheus text format.
+
+Attributes:
+    REGISTRY: Registry of the current process, used by the app and the recommender.
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+DEFAULT_FLUSH_INTERVAL_SECONDS = 1.0
+
+SNAPSHOT_FILE_PATTERN = "metrics_*.json"
+# Accumulated snapshot of the processes that stopped, and the lock serializing its updates
+DEAD_SNAPSHOT_FILE = "metrics_dead.json"
+DEAD_SNAPSHOT_LOCK_FILE = "metrics_dead.lock"
+
+# Metric name -> (type, help)
+METRIC_DESCRIPTIONS = {
+    "whisky_recommendation_stage_seconds": (
+        "histogram",
+        "Duration of each stage of computing a recommendation.",
+    ),
+    "whisky_feedback_stage_seconds": (
+        "histogram",
+        "Duration of each stage of storing a feedback submission.",
+    ),
+    "whisky_feedback_batches_total": (
+        "counter",
+        "Feedback batches per outcome: written, spilled to the fallback writer or failed.",
+    ),
+    "whisky_recommendation_cache_lookups_total": (
+        "counter",
+        "Recommendation cache lookups per result (hit or miss).",
+    ),
+    "whisky_recommendation_coalescing_total": (
+        "counter",
+        "Recommendation cache misses per role: computed (leader), shared an identical "
+        "request's result (coalesced) or stopped waiting for it (timeout).",
+    ),
+    "whisky_request_seconds": ("histogram", "Duration of HTTP requests per endpoint."),
+    "whisky_requests_total": ("counter", "HTTP requests per endpoint and status code."),
+    "whisky_startup_seconds": (
+        "histogram",
+        "Duration of each startup phase, and time from process start to ready and to the "
+        "first request.",
+    ),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe latency histograms and counters of one process.
+
+    Parameters:
+    metrics_dir (str): Directory where snapshots are written, shared by all the workers, or
+                       None to keep the metrics in memory only.
+    buckets (tuple of float): Upper bounds of the histogram buckets.
+    flush_interval_seconds (float): Minimum time between two snapshots of `maybe_flush`.
+    clock (callable): Function returning the current time in seconds.
+    """
+
+    def __init__(
+        self,
+        metrics_dir=None,
+        buckets=DEFAULT_BUCKETS,
+        flush_interval_seconds=DEFAULT_FLUSH_INTERVAL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.metrics_dir = metrics_dir
+        self.buckets = tuple(buckets)
+        self.flush_interval_seconds = flush_interval_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = None
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Add to a counter.
+
+        Parameters:
+        name (str): Metric name.
+        amount (float): Value added to the counter.
+        **labels: Label values of the counter.
+        """
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """
+        Record a value, e.g. a duration in seconds, in a histogram.
+
+        Parameters:
+        name (str): Metric name.
+        value (float): Observed value.
+        **labels: Label values of the histogram.
+        """
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for position, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    histogram["buckets"][position] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Time the enclosed block and record its duration in a histogram.
+
+        Parameters:
+        name (str): Metric name.
+        **labels: Label values of the histogram.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        Return the current values of all the metrics.
+
+        Returns:
+        dict: JSON-serializable snapshot with the bucket bounds, the counters and the
+              histograms (bucket counts are per bucket, not cumulative).
+        """
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": list(histogram["buckets"]),
+                        "sum": histogram["sum"],
+                        "count": histogram["count"],
+                    }
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+            }
+
+    def flush(self):
+        """
+        Write the snapshot of this process to the metrics directory, atomically replacing
+        its previous snapshot.
+        """
+        self._flushed_at = self._clock()
+        if self.metrics_dir is None:
+            return
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = os.path.join(self.metrics_dir, f"metrics_{os.getpid()}.json")
+        _write_snapshot(path, self.snapshot())
+
+    def maybe_flush(self):
+        """
+        Write the snapshot of this process if the flush interval has elapsed.
+        """
+        if (
+            self._flushed_at is None
+            or self._clock() - self._flushed_at >= self.flush_interval_seconds
+        ):
+            self.flush()
+
+    def collect(self):
+        """
+        Return the metrics of every worker, including the latest values of this process.
+
+        Returns:
+        dict: Merged snapshot.
+        """
+        if self.metrics_dir is None:
+            return self.snapshot()
+        self.flush()
+        return merge_snapshots(load_snapshots(self.metrics_dir))
+
+
+def _is_running(pid):
+    """Check whether a process is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running under another user
+    return True
+
+
+def _read_snapshot(path):
+    """Read a snapshot file, or return None if it is missing or being replaced."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    """Write a snapshot file atomically."""
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(snapshot, file)
+    os.replace(temporary_path, path)
+
+
+def _retire_snapshot(metrics_dir, path):
+    """
+    Add the snapshot of a stopped process to the accumulated snapshot of the stopped
+    processes, and delete it. Serialized across processes, so that it is added once.
+    """
+    with open(os.path.join(metrics_dir, DEAD_SNAPSHOT_LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            return  # Retired by another process meanwhile
+        stopped = _read_snapshot(path)
+        if stopped is not None:
+            dead_path = os.path.join(metrics_dir, DEAD_SNAPSHOT_FILE)
+            accumulated = _read_snapshot(dead_path)
+            snapshots = [stopped] if accumulated is None else [accumulated, stopped]
+            _write_snapshot(dead_path, merge_snapshots(snapshots))
+        os.remove(path)
+
+
+def load_snapshots(metrics_dir):
+    """
+    Read the snapshots written to a metrics directory by every running process, and the
+    accumulated snapshot of the processes that stopped.
+
+    Parameters:
+    metrics_dir (str): Metrics directory.
+
+    Returns:
+    list of dict: Snapshots; files being replaced or unreadable are skipped, and the files
+                  of processes that are no longer running are added to the accumulated
+                  snapshot, then deleted.
+    """
+    for path in glob.glob(os.path.join(metrics_dir, SNAPSHOT_FILE_PATTERN)):
+        pid = os.path.basename(path)[len("metrics_") : -len(".json")]
+        if pid.isdigit() and not _is_running(int(pid)):
+            try:
+                _retire_snapshot(metrics_dir, path)
+            except OSError as e:
+                print(f"Could not retire metrics snapshot {path}: {e}")
+
+    snapshots = []
+    for path in glob.glob(os.path.join(metrics_dir, SNAPSHOT_FILE_PATTERN)):
+        snapshot = _read_snapshot(path)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def merge_snapshots(snapshots):
+    """
+    Sum the counters and histograms of several snapshots with the same bucket bounds.
+
+    Parameters:
+    snapshots (list of dict): Snapshots returned by `MetricsRegistry.snapshot`.
+
+    Returns:
+    dict: Merged snapshot.
+    """
+    buckets = snapshots[0]["buckets"] if snapshots else list(DEFAULT_BUCKETS)
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for counter in snapshot["counters"]:
+            key = (counter["name"], _labels_key(counter["labels"]))
+            counters[key] = counters.get(key, 0) + counter["value"]
+        for histogram in snapshot["histograms"]:
+            key = (histogram["name"], _labels_key(histogram["labels"]))
+            merged = histograms.setdefault(
+                key, {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+            )
+            merged["buckets"] = [
+                total + count
+                for total, count in zip(merged["buckets"], histogram["buckets"])
+            ]
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+
+    return {
+        "buckets": buckets,
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(counters.items())
+        ],
+        "histograms": [
+            {"name": name, "labels": dict(labels), **histogram}
+            for (name, labels), histogram in sorted(histograms.items())
+        ],
+    }
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = (
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in sorted(labels.items())
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_prometheus(snapshot):
+    """
+    Format a snapshot in the Prometheus text exposition format.
+
+    Parameters:
+    snapshot (dict): Snapshot returned by `MetricsRegistry.snapshot` or `merge_snapshots`.
+
+    Returns:
+    str: Metrics in the Prometheus text format.
+    """
+    lines = []
+    described = set()
+
+    def describe(name, default_type):
+        if name in described:
+            return
+        described.add(name)
+        metric_type, help_text = METRIC_DESCRIPTIONS.get(name, (default_type, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    for counter in snapshot["counters"]:
+        describe(counter["name"], "counter")
+        lines.append(
+            f"{counter['name']}{_format_labels(counter['labels'])} {counter['value']}"
+        )
+
+    for histogram in snapshot["histograms"]:
+        name, labels = histogram["name"], histogram["labels"]
+        describe(name, "histogram")
+        cumulative = 0
+        for upper_bound, count in zip(snapshot["buckets"], histogram["buckets"]):
+            cumulative += count
+            bucket_labels = _format_labels({**labels, "le": repr(float(upper_bound))})
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(
+            f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {histogram['count']}"
+        )
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,224 @@
+"""
+Startup Report Module
+
+This module measures how long a serving process takes to become useful: the duration of each
+startup phase (imports, dataset loading, catalog building...), the time until the app is ready
+and the time until it answered its first request, all counted from the start of the process.
+It also reports whether the heavy offline dependencies (pandas, scikit-learn, SciPy) were
+imported, which they should not be when serving a prebuilt feature store: the serving path
+only needs NumPy.
+
+The app exposes the report of the worker answering at `/startup`. The import timings of a
+module, as measured by `python -X importtime` in a fresh interpreter, are printed by
+
+    python -m scripts.monitoring.startup application
+
+Classes:
+    StartupReport: Startup phase timings of the current process.
+
+Functions:
+    process_start_time(): Returns the time the current process started.
+    parse_importtime(lines): Parses the output of `python -X importtime`.
+    import_timings(module): Measures the imports of a module in a fresh interpreter.
+
+Attributes:
+    STARTUP: Startup report of the current process, filled in by the app.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from scripts.monitoring.metrics import REGISTRY
+
+HEAVY_MODULES = ("pandas", "sklearn", "scipy")
+STARTUP_METRIC = "whisky_startup_seconds"
+
+_IMPORTED_AT = time.time()
+
+
+def process_start_time():
+    """
+    Return the time the current process started.
+
+    Returns:
+    float: Start time in seconds since the epoch, from /proc on Linux; elsewhere, the time
+           this module was imported, which only misses the interpreter's own startup.
+    """
+    try:
+        with open("/proc/self/stat") as file:
+            # The command name may hold spaces, the fields after it may not
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/stat") as file:
+            boot_time = next(
+                int(line.split()[1]) for line in file if line.startswith("btime")
+            )
+        return boot_time + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _IMPORTED_AT
+
+
+class StartupReport:
+    """
+    Startup phase timings of the current process.
+
+    Parameters:
+    started_at (float): Start time of the process, in seconds since the epoch; defaults to
+                        `process_start_time()`.
+    clock (callable): Returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, started_at=None, clock=time.time):
+        self.clock = clock
+        self.started_at = process_start_time() if started_at is None else started_at
+        self.phases = {}
+        self.ready_at = None
+        self.first_request_at = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a startup phase.
+
+        Parameters:
+        name (str): Name of the phase, e.g. "dataset".
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - start)
+
+    def record_phase(self, name, duration):
+        """
+        Record the duration of a startup phase timed by the caller.
+
+        Parameters:
+        name (str): Name of the phase.
+        duration (float): Duration in seconds.
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+        REGISTRY.observe(STARTUP_METRIC, duration, phase=name)
+
+    def mark_ready(self):
+        """
+        Record that the app is ready to answer requests.
+        """
+        self.ready_at = self.clock()
+        REGISTRY.observe(STARTUP_METRIC, self.ready_at - self.started_at, phase="ready")
+
+    def record_request(self):
+        """
+        Record a request; only the first one of the process is kept. Cheap enough to be
+        called on every request.
+        """
+        if self.first_request_at is not None:
+            return
+        with self._lock:
+            if self.first_request_at is not None:
+                return
+            self.first_request_at = self.clock()
+        REGISTRY.observe(
+            STARTUP_METRIC,
+            self.first_request_at - self.started_at,
+            phase="first_request",
+        )
+
+    def report(self):
+        """
+        Return the startup report of the process.
+
+        Returns:
+        dict: "pid", "phases_seconds" (duration of each phase), "ready_seconds" and
+              "time_to_first_request_seconds" (counted from the start of the process, None
+              until it happened) and "heavy_modules_loaded" (heavy offline dependencies
+              imported by the process).
+        """
+
+        def since_start(moment):
+            return None if moment is None else round(moment - self.started_at, 6)
+
+        return {
+            "pid": os.getpid(),
+            "phases_seconds": {
+                name: round(duration, 6) for name, duration in self.phases.items()
+            },
+            "ready_seconds": since_start(self.ready_at),
+            "time_to_first_request_seconds": since_start(self.first_request_at),
+            "heavy_modules_loaded": [
+                module for module in HEAVY_MODULES if module in sys.modules
+            ],
+        }
+
+
+def parse_importtime(lines):
+    """
+    Parse the output of `python -X importtime`.
+
+    Parameters:
+    lines (iterable of str): Lines written to stderr, e.g.
+                             "import time:       593 |     261331 |   pandas".
+
+    Returns:
+    list of tuple: (module, self microseconds, cumulative microseconds), in import order.
+    """
+    timings = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header line
+        timings.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return timings
+
+
+def import_timings(module):
+    """
+    Measure the imports of a module in a fresh interpreter.
+
+    Parameters:
+    module (str): Module to import, e.g. "application".
+
+    Returns:
+    list of tuple: (module, self microseconds, cumulative microseconds), in import order.
+
+    Raises:
+    RuntimeError: If the module cannot be imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr}")
+    return parse_importtime(process.stderr.splitlines())
+
+
+STARTUP = StartupReport()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print the slowest imports of a module in a fresh interpreter."
+    )
+    parser.add_argument("module", nargs="?", default="application")
+    parser.add_argument("--top", type=int, default=15, help="Imports to print")
+    args = parser.parse_args()
+
+    timings = import_timings(args.module)
+    total = next(
+        (cumulative for name, _, cumulative in timings if name == args.module), 0
+    )
+    print(f"import {args.module}: {total / 1000:.1f} ms")
+    top_level = [timing for timing in timings if "." not in timing[0]]
+    for name, _, cumulative in sorted(top_level, key=lambda t: -t[2])[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    heavy = [name for name, _, _ in timings if name in HEAVY_MODULES]
+    print(f"Heavy modules imported: {', '.join(heavy) or 'none'}")
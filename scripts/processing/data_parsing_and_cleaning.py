@@ -3,19 +3,82 @@ This module contains functions to process whisky data from CSV files.
 
 The functions perform various tasks such as loading and merging data,
 cleaning features, one-hot encoding, dropping unnecessary columns,
-and creating a distillery data table.
+creating a distillery data table, writing the binary feature store loaded
+by the app, precomputing the table of most similar whiskies it serves and
+the approximate nearest neighbour index of its approximate mode, and
+publishing the new snapshot so that running workers swap it in.
+
+Most bottles do not change between two scrapes, so the pipeline can run
+incrementally (`--incremental`): every raw record is hashed (its URL and its
+whole note and metadata payload), and only new or changed records are parsed
+and encoded, then merged into the previous processed features CSV, dropping
+the records no longer scraped. The hashes and vocabularies of the last run are
+kept in a state file next to the features CSV. Vocabularies only grow in this
+mode: a note seen for the first time adds its column, filled with 0 for the
+unchanged rows (which cannot hold it), while the column of a note no longer
+scraped stays, all zeros, until the next full run.
+
+Raw dumps larger than memory are processed in streaming mode (`--streaming`):
+a first pass reads only the post-treatment and note cells to discover the
+vocabularies, so that every chunk gets the same columns; the second pass
+processes the details file in chunks of bounded size, joins each chunk with
+the main page data (a compact lookup of its few columns, keyed by
+`whisky_link`), and appends its rows to the features CSV. The feature store is
+then built from the processed features, which hold a few numbers per whisky.
 
 Author: Yoni Friedman
 
 """
 
+import argparse
+import ast
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
 import pandas as pd
 
+# Add the repository root to sys.path to access the scripts package when run as a script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from scripts.modeling.dataset_snapshot import publish_snapshot
+from scripts.modeling.whisky_recommender_model import (
+    build_ann_index,
+    build_neighbour_table,
+)
+from scripts.processing.feature_store import NOTE_PREFIX, write_feature_store
+
 # Paths to input and output CSVs
 DETAILS_CSV_PATH = "../../data/raw/2024_05/whisky_details_all.csv"
 MAIN_PAGE_CSV_PATH = "../../data/raw/2024_05/whisky_main_page_with_ratings.csv"
 OUTPUT_CSV_PATH = "../../data/processed/2024_05/whisky_features_test.csv"
+SNAPSHOT_ROOT = "../../data/processed"
+SNAPSHOT_NAME = "2024_05/feature_store"
+FEATURE_STORE_PATH = os.path.join(SNAPSHOT_ROOT, SNAPSHOT_NAME)
 DISTILLERY_OUTPUT_CSV_PATH = "../../frontend/distillery_data.csv"
+PROCESSING_STATE_PATH = "../../data/processed/2024_05/processing_state.json"
+
+PROCESSING_STATE_VERSION = 1
+RECORD_KEY_COLUMN = "whisky_url"
+DEFAULT_CHUNK_SIZE = 5000
+
+POST_TREATMENT_COLUMN = "post_treatment"
+NOTE_COLUMNS = ["nosing_notes", "tasting_notes", "finish_notes"]
+MAIN_PAGE_COLUMNS = [
+    "whisky_link",
+    "whisky_name_suffix",
+    "whisky_rating",
+    "num_ratings",
+    "num_reviews",
+]
+# Raw columns cleaned as text, read as text even where a chunk only holds missing cells
+RAW_TEXT_COLUMNS = [
+    "whisky_age_inner",
+    "alcohol_pct_inner",
+    POST_TREATMENT_COLUMN,
+] + NOTE_COLUMNS
 
 
 def load_and_merge_data(details_path, main_page_path):
@@ -29,33 +92,53 @@ def load_and_merge_data(details_path, main_page_path):
     Returns:
         pd.DataFrame: Merged DataFrame containing whisky details.
     """
-    whisky_details_df = pd.read_csv(details_path)
-    main_page_df = pd.read_csv(main_page_path)
+    whisky_details_df = pd.read_csv(
+        details_path, dtype={column: str for column in RAW_TEXT_COLUMNS}
+    )
+    whisky_details_df = merge_main_page_data(
+        whisky_details_df, load_main_page_data(main_page_path)
+    )
+
+    # Drop duplicates based on notes - if identical for all tw
+    whisky_details_df.drop_duplicates(subset=NOTE_COLUMNS, inplace=True)
+
+    return whisky_details_df
+
+
+def load_main_page_data(main_page_path):
+    """
+    Load the main page columns merged into the whisky details.
+
+    Args:
+        main_page_path (str): Path to the main page CSV file.
+
+    Returns:
+        pd.DataFrame: MAIN_PAGE_COLUMNS of the main page, one row per whisky link.
+    """
+    return pd.read_csv(main_page_path, usecols=MAIN_PAGE_COLUMNS)[MAIN_PAGE_COLUMNS]
+
 
+def merge_main_page_data(whisky_details_df, main_page_df):
+    """
+    Merge whisky details with the main page data of their URL.
+
+    Args:
+        whisky_details_df (pd.DataFrame): DataFrame containing whisky details.
+        main_page_df (pd.DataFrame): Main page data, as returned by
+            `load_main_page_data`.
+
+    Returns:
+        pd.DataFrame: Merged DataFrame, in the order of the details.
+    """
     # Merge based on 'whisky_link' and 'whisky_url'
-    whisky_details_df = pd.merge(
+    return pd.merge(
         whisky_details_df,
-        main_page_df[
-            [
-                "whisky_link",
-                "whisky_name_suffix",
-                "whisky_rating",
-                "num_ratings",
-                "num_reviews",
-            ]
-        ],
+        main_page_df,
         left_on="whisky_url",
         right_on="whisky_link",
         how="left",
     )
 
-    # Drop duplicates based on notes - if identical for all tw
-    whisky_details_df.drop_duplicates(
-        subset=["nosing_notes", "tasting_notes", "finish_notes"], inplace=True
-    )
-
-    return whisky_details_df
-
 
 def clean_features(whisky_details_df):
     """
@@ -67,8 +150,8 @@ def clean_features(whisky_details_df):
     Returns:
         pd.DataFrame: Cleaned DataFrame.
     """
-    whisky_details_df["whisky_age"] = whisky_details_df["whisky_age_inner"].apply(
-        lambda x: "NAS" if pd.isna(x) else x.split()[0]
+    whisky_details_df["whisky_age"] = (
+        whisky_details_df["whisky_age_inner"].str.split().str[0].fillna("NAS")
     )
     whisky_details_df["alcohol_pct"] = (
         whisky_details_df["alcohol_pct_inner"].str.rstrip("%").astype(float)
@@ -84,92 +167,226 @@ def clean_features(whisky_details_df):
         .astype(int)
     )
 
-    whisky_details_df["full_name"] = whisky_details_df.apply(
-        lambda row: f"{row['distillery_name_inner']} "
-        f"{row['whisky_age'] if row['whisky_age'] != 'NAS' else ''} "
-        f"{row['whisky_name_suffix'] if pd.notna(row['whisky_name_suffix']) else ''}".strip(),
-        axis=1,
-    )
+    # "<distillery> <age> <suffix>", leaving out a missing age ("NAS") or suffix
+    age = whisky_details_df["whisky_age"].astype(str)
+    suffix = whisky_details_df["whisky_name_suffix"]
+    whisky_details_df["full_name"] = (
+        whisky_details_df["distillery_name_inner"].astype(str)
+        + " "
+        + age.where(age != "NAS", "")
+        + " "
+        + suffix.where(suffix.notna(), "").astype(str)
+    ).str.strip()
     return whisky_details_df
 
 
-def one_hot_encode_post_treatment(whisky_details_df):
+def parse_literal(value):
+    """
+    Parse a cell holding a Python literal, e.g. "{'Peat Smoke:': '100'}".
+
+    Scraped content is never executed: the cell is parsed with `ast.literal_eval`, which
+    only accepts literals, or, much faster, as JSON when swapping its quotes is enough to
+    make it JSON (no double quotes or escapes in its strings).
+
+    Args:
+        value (str): Raw cell.
+
+    Returns:
+        object: Parsed literal.
+    """
+    if '"' not in value and "\\" not in value:
+        try:
+            return json.loads(value.replace("'", '"'))
+        except ValueError:
+            pass
+    return ast.literal_eval(value)
+
+
+def parse_literal_cells(values):
+    """
+    Parse cells holding Python literals, each distinct cell exactly once.
+
+    Args:
+        values (pd.Series): Raw cells; missing cells are NaN.
+
+    Returns:
+        list: Parsed value of each cell, None for missing cells. Identical cells share
+            their parsed value, which must not be modified.
+    """
+    parsed = {}
+    cells = []
+    for value, is_missing in zip(values.to_numpy(), values.isna().to_numpy()):
+        if is_missing:
+            cells.append(None)
+            continue
+        cell = parsed.get(value)
+        if cell is None:
+            cell = parsed[value] = parse_literal(value)
+        cells.append(cell)
+    return cells
+
+
+def build_vocabulary(parsed_cells):
+    """
+    Collect the distinct items (list values or dictionary keys) of parsed cells.
+
+    Args:
+        parsed_cells (list): Cells parsed by `parse_literal_cells`, None when missing.
+
+    Returns:
+        list: Distinct items, sorted so that the column layout does not depend on the
+            order of the rows.
+    """
+    vocabulary = set()
+    for cell in parsed_cells:
+        if cell:
+            vocabulary.update(cell)
+    return sorted(vocabulary)
+
+
+def parse_raw_cells(whisky_details_df):
+    """
+    Parse the post-treatment and tasting note cells once, for every encoding step.
+
+    Args:
+        whisky_details_df (pd.DataFrame): DataFrame containing whisky details.
+
+    Returns:
+        dict: Column name -> parsed cells, for POST_TREATMENT_COLUMN and NOTE_COLUMNS.
+    """
+    return {
+        column: parse_literal_cells(whisky_details_df[column])
+        for column in [POST_TREATMENT_COLUMN] + NOTE_COLUMNS
+    }
+
+
+def _vocabulary_positions(parsed_cells, vocabulary):
+    """
+    Return the row and vocabulary column of every item of the parsed cells, with a mask of
+    the items in the vocabulary (only those are returned), in the order of the cells.
+    """
+    index = {item: column for column, item in enumerate(vocabulary)}
+    cells = [cell or () for cell in parsed_cells]
+    rows = np.repeat(np.arange(len(cells)), [len(cell) for cell in cells])
+    columns = np.array(
+        [index.get(item, -1) for cell in cells for item in cell], dtype=np.intp
+    )
+    known = columns >= 0
+    return rows[known], columns[known], known
+
+
+def _add_columns(whisky_details_df, columns, matrix):
+    """Add or replace columns of a DataFrame at once from a matrix with one row per row."""
+    encoded = pd.DataFrame(matrix, columns=columns, index=whisky_details_df.index)
+    whisky_details_df = whisky_details_df.drop(
+        columns=[column for column in columns if column in whisky_details_df]
+    )
+    return pd.concat([whisky_details_df, encoded], axis=1)
+
+
+def one_hot_encode_post_treatment(
+    whisky_details_df, parsed_post_treatment=None, vocabulary=None
+):
     """
     One-hot encode the post-treatment information.
 
     Args:
         whisky_details_df (pd.DataFrame): DataFrame containing whisky details.
+        parsed_post_treatment (list): Post-treatment cells parsed by
+            `parse_literal_cells`; parsed from the DataFrame if not given.
+        vocabulary (list of str): Post-treatment values to encode, one column each;
+            all the values of the cells by default.
 
     Returns:
         pd.DataFrame: DataFrame with one-hot encoded post-treatment information.
     """
-    post_treatment_possibilities = set()
-    for _, row in whisky_details_df.iterrows():
-        if not pd.isna(row["post_treatment"]):
-            post_treatment_dict = eval(row["post_treatment"])
-            post_treatment_possibilities.update(post_treatment_dict)
-
-    for possibility in post_treatment_possibilities:
-        whisky_details_df[possibility] = whisky_details_df["post_treatment"].apply(
-            lambda x: 1 if not pd.isna(x) and possibility in eval(x) else 0
+    if parsed_post_treatment is None:
+        parsed_post_treatment = parse_literal_cells(
+            whisky_details_df[POST_TREATMENT_COLUMN]
         )
-    return whisky_details_df
+    if vocabulary is None:
+        vocabulary = build_vocabulary(parsed_post_treatment)
+
+    rows, columns, _ = _vocabulary_positions(parsed_post_treatment, vocabulary)
+    encoded = np.zeros((len(whisky_details_df), len(vocabulary)), dtype=np.int64)
+    encoded[rows, columns] = 1
+    return _add_columns(whisky_details_df, vocabulary, encoded)
 
 
-def calculate_average_notes(row):
+def calculate_average_notes(parsed_notes, vocabulary):
     """
     Calculate the average notes for nosing, tasting, and finish.
 
+    The average of a note is the sum of its nosing, tasting and finish scores (0 to 100,
+    0 when missing) divided by 30 and rounded, like the scores of the processed dataset.
+
     Args:
-        row (pd.Series): Series containing nosing, tasting, and finish notes.
+        parsed_notes (dict): Note column name -> cells parsed by `parse_literal_cells`,
+            dictionaries of note name -> score.
+        vocabulary (list of str): Note names, one column each.
 
     Returns:
-        dict: Dictionary containing the average notes.
+        np.ndarray: Average scores, one row per whisky and one column per note.
     """
-    nosing_notes = eval(row["nosing_notes"]) if not pd.isna(row["nosing_notes"]) else {}
-    tasting_notes = (
-        eval(row["tasting_notes"]) if not pd.isna(row["tasting_notes"]) else {}
-    )
-    finish_notes = eval(row["finish_notes"]) if not pd.isna(row["finish_notes"]) else {}
+    num_rows = len(next(iter(parsed_notes.values())))
+    total = np.zeros((num_rows, len(vocabulary)), dtype=np.float64)
+    for column in NOTE_COLUMNS:
+        cells = parsed_notes[column]
+        rows, columns, known = _vocabulary_positions(cells, vocabulary)
+        scores = np.array(
+            [float(score) for cell in cells if cell for score in cell.values()],
+            dtype=np.float64,
+        )
+        # Each note appears once per cell, so every (row, column) is written once
+        scores_matrix = np.zeros_like(total)
+        scores_matrix[rows, columns] = scores[known]
+        total += scores_matrix
+    return np.round(total / (3 * 10)).astype(np.int64)
 
-    all_keys = set(nosing_notes.keys()).union(tasting_notes.keys(), finish_notes.keys())
 
-    average_dict = {}
-    for key in all_keys:
-        total_score = (
-            float(nosing_notes.get(key, 0))
-            + float(tasting_notes.get(key, 0))
-            + float(finish_notes.get(key, 0))
-        ) / (3 * 10)
-        average_dict[key] = round(total_score)
+def note_column_name(note):
+    """
+    Return the feature column of a note, e.g. "Note_Peat_Smoke" for "Peat Smoke:".
 
-    return average_dict
+    Args:
+        note (str): Note name as scraped.
 
+    Returns:
+        str: Column name, prefixed with NOTE_PREFIX.
+    """
+    return NOTE_PREFIX + note.rstrip(":").replace(" ", "_")
 
-def one_hot_encode_average_notes(whisky_details_df):
+
+def one_hot_encode_average_notes(whisky_details_df, parsed_notes=None, vocabulary=None):
     """
     One-hot encode the average notes for nosing, tasting, and finish.
 
+    Each note becomes a column named after it with the NOTE_PREFIX, e.g.
+    "Note_Peat_Smoke", so that the app can select tasting notes by name.
+
     Args:
         whisky_details_df (pd.DataFrame): DataFrame containing whisky details.
+        parsed_notes (dict): Note column name -> cells parsed by
+            `parse_literal_cells`; parsed from the DataFrame if not given.
+        vocabulary (list of str): Note names to encode; all the notes of the cells by
+            default.
 
     Returns:
         pd.DataFrame: DataFrame with one-hot encoded average notes.
     """
-    whisky_details_df["average_notes"] = whisky_details_df.apply(
-        calculate_average_notes, axis=1
-    )
-
-    all_notes = set()
-    for _, row in whisky_details_df.iterrows():
-        if not pd.isna(row["average_notes"]):
-            all_notes.update(row["average_notes"].keys())
-
-    for note in all_notes:
-        whisky_details_df[note.rstrip(":")] = whisky_details_df["average_notes"].apply(
-            lambda x: x.get(note, 0)
+    if parsed_notes is None:
+        parsed_notes = {
+            column: parse_literal_cells(whisky_details_df[column])
+            for column in NOTE_COLUMNS
+        }
+    if vocabulary is None:
+        vocabulary = build_vocabulary(
+            [cell for column in NOTE_COLUMNS for cell in parsed_notes[column]]
         )
-    return whisky_details_df
+
+    average_notes = calculate_average_notes(parsed_notes, vocabulary)
+    columns = [note_column_name(note) for note in vocabulary]
+    return _add_columns(whisky_details_df, columns, average_notes)
 
 
 def drop_unnecessary_columns(whisky_details_df):
@@ -188,19 +405,21 @@ def drop_unnecessary_columns(whisky_details_df):
         "nosing_notes",
         "tasting_notes",
         "finish_notes",
-        "average_notes",
         "alcohol_pct_inner",
     ]
     whisky_details_df.drop(columns=columns_to_drop, axis=1, inplace=True)
     return whisky_details_df
 
 
-def create_distillery_data_table(whisky_details_df):
+def build_distillery_data(whisky_details_df):
     """
-    Create a table with distillery names and concatenated whisky names.
+    Build the table of distillery names and concatenated whisky names.
 
     Args:
         whisky_details_df (pd.DataFrame): DataFrame containing whisky details.
+
+    Returns:
+        pd.DataFrame: Unique distillery and whisky name pairs.
     """
     # Ensure clean data by removing leading/trailing whitespace
     whisky_details_df["whisky_age"] = whisky_details_df["whisky_age"].str.strip()
@@ -209,11 +428,11 @@ def create_distillery_data_table(whisky_details_df):
     ].str.strip()
 
     # Concatenate whisky age and suffix if applicable
-    whisky_details_df["whisky_name"] = whisky_details_df.apply(
-        lambda row: f"{row['whisky_age'] + ' ' if row['whisky_age'] != 'NAS' else ''}"
-                    f"{row['whisky_name_suffix'] if pd.notna(row['whisky_name_suffix']) else ''}".strip(),
-        axis=1,
-    )
+    age = whisky_details_df["whisky_age"]
+    suffix = whisky_details_df["whisky_name_suffix"]
+    whisky_details_df["whisky_name"] = (
+        (age + " ").where(age != "NAS", "") + suffix.where(suffix.notna(), "")
+    ).str.strip()
 
     # Create a new DataFrame for the CSV output
     distillery_data = whisky_details_df[
@@ -221,39 +440,447 @@ def create_distillery_data_table(whisky_details_df):
     ].rename(columns={"distillery_name_inner": "distillery"})
 
     # Drop duplicates to ensure each distillery-whisky pair is unique
-    distillery_data = distillery_data.drop_duplicates()
+    return distillery_data.drop_duplicates()
+
+
+def create_distillery_data_table(whisky_details_df):
+    """
+    Create a table with distillery names and concatenated whisky names.
+
+    Args:
+        whisky_details_df (pd.DataFrame): DataFrame containing whisky details.
+
+    Returns:
+        pd.DataFrame: Unique distillery and whisky name pairs, the source of the
+            catalog served by the app.
+    """
+    distillery_data = build_distillery_data(whisky_details_df)
 
     # Write to CSV
     distillery_data.to_csv(DISTILLERY_OUTPUT_CSV_PATH, index=False)
 
     print("Distillery data table created successfully.")
+    return distillery_data
 
 
-def main():
+def process_whisky_details(
+    whisky_details_df, post_treatment_vocabulary=None, note_vocabulary=None
+):
     """
-    Main function to orchestrate data loading, cleaning, transformation, and export.
+    Clean and encode raw whisky records into feature rows.
+
+    Args:
+        whisky_details_df (pd.DataFrame): Raw records, as returned by
+            `load_and_merge_data`.
+        post_treatment_vocabulary (list of str): Post-treatment values to encode;
+            all the values of the records by default.
+        note_vocabulary (list of str): Note names to encode; all the notes of the
+            records by default.
+
+    Returns:
+        tuple: Processed DataFrame, and the post-treatment and note vocabularies
+            encoded.
+    """
+    whisky_details_df = clean_features(whisky_details_df)
+    parsed_cells = parse_raw_cells(whisky_details_df)
+    if post_treatment_vocabulary is None:
+        post_treatment_vocabulary = build_vocabulary(
+            parsed_cells[POST_TREATMENT_COLUMN]
+        )
+    if note_vocabulary is None:
+        note_vocabulary = build_vocabulary(
+            [cell for column in NOTE_COLUMNS for cell in parsed_cells[column]]
+        )
+
+    whisky_details_df = one_hot_encode_post_treatment(
+        whisky_details_df,
+        parsed_cells[POST_TREATMENT_COLUMN],
+        post_treatment_vocabulary,
+    )
+    whisky_details_df = one_hot_encode_average_notes(
+        whisky_details_df, parsed_cells, note_vocabulary
+    )
+    whisky_details_df = drop_unnecessary_columns(whisky_details_df)
+    return whisky_details_df, post_treatment_vocabulary, note_vocabulary
+
+
+def record_hashes(whisky_details_df, columns=None):
+    """
+    Hash each raw record: its URL and its whole note and metadata payload.
+
+    Args:
+        whisky_details_df (pd.DataFrame): Raw records, as returned by
+            `load_and_merge_data`.
+        columns (list of str): Columns hashed; all of them by default.
+
+    Returns:
+        list of str: Hex digest of each record, in the order of the rows.
+    """
+    payload = pd.Series("", index=whisky_details_df.index)
+    for column in whisky_details_df.columns if columns is None else columns:
+        # Separated by a character that never appears in scraped text
+        payload = payload + "\x1f" + whisky_details_df[column].astype(str)
+    return [
+        hashlib.blake2b(record.encode("utf-8"), digest_size=16).hexdigest()
+        for record in payload
+    ]
+
+
+def load_processing_state(state_path):
+    """
+    Load the state of the last processing run.
+
+    Args:
+        state_path (str): State file written by `save_processing_state`.
+
+    Returns:
+        dict: The state, or None if the file is missing, unreadable or of another
+            version.
+    """
+    try:
+        with open(state_path) as file:
+            state = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"No usable processing state in {state_path}: {e}")
+        return None
+    if state.get("state_version") != PROCESSING_STATE_VERSION:
+        print(f"Ignoring processing state of another version in {state_path}")
+        return None
+    return state
+
+
+def save_processing_state(
+    state_path,
+    whisky_details_df,
+    hashes,
+    post_treatment_vocabulary,
+    note_vocabulary,
+):
+    """
+    Save the state of a processing run, atomically.
+
+    Args:
+        state_path (str): State file.
+        whisky_details_df (pd.DataFrame): Raw records processed by the run.
+        hashes (list of str): Hash of each record, as returned by `record_hashes`.
+        post_treatment_vocabulary (list of str): Post-treatment values encoded.
+        note_vocabulary (list of str): Note names encoded.
+    """
+    state = {
+        "state_version": PROCESSING_STATE_VERSION,
+        "raw_columns": whisky_details_df.columns.to_list(),
+        "records": dict(zip(whisky_details_df[RECORD_KEY_COLUMN], hashes)),
+        "post_treatment_vocabulary": list(post_treatment_vocabulary),
+        "note_vocabulary": list(note_vocabulary),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    temporary_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(state, file, separators=(",", ":"))
+    os.replace(temporary_path, state_path)
+
+
+def process_incrementally(whisky_details_df, hashes, state, previous_output_path):
+    """
+    Process only the new and changed raw records, and merge them into the previous
+    processed features.
+
+    Args:
+        whisky_details_df (pd.DataFrame): Raw records, as returned by
+            `load_and_merge_data`, with unique URLs.
+        hashes (list of str): Hash of each record, as returned by `record_hashes`.
+        state (dict): State of the run that wrote the previous features, as returned
+            by `load_processing_state`.
+        previous_output_path (str): Features CSV written by that run.
+
+    Returns:
+        tuple: Processed DataFrame of all the records, in the order of the raw
+            records, the post-treatment and note vocabularies encoded, and the number
+            of "new", "changed", "unchanged" and "removed" records.
+
+    Raises:
+        ValueError: If the previous features do not match the state, or the raw
+            records have other columns; they must be processed in full.
+    """
+    if whisky_details_df.columns.to_list() != state["raw_columns"]:
+        raise ValueError("The raw records have other columns than the last run")
+
+    previous_hashes = state["records"]
+    urls = whisky_details_df[RECORD_KEY_COLUMN]
+    if not urls.is_unique:
+        raise ValueError("The raw records do not have unique URLs")
+    known = urls.isin(previous_hashes).to_numpy()
+    unchanged = np.array(
+        [previous_hashes.get(url) == record for url, record in zip(urls, hashes)],
+        dtype=bool,
+    )
+    counts = {
+        "new": int((~known).sum()),
+        "changed": int((known & ~unchanged).sum()),
+        "unchanged": int(unchanged.sum()),
+        "removed": len(set(previous_hashes) - set(urls)),
+    }
+
+    # Parse only the new and changed records; their new notes and post-treatment
+    # values extend the vocabularies
+    changed_df = whisky_details_df[~unchanged].copy()
+    parsed_cells = parse_raw_cells(changed_df)
+    post_treatment_vocabulary = sorted(
+        set(state["post_treatment_vocabulary"]).union(
+            build_vocabulary(parsed_cells[POST_TREATMENT_COLUMN])
+        )
+    )
+    note_vocabulary = sorted(
+        set(state["note_vocabulary"]).union(
+            build_vocabulary(
+                [cell for column in NOTE_COLUMNS for cell in parsed_cells[column]]
+            )
+        )
+    )
+    changed_df, _, _ = process_whisky_details(
+        changed_df, post_treatment_vocabulary, note_vocabulary
+    )
+
+    # Text columns are read as text, e.g. ages such as "12", as they were processed
+    text_columns = [
+        column for column, dtype in changed_df.dtypes.items() if dtype == object
+    ]
+    previous_df = pd.read_csv(
+        previous_output_path, dtype={column: str for column in text_columns}
+    )
+    if set(previous_df[RECORD_KEY_COLUMN]) != set(previous_hashes):
+        raise ValueError(
+            f"{previous_output_path} does not hold the records of the last run"
+        )
+
+    # Unchanged rows keep their features; new columns can only be 0 for them
+    unchanged_df = (
+        previous_df.set_index(RECORD_KEY_COLUMN, drop=False)
+        .loc[urls[unchanged]]
+        .reindex(columns=changed_df.columns, fill_value=0)
+    )
+    unchanged_df.index = whisky_details_df.index[unchanged]
+    processed_df = pd.concat([unchanged_df, changed_df]).sort_index()
+    return processed_df, post_treatment_vocabulary, note_vocabulary, counts
+
+
+def discover_vocabularies(details_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Discover the post-treatment and note vocabularies of a details file, reading only
+    its post-treatment and note cells, in chunks.
+
+    Args:
+        details_path (str): Path to the details CSV file.
+        chunk_size (int): Number of rows read at a time.
+
+    Returns:
+        tuple: Sorted post-treatment values and note names.
+    """
+    post_treatment_vocabulary = set()
+    note_vocabulary = set()
+    columns = [POST_TREATMENT_COLUMN] + NOTE_COLUMNS
+    for chunk in pd.read_csv(
+        details_path, usecols=columns, dtype=str, chunksize=chunk_size
+    ):
+        parsed_cells = parse_raw_cells(chunk)
+        post_treatment_vocabulary.update(
+            build_vocabulary(parsed_cells[POST_TREATMENT_COLUMN])
+        )
+        for column in NOTE_COLUMNS:
+            note_vocabulary.update(build_vocabulary(parsed_cells[column]))
+    return sorted(post_treatment_vocabulary), sorted(note_vocabulary)
+
+
+def process_in_chunks(
+    details_path, main_page_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE
+):
+    """
+    Process a details file too large for memory in chunks, appending the processed
+    rows of each chunk to the features CSV.
+
+    The output is the one of `load_and_merge_data` and `process_whisky_details`:
+    the vocabularies are discovered by a first pass, so that every chunk has the same
+    columns, and duplicate notes are dropped across chunks by remembering a hash of
+    the notes of every row written.
+
+    Args:
+        details_path (str): Path to the details CSV file.
+        main_page_path (str): Path to the main page CSV file.
+        output_path (str): Features CSV file, overwritten.
+        chunk_size (int): Number of details rows processed at a time.
+
+    Returns:
+        tuple: Number of rows written, and the distillery table of the rows, as
+            returned by `build_distillery_data`.
+    """
+    post_treatment_vocabulary, note_vocabulary = discover_vocabularies(
+        details_path, chunk_size
+    )
+    main_page_df = load_main_page_data(main_page_path)
+
+    seen_notes = set()
+    distillery_tables = []
+    num_rows = 0
+    first_chunk = True
+    for chunk in pd.read_csv(
+        details_path,
+        dtype={column: str for column in RAW_TEXT_COLUMNS},
+        chunksize=chunk_size,
+    ):
+        chunk = merge_main_page_data(chunk, main_page_df)
+
+        # Keep the first row of each notes, in this chunk and the previous ones
+        note_hashes = record_hashes(chunk, NOTE_COLUMNS)
+        first = []
+        for note_hash in note_hashes:
+            first.append(note_hash not in seen_notes)
+            seen_notes.add(note_hash)
+        chunk = chunk[first]
+
+        chunk, _, _ = process_whisky_details(
+            chunk, post_treatment_vocabulary, note_vocabulary
+        )
+        chunk.to_csv(
+            output_path,
+            mode="w" if first_chunk else "a",
+            header=first_chunk,
+            index=False,
+        )
+        first_chunk = False
+        num_rows += len(chunk)
+        distillery_tables.append(build_distillery_data(chunk))
+
+    distillery_data = pd.concat(distillery_tables).drop_duplicates()
+    return num_rows, distillery_data
+
+
+def process_in_memory(incremental=False):
+    """
+    Load, clean and encode the raw data in memory, and export the features CSV and
+    the distillery table.
+
+    Args:
+        incremental (bool): Only process the records that are new or changed since
+            the last run, if its features and state are available.
+
+    Returns:
+        pd.DataFrame: Processed whisky features.
     """
     # Step 1: Load and merge data
     whisky_details_df = load_and_merge_data(DETAILS_CSV_PATH, MAIN_PAGE_CSV_PATH)
+    hashes = record_hashes(whisky_details_df)
+
+    # Steps 2 to 6: Clean features, parse the post-treatment and note cells once,
+    # one-hot encode them and drop the raw columns, either only for the records
+    # changed since the last run or for all of them
+    processed_df = None
+    state = load_processing_state(PROCESSING_STATE_PATH) if incremental else None
+    if state is not None:
+        try:
+            (
+                processed_df,
+                post_treatment_vocabulary,
+                note_vocabulary,
+                counts,
+            ) = process_incrementally(whisky_details_df, hashes, state, OUTPUT_CSV_PATH)
+            print(
+                "Processed incrementally: "
+                + ", ".join(f"{count} {name}" for name, count in counts.items())
+            )
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Processing all the records, incremental run impossible: {e}")
+    if processed_df is None:
+        (
+            processed_df,
+            post_treatment_vocabulary,
+            note_vocabulary,
+        ) = process_whisky_details(whisky_details_df.copy())
+
+    # Step 7: Export the final DataFrame to CSV, and the state of this run
+    processed_df.to_csv(OUTPUT_CSV_PATH, index=False)
+    save_processing_state(
+        PROCESSING_STATE_PATH,
+        whisky_details_df,
+        hashes,
+        post_treatment_vocabulary,
+        note_vocabulary,
+    )
 
-    # Step 2: Clean features
-    whisky_details_df = clean_features(whisky_details_df)
+    # Step 8: Create distillery data table
+    create_distillery_data_table(processed_df)
 
-    # Step 3: One-hot encode post-treatment
-    whisky_details_df = one_hot_encode_post_treatment(whisky_details_df)
+    return processed_df
 
-    # Step 4: One-hot encode average notes
-    whisky_details_df = one_hot_encode_average_notes(whisky_details_df)
 
-    # Step 5: Drop unnecessary columns
-    whisky_details_df = drop_unnecessary_columns(whisky_details_df)
+def main(incremental=False, streaming=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Main function to orchestrate data loading, cleaning, transformation, and export.
+
+    Args:
+        incremental (bool): Only process the records that are new or changed since
+            the last run, if its features and state are available.
+        streaming (bool): Process the raw data in chunks instead of loading it in
+            memory; the state of the last run is discarded, so the next
+            incremental run processes all the records.
+        chunk_size (int): Number of raw rows processed at a time when streaming.
+    """
+    if streaming:
+        # Steps 1 to 8, one chunk of raw rows at a time
+        num_rows, distillery_data = process_in_chunks(
+            DETAILS_CSV_PATH, MAIN_PAGE_CSV_PATH, OUTPUT_CSV_PATH, chunk_size
+        )
+        print(f"{num_rows} whiskies processed in chunks of {chunk_size} rows")
+        distillery_data.to_csv(DISTILLERY_OUTPUT_CSV_PATH, index=False)
+        print("Distillery data table created successfully.")
+        if os.path.exists(PROCESSING_STATE_PATH):
+            os.remove(PROCESSING_STATE_PATH)
+        # The processed features hold a few numbers per whisky and fit in memory
+        processed_df = pd.read_csv(OUTPUT_CSV_PATH)
+    else:
+        processed_df = process_in_memory(incremental)
+
+    # Step 9: Write the binary feature store loaded by the app
+    manifest = write_feature_store(processed_df, FEATURE_STORE_PATH)
+    print(
+        f"Feature store version {manifest['dataset_version']} written to "
+        f"{FEATURE_STORE_PATH}"
+    )
+
+    # Step 10: Precompute each whisky's most similar whiskies for the app to memory-map
+    neighbour_table_file = build_neighbour_table(FEATURE_STORE_PATH)
+    print(f"Neighbour table written to {neighbour_table_file}")
 
-    # Step 6: Export the final DataFrame to CSV
-    whisky_details_df.to_csv(OUTPUT_CSV_PATH, index=False)
+    # Step 11: Build the approximate nearest neighbour index of the approximate mode
+    ann_index_file = build_ann_index(FEATURE_STORE_PATH)
+    print(f"ANN index written to {ann_index_file}")
 
-    # Step 7: Create distillery data table
-    create_distillery_data_table(whisky_details_df)
+    # Step 12: Validate the snapshot and point the app at it
+    publish_snapshot(SNAPSHOT_ROOT, SNAPSHOT_NAME)
+    print(f"Snapshot {SNAPSHOT_NAME} published in {SNAPSHOT_ROOT}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Process the scraped whisky data.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only process the records new or changed since the last run",
+    )
+    mode.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Process the raw data in chunks, for dumps larger than memory",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Raw rows per chunk when streaming",
+    )
+    args = parser.parse_args()
+    main(
+        incremental=args.incremental,
+        streaming=args.streaming,
+        chunk_size=args.chunk_size,
+    )
@@ -0,0 +1,350 @@
+"""
+This module contains functions to write and read the binary feature store.
+
+The feature store is a directory holding the processed whisky features in a
+form that can be loaded in milliseconds without parsing CSV:
+
+    manifest.json            schema version, dataset version, number of rows,
+                             matrix format, tasting note feature names and
+                             metadata columns
+    features.npy             float32 matrix of tasting note scores
+    normalized_features.npy  the same matrix with L2-normalized rows
+    metadata.npz             one array per metadata column (names, country,
+                             region, type, ABV, rating, post-treatment flags...)
+
+Mostly-zero note matrices are stored in CSR format instead of the two dense
+matrices: features_indptr.npy, features_indices.npy and features_data.npy,
+plus normalized_data.npy holding the normalized values of the same entries.
+
+The `.npy` arrays are memory-mapped on load, so processes serving the same
+store share their pages. Features are selected by name through the manifest,
+and any mismatch between the manifest and the files raises
+FeatureStoreSchemaError.
+
+Serving a store needs NumPy only. The store of a processed features CSV file
+is built, with pandas, by
+
+    python -m scripts.processing.feature_store <features CSV> <store directory>
+
+Author: Yoni Friedman
+
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from scripts.modeling.sparse_features import (
+    DEFAULT_SPARSE_DENSITY_THRESHOLD,
+    CSRMatrix,
+    is_sparse_enough,
+)
+
+SCHEMA_VERSION = 1
+NOTE_PREFIX = "Note_"
+
+MANIFEST_FILE = "manifest.json"
+FEATURES_FILE = "features.npy"
+NORMALIZED_FEATURES_FILE = "normalized_features.npy"
+METADATA_FILE = "metadata.npz"
+CSR_INDPTR_FILE = "features_indptr.npy"
+CSR_INDICES_FILE = "features_indices.npy"
+CSR_DATA_FILE = "features_data.npy"
+CSR_NORMALIZED_DATA_FILE = "normalized_data.npy"
+
+DENSE_FORMAT = "dense"
+CSR_FORMAT = "csr"
+
+
+class FeatureStoreSchemaError(ValueError):
+    """
+    Raised when a feature store does not match the expected schema.
+    """
+
+
+class FeatureStore:
+    """
+    Feature matrices and metadata loaded from a feature store directory.
+
+    Args:
+        manifest (dict): Content of the store's manifest.
+        features (np.ndarray or CSRMatrix): Tasting note scores, one row per
+            whisky.
+        normalized_features (np.ndarray or CSRMatrix): Features with
+            L2-normalized rows.
+        metadata (dict): Metadata column name -> array with one value per whisky.
+    """
+
+    def __init__(self, manifest, features, normalized_features, metadata):
+        self.manifest = manifest
+        self.features = features
+        self.normalized_features = normalized_features
+        self.metadata = metadata
+
+    @property
+    def dataset_version(self):
+        return self.manifest["dataset_version"]
+
+    @property
+    def feature_names(self):
+        return np.array(self.manifest["feature_names"], dtype=object)
+
+
+def is_feature_store(path):
+    """
+    Check whether a path is a feature store directory.
+
+    Args:
+        path (str): Path to check.
+
+    Returns:
+        bool: True if the path is a directory containing a manifest.
+    """
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def normalize_rows(features):
+    """
+    Scale each row of a matrix to unit length, leaving all-zero rows at zero.
+
+    Args:
+        features (np.ndarray): Matrix to normalize.
+
+    Returns:
+        np.ndarray: Matrix with L2-normalized rows.
+    """
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return np.divide(features, norms, out=np.zeros_like(features), where=norms > 0)
+
+
+def _metadata_column(series):
+    """Convert a DataFrame column to a numeric or fixed-width string array."""
+    if series.dtype.kind in "biuf":
+        return series.to_numpy(dtype=np.float64)
+    return series.fillna("").astype(str).to_numpy().astype(str)
+
+
+def write_feature_store(
+    whisky_details_df,
+    store_dir,
+    feature_names=None,
+    sparse_density_threshold=DEFAULT_SPARSE_DENSITY_THRESHOLD,
+):
+    """
+    Write the processed whisky features to a feature store directory.
+
+    The store is written to a temporary directory first and then moved into
+    place, so readers never see a partially written store.
+
+    Args:
+        whisky_details_df (pd.DataFrame): Processed whisky features.
+        store_dir (str): Destination directory.
+        feature_names (list of str): Tasting note columns to store. Defaults to
+            all columns starting with NOTE_PREFIX.
+        sparse_density_threshold (float): Maximum fraction of non-zero scores
+            for the features to be stored in CSR format, or None to always
+            store them dense.
+
+    Returns:
+        dict: The manifest of the written store.
+    """
+    if feature_names is None:
+        feature_names = [
+            column
+            for column in whisky_details_df.columns
+            if column.startswith(NOTE_PREFIX)
+        ]
+    if not feature_names:
+        raise FeatureStoreSchemaError("No tasting note feature columns to store")
+
+    features = whisky_details_df[feature_names].to_numpy(dtype=np.float32)
+    normalized_features = normalize_rows(features)
+    metadata = {
+        column: _metadata_column(whisky_details_df[column])
+        for column in whisky_details_df.columns
+        if column not in feature_names
+    }
+
+    # The dataset version identifies the content of the store
+    digest = hashlib.sha256()
+    digest.update(json.dumps(feature_names).encode("utf-8"))
+    digest.update(features.tobytes())
+    for column, values in metadata.items():
+        digest.update(column.encode("utf-8"))
+        digest.update(values.tobytes())
+
+    matrix_format = (
+        CSR_FORMAT
+        if is_sparse_enough(features, sparse_density_threshold)
+        else DENSE_FORMAT
+    )
+    manifest = {
+        "schema_version": SCHEMA_VERSION,
+        "dataset_version": digest.hexdigest()[:16],
+        "num_rows": len(features),
+        "matrix_format": matrix_format,
+        "feature_names": feature_names,
+        "metadata_columns": {
+            column: str(values.dtype) for column, values in metadata.items()
+        },
+    }
+
+    temporary_dir = f"{store_dir.rstrip(os.sep)}.tmp"
+    shutil.rmtree(temporary_dir, ignore_errors=True)
+    os.makedirs(temporary_dir)
+    if matrix_format == CSR_FORMAT:
+        sparse_features = CSRMatrix.from_dense(features)
+        np.save(os.path.join(temporary_dir, CSR_INDPTR_FILE), sparse_features.indptr)
+        np.save(os.path.join(temporary_dir, CSR_INDICES_FILE), sparse_features.indices)
+        np.save(os.path.join(temporary_dir, CSR_DATA_FILE), sparse_features.data)
+        np.save(
+            os.path.join(temporary_dir, CSR_NORMALIZED_DATA_FILE),
+            sparse_features.normalize_rows().data,
+        )
+    else:
+        np.save(os.path.join(temporary_dir, FEATURES_FILE), features)
+        np.save(
+            os.path.join(temporary_dir, NORMALIZED_FEATURES_FILE), normalized_features
+        )
+    np.savez(os.path.join(temporary_dir, METADATA_FILE), **metadata)
+    with open(os.path.join(temporary_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(temporary_dir, store_dir)
+    return manifest
+
+
+def _load_csr_matrices(store_dir, shape, mmap_mode):
+    """Load and check the CSR features and normalized features of a store."""
+    indptr, indices, data, normalized_data = [
+        np.load(os.path.join(store_dir, file_name), mmap_mode=mmap_mode)
+        for file_name in [
+            CSR_INDPTR_FILE,
+            CSR_INDICES_FILE,
+            CSR_DATA_FILE,
+            CSR_NORMALIZED_DATA_FILE,
+        ]
+    ]
+    nnz = int(indptr[-1]) if len(indptr) else 0
+    if (
+        len(indptr) != shape[0] + 1
+        or len(indices) != nnz
+        or len(data) != nnz
+        or len(normalized_data) != nnz
+    ):
+        raise FeatureStoreSchemaError(
+            f"{store_dir} sparse matrices do not match the declared shape {shape}"
+        )
+    return (
+        CSRMatrix(indptr, indices, data, shape),
+        CSRMatrix(indptr, indices, normalized_data, shape),
+    )
+
+
+def load_feature_store(store_dir, feature_names=None, mmap_mode="r"):
+    """
+    Load a feature store, checking it against its manifest.
+
+    Args:
+        store_dir (str): Feature store directory.
+        feature_names (list of str): Tasting note features expected by the
+            caller, in the order they should be returned. Defaults to the
+            features listed in the manifest.
+        mmap_mode (str): Memory-map mode of the feature matrices, or None to
+            read them into memory.
+
+    Returns:
+        FeatureStore: The loaded features and metadata.
+
+    Raises:
+        FeatureStoreSchemaError: If the store's schema version, feature names or
+            array shapes do not match what is expected.
+    """
+    with open(os.path.join(store_dir, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+
+    if manifest.get("schema_version") != SCHEMA_VERSION:
+        raise FeatureStoreSchemaError(
+            f"{store_dir} has schema version {manifest.get('schema_version')}, "
+            f"expected {SCHEMA_VERSION}"
+        )
+
+    stored_names = manifest["feature_names"]
+    num_rows = manifest["num_rows"]
+    matrix_format = manifest.get("matrix_format", DENSE_FORMAT)
+    if matrix_format == CSR_FORMAT:
+        features, normalized_features = _load_csr_matrices(
+            store_dir, (num_rows, len(stored_names)), mmap_mode
+        )
+    elif matrix_format == DENSE_FORMAT:
+        features = np.load(os.path.join(store_dir, FEATURES_FILE), mmap_mode=mmap_mode)
+        normalized_features = np.load(
+            os.path.join(store_dir, NORMALIZED_FEATURES_FILE), mmap_mode=mmap_mode
+        )
+        for name, matrix in [
+            ("features", features),
+            ("normalized", normalized_features),
+        ]:
+            if matrix.shape != (num_rows, len(stored_names)):
+                raise FeatureStoreSchemaError(
+                    f"{store_dir} {name} matrix has shape {matrix.shape}, manifest "
+                    f"declares {(num_rows, len(stored_names))}"
+                )
+    else:
+        raise FeatureStoreSchemaError(
+            f"{store_dir} has unknown matrix format {matrix_format!r}"
+        )
+
+    with np.load(os.path.join(store_dir, METADATA_FILE)) as archive:
+        metadata = {column: archive[column] for column in archive.files}
+    if set(metadata) != set(manifest["metadata_columns"]):
+        raise FeatureStoreSchemaError(
+            f"{store_dir} metadata columns do not match the manifest"
+        )
+    for column, values in metadata.items():
+        if len(values) != num_rows:
+            raise FeatureStoreSchemaError(
+                f"{store_dir} metadata column {column!r} has {len(values)} rows, "
+                f"expected {num_rows}"
+            )
+
+    # Select the requested features by name
+    if feature_names is not None and list(feature_names) != stored_names:
+        missing = [name for name in feature_names if name not in stored_names]
+        if missing:
+            raise FeatureStoreSchemaError(
+                f"{store_dir} is missing the features {', '.join(missing)}"
+            )
+        columns = [stored_names.index(name) for name in feature_names]
+        if matrix_format == CSR_FORMAT:
+            features = CSRMatrix.from_dense(features.toarray()[:, columns])
+            normalized_features = features.normalize_rows()
+        else:
+            features = np.ascontiguousarray(features[:, columns])
+            normalized_features = normalize_rows(features)
+        manifest = {**manifest, "feature_names": list(feature_names)}
+
+    return FeatureStore(manifest, features, normalized_features, metadata)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write the feature store of a processed whisky features CSV file."
+    )
+    parser.add_argument("features_csv", help="Processed whisky features CSV file")
+    parser.add_argument("store_dir", help="Destination feature store directory")
+    args = parser.parse_args()
+
+    # Only building a store needs pandas; loading one only needs NumPy
+    import pandas as pd
+
+    manifest = write_feature_store(pd.read_csv(args.features_csv), args.store_dir)
+    print(
+        f"Feature store version {manifest['dataset_version']} written to "
+        f"{args.store_dir}"
+    )
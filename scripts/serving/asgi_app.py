@@ -0,0 +1,363 @@
+"""
+Asynchronous Serving Module
+
+This module implements the asynchronous (ASGI) serving mode of the app. It exposes the same
+contract as the Flask app for `/`, the frontend's static files, `/catalog`, `/startup`,
+`/recommend` (POST and the cacheable GET variant) and `/submitFeedback`, with the same request
+validation (`scripts.serving.validation`), so that both modes can be load-tested side by side.
+
+The event loop only parses requests and writes responses:
+
+    - scoring, which is CPU-bound (NumPy releases the GIL for the matrix products), runs in a
+      bounded thread pool of `scoring_threads` threads;
+    - static files are read in the loop's default executor, and feedback is handed to the
+      `FeedbackSink`, which writes it in the background, so no request waits on disk or S3;
+    - at most `max_concurrency` recommendation requests are in flight (running or waiting for a
+      scoring thread); further requests are rejected at once with a 429 status and a
+      Retry-After header instead of queueing without bound.
+
+The module depends on no web framework; any ASGI server can run it, e.g.
+`uvicorn asgi_application:application`.
+
+Classes:
+    AsyncWhiskyApp: ASGI application serving recommendations and feedback.
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from scripts.monitoring.metrics import REGISTRY
+from scripts.serving.http_cache import (
+    DEFAULT_RECOMMEND_MAX_AGE_SECONDS,
+    canonical_recommendation,
+    etag_matches,
+    parse_recommend_query,
+)
+from scripts.serving.validation import parse_feedback, parse_recommend_request
+
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+
+class HTTPError(Exception):
+    """
+    Raised while handling a request to answer it with an error status and message.
+    """
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def _header(scope, name):
+    """Return the value of a request header, or an empty string."""
+    name = name.encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+class AsyncWhiskyApp:
+    """
+    ASGI application serving recommendations, feedback, the catalog and the frontend.
+
+    Parameters:
+    dataset (object): Object whose `current()` method returns the `WhiskyRecommender` to serve,
+                      e.g. a `SnapshotReloader`.
+    feedback_sink (FeedbackSink): Sink queuing the feedback entries.
+    catalog (Catalog): Distillery -> whisky catalog.
+    static_folder (str): Directory of the frontend files.
+    max_recommendations (int): Largest accepted number of recommendations.
+    max_concurrency (int): Maximum number of recommendation requests in flight.
+    scoring_threads (int): Number of threads scoring recommendations; defaults to the number
+                           of CPUs.
+    max_body_bytes (int): Largest accepted request body.
+    recommend_max_age (int): Time, in seconds, caches may serve GET /recommend responses.
+    startup_report (StartupReport): Startup report served at /startup, which also records the
+                                    first request; none by default.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        feedback_sink,
+        catalog,
+        static_folder,
+        max_recommendations,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        scoring_threads=None,
+        max_body_bytes=DEFAULT_MAX_BODY_BYTES,
+        recommend_max_age=DEFAULT_RECOMMEND_MAX_AGE_SECONDS,
+        startup_report=None,
+    ):
+        self.dataset = dataset
+        self.feedback_sink = feedback_sink
+        self.catalog = catalog
+        self.static_folder = os.path.abspath(static_folder)
+        self.max_recommendations = max_recommendations
+        self.max_concurrency = max_concurrency
+        self.max_body_bytes = max_body_bytes
+        self.recommend_max_age = recommend_max_age
+        self.startup_report = startup_report
+        self.scoring_executor = ThreadPoolExecutor(
+            max_workers=scoring_threads or os.cpu_count(),
+            thread_name_prefix="scoring",
+        )
+        self.in_flight = 0
+        self.rejected = 0
+
+        self._routes = {
+            ("GET", "/"): self.index,
+            ("GET", "/catalog"): self.catalog_endpoint,
+            ("GET", "/recommend"): self.recommend_get_endpoint,
+            ("POST", "/recommend"): self.recommend_endpoint,
+            ("POST", "/submitFeedback"): self.submit_feedback,
+        }
+        if startup_report is not None:
+            self._routes[("GET", "/startup")] = self.startup_endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def close(self):
+        """
+        Stop the scoring threads and write the pending feedback.
+        """
+        self.scoring_executor.shutdown(wait=True)
+        self.feedback_sink.close()
+
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        if self.startup_report is not None:
+            self.startup_report.record_request()
+        method, path = scope["method"], scope["path"]
+        handler = self._routes.get((method, path))
+        if handler is not None:
+            endpoint = path
+        else:
+            endpoint = "static" if method == "GET" else "unmatched"
+
+        try:
+            if handler is not None:
+                status, headers, body = await handler(scope, receive)
+            elif any(route_path == path for _, route_path in self._routes):
+                raise HTTPError(405, "Method not allowed")
+            elif method == "GET":
+                status, headers, body = await self.static_file(path)
+            else:
+                raise HTTPError(404, "Not found")
+        except HTTPError as e:
+            endpoint = endpoint if e.status != 404 else "unmatched"
+            status, headers, body = self._json(e.status, {"error": e.message})
+            headers.update(e.headers)
+        except Exception as e:
+            print(f"Error occurred: {e}")
+            status, headers, body = self._json(500, {"error": str(e)})
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (name.lower().encode("latin-1"), str(value).encode("latin-1"))
+                    for name, value in headers.items()
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+        REGISTRY.observe(
+            "whisky_request_seconds", time.perf_counter() - start, endpoint=endpoint
+        )
+        REGISTRY.increment(
+            "whisky_requests_total", endpoint=endpoint, status=str(status)
+        )
+        REGISTRY.maybe_flush()
+
+    @staticmethod
+    def _json(status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        return status, {"Content-Type": "application/json"}, body
+
+    async def _read_json(self, receive):
+        """Read the whole request body and decode it as JSON."""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "Client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise HTTPError(413, "Request body too large")
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        try:
+            return json.loads(b"".join(chunks))
+        except ValueError:
+            raise HTTPError(400, "Invalid JSON body")
+
+    async def index(self, scope, receive):
+        return await self.static_file("/index.html")
+
+    async def static_file(self, path):
+        """
+        Serve a file of the frontend directory, read outside the event loop.
+        """
+        file_path = os.path.abspath(os.path.join(self.static_folder, path.lstrip("/")))
+        if not file_path.startswith(self.static_folder + os.sep):
+            raise HTTPError(404, "Not found")
+        if not os.path.isfile(file_path):
+            raise HTTPError(404, "Not found")
+
+        def read():
+            with open(file_path, "rb") as file:
+                return file.read()
+
+        body = await asyncio.get_running_loop().run_in_executor(None, read)
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        return 200, {"Content-Type": content_type}, body
+
+    async def startup_endpoint(self, scope, receive):
+        return self._json(200, self.startup_report.report())
+
+    async def catalog_endpoint(self, scope, receive):
+        headers = {
+            "ETag": f'"{self.catalog.etag}"',
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(_header(scope, "if-none-match"), self.catalog.etag):
+            return 304, headers, b""
+        headers["Content-Type"] = "application/json"
+        if "gzip" in _header(scope, "accept-encoding"):
+            headers["Content-Encoding"] = "gzip"
+            return 200, headers, self.catalog.compressed_document
+        return 200, headers, self.catalog.document
+
+    def _admit(self):
+        """Count a recommendation request in flight, or reject it if the limit is reached."""
+        if self.in_flight >= self.max_concurrency:
+            self.rejected += 1
+            raise HTTPError(
+                429,
+                "Too many requests, please retry later",
+                {"Retry-After": RETRY_AFTER_SECONDS},
+            )
+        self.in_flight += 1
+
+    def _recommend(self, parameters, request_query=None, if_none_match=""):
+        """
+        Answer a recommendation request, in a scoring thread.
+
+        Parameters:
+        parameters (dict): Validated request, as returned by `parse_recommend_request`.
+        request_query (str): Query string of a GET request, or None for a POST request.
+        if_none_match (str): If-None-Match header of a GET request.
+
+        Returns:
+        tuple: Status, headers and recommendation (None for redirects and 304 responses).
+        """
+        recommender = self.dataset.current()
+        selection, query, etag = canonical_recommendation(recommender, parameters)
+        if request_query is None:
+            headers = {"ETag": f'"{etag}"', "Content-Location": f"/recommend?{query}"}
+        else:
+            cache_control = f"public, max-age={self.recommend_max_age}"
+            if selection and query != request_query:
+                headers = {
+                    "Location": f"/recommend?{query}",
+                    "Cache-Control": cache_control,
+                }
+                return 302, headers, None
+            headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control}
+            if etag_matches(if_none_match, etag):
+                return 304, headers, None
+        return 200, headers, recommender.recommend(**parameters)
+
+    async def _score(self, parameters, *args):
+        try:
+            (
+                status,
+                headers,
+                recommended_whisky,
+            ) = await asyncio.get_running_loop().run_in_executor(
+                self.scoring_executor, self._recommend, parameters, *args
+            )
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        if recommended_whisky is None:
+            return status, headers, b""
+        _, json_headers, body = self._json(
+            status, {"recommended_whisky": recommended_whisky}
+        )
+        return status, {**headers, **json_headers}, body
+
+    async def recommend_endpoint(self, scope, receive):
+        # Counted from the start, so that requests still uploading their body are included
+        self._admit()
+        try:
+            parameters, error = parse_recommend_request(
+                await self._read_json(receive), self.max_recommendations
+            )
+            if error:
+                raise HTTPError(400, error)
+            return await self._score(parameters)
+        finally:
+            self.in_flight -= 1
+
+    async def recommend_get_endpoint(self, scope, receive):
+        self._admit()
+        try:
+            request_query = scope.get("query_string", b"").decode("utf-8")
+            data, error = parse_recommend_query(
+                parse_qsl(request_query, keep_blank_values=True)
+            )
+            if error:
+                raise HTTPError(400, error)
+            parameters, error = parse_recommend_request(data, self.max_recommendations)
+            if error:
+                raise HTTPError(400, error)
+            return await self._score(
+                parameters, request_query, _header(scope, "if-none-match")
+            )
+        finally:
+            self.in_flight -= 1
+
+    async def submit_feedback(self, scope, receive):
+        data = await self._read_json(receive)
+        entry, error = parse_feedback(data)
+        if error:
+            raise HTTPError(400, error)
+
+        # Log incoming data
+        print(data)
+
+        # Only queue the entry: the sink writes it with the rest of its batch in the background
+        if not self.feedback_sink.submit(entry):
+            raise HTTPError(503, "Feedback queue is full, please retry later")
+        return self._json(200, {"message": "Feedback submitted successfully"})
@@ -0,0 +1,167 @@
+"""
+Catalog Module
+
+This module serves the distillery -> whisky catalog to the frontend. The catalog is built once
+per process from the distillery table written by the data pipeline (`distillery_data.csv`, one
+row per distillery and whisky name), and kept in two forms:
+
+    - a compact JSON document mapping each distillery to its whisky names, gzip-compressed once
+      and identified by an ETag (a hash of its content), so that browsers download it at most
+      once per catalog version;
+    - prefix indexes over the normalized distillery names and full names ("<distillery> <whisky
+      name>", the name the frontend sends to /recommend) answering autocomplete queries. Full
+      names are indexed from the start of each of their words, so "uig" finds
+      "Ardbeg Uigeadail".
+
+Classes:
+    PrefixIndex: Sorted keys finding the values of the keys starting with a prefix.
+    Catalog: Compressed catalog document and autocomplete index.
+"""
+
+import bisect
+import csv
+import gzip
+import hashlib
+import itertools
+import json
+
+from scripts.modeling.name_index import normalize_name
+
+DEFAULT_AUTOCOMPLETE_LIMIT = 10
+
+
+class PrefixIndex:
+    """
+    Prefix index mapping string keys to values.
+
+    The keys are kept sorted, which lays out the leaves of a prefix trie in order: the keys
+    starting with a prefix form one contiguous run, found with two binary searches. This
+    answers the same queries as a node-per-character trie in a fraction of its memory, which
+    matters once tens of thousands of names are indexed from each of their words.
+
+    Parameters:
+    items (iterable of tuple): (key, value) pairs; a key may hold several values.
+    """
+
+    def __init__(self, items):
+        items = sorted(items, key=lambda item: item[0])
+        self.keys = [key for key, _ in items]
+        self.values = [value for _, value in items]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit=None):
+        """
+        Return the values of the keys starting with a prefix, in key order, each value once.
+
+        Parameters:
+        prefix (str): Prefix of the keys.
+        limit (int): Maximum number of values, or None for all of them.
+
+        Returns:
+        list: Values of the matching keys, alphabetically first keys first.
+        """
+        start = bisect.bisect_left(self.keys, prefix)
+        stop = bisect.bisect_left(self.keys, prefix + "\U0010ffff", lo=start)
+        values = []
+        seen = set()
+        for value in itertools.islice(self.values, start, stop):
+            if value not in seen:
+                seen.add(value)
+                values.append(value)
+                if limit is not None and len(values) >= limit:
+                    break
+        return values
+
+
+class Catalog:
+    """
+    Distillery -> whisky catalog, as a compressed JSON document and an autocomplete index.
+
+    Parameters:
+    distillery_data (iterable of tuple): (distillery, whisky name) pairs, e.g. the rows of the
+                                         table returned by `create_distillery_data_table`.
+    """
+
+    def __init__(self, distillery_data):
+        pairs = []
+        for distillery, whisky_name in distillery_data:
+            distillery = "" if distillery is None else str(distillery).strip()
+            whisky_name = "" if whisky_name is None else str(whisky_name).strip()
+            if distillery:
+                pairs.append((distillery, whisky_name))
+
+        # Distilleries and their whiskies in the order of the table
+        self.distilleries = {}
+        for distillery, whisky_name in dict.fromkeys(pairs):
+            self.distilleries.setdefault(distillery, []).append(whisky_name)
+
+        self.document = json.dumps(
+            {"distilleries": self.distilleries},
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode("utf-8")
+        self.compressed_document = gzip.compress(self.document, mtime=0)
+        self.etag = hashlib.sha256(self.document).hexdigest()[:32]
+
+        distillery_keys = []
+        whisky_keys = []
+        self._entries = []
+        for distillery, whisky_names in self.distilleries.items():
+            distillery_keys.append((normalize_name(distillery), distillery))
+            for whisky_name in whisky_names:
+                full_name = f"{distillery} {whisky_name}".strip()
+                entry_id = len(self._entries)
+                self._entries.append(
+                    {
+                        "distillery": distillery,
+                        "whisky_name": whisky_name,
+                        "full_name": full_name,
+                    }
+                )
+                words = normalize_name(full_name).split(" ")
+                whisky_keys.extend(
+                    (" ".join(words[start:]), entry_id) for start in range(len(words))
+                )
+        self._distillery_index = PrefixIndex(distillery_keys)
+        self._whisky_index = PrefixIndex(whisky_keys)
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Build the catalog from a distillery table CSV file.
+
+        Parameters:
+        path (str): Path to the CSV file written by the data pipeline.
+
+        Returns:
+        Catalog: Catalog of the file.
+        """
+        with open(path, newline="", encoding="utf-8") as file:
+            rows = csv.DictReader(file)
+            return cls([(row["distillery"], row["whisky_name"]) for row in rows])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def autocomplete(self, query, limit=DEFAULT_AUTOCOMPLETE_LIMIT):
+        """
+        Complete a partially typed distillery or whisky name.
+
+        Parameters:
+        query (str): Typed text; compared after normalization, like whisky names.
+        limit (int): Maximum number of distilleries and of whiskies returned.
+
+        Returns:
+        dict: "distilleries", the matching distillery names, and "whiskies", the matching
+              whiskies with their "distillery", "whisky_name" and "full_name".
+        """
+        prefix = normalize_name(query)
+        if not prefix:
+            return {"distilleries": [], "whiskies": []}
+        entry_ids = self._whisky_index.search(prefix, limit)
+        return {
+            "distilleries": self._distillery_index.search(prefix, limit),
+            "whiskies": [self._entries[entry_id] for entry_id in entry_ids],
+        }
@@ -0,0 +1,126 @@
+"""
+HTTP Cache Module
+
+This module makes recommendation responses cacheable by browsers and CDNs. A recommendation
+only depends on the ranking version (the dataset version, and the version of the feedback
+scores when they are blended in), the canonical selection (the sorted dataset names the
+selected whiskies resolve to) and the options (k, mode, filters), so:
+
+    - its strong ETag is a hash of those, computed without scoring anything, which lets
+      conditional requests be answered with a 304 before the recommender runs;
+    - the GET variant of /recommend has one canonical URL per distinct recommendation,
+      `/recommend?whisky=<name>&whisky=<name>&k=<k>&mode=<mode>[&filters=<JSON>]` with the
+      names sorted, and other spellings of the same request are redirected to it, so that
+      caches keyed on the URL serve repeat queries whatever order or spelling they come in.
+
+Functions:
+    parse_recommend_query(query_items): Converts GET query parameters to a /recommend body.
+    canonical_recommendation(recommender, parameters): Returns the canonical URL query and ETag.
+    etag_matches(if_none_match, etag): Evaluates an If-None-Match header.
+"""
+
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from scripts.modeling.attribute_index import canonical_filters
+
+DEFAULT_RECOMMEND_MAX_AGE_SECONDS = 300
+
+
+def parse_recommend_query(query_items):
+    """
+    Convert the query parameters of a GET /recommend request to the equivalent JSON body, to
+    be validated by `parse_recommend_request`.
+
+    Parameters:
+    query_items (list of tuple): (name, value) pairs of the query string, in order.
+
+    Returns:
+    tuple: (data, error). On success, `data` is the request body and `error` is None;
+           otherwise `data` is None and `error` is the message to return with a 400 status.
+    """
+    data = {"whisky_names": []}
+    for name, value in query_items:
+        if name == "whisky":
+            data["whisky_names"].append(value)
+        elif name == "k":
+            data["k"] = int(value) if value.isdigit() else value
+        elif name == "mode":
+            data["mode"] = value
+        elif name == "filters":
+            try:
+                data["filters"] = json.loads(value)
+            except ValueError:
+                return None, "Invalid filters, a JSON object is expected"
+    return data, None
+
+
+def _canonical_filter_values(filters):
+    """Return filters with their lists of values sorted, to serialize them canonically."""
+    return {
+        name: sorted(value, key=str) if isinstance(value, list) else value
+        for name, value in filters.items()
+    }
+
+
+def canonical_recommendation(recommender, parameters):
+    """
+    Return the canonical selection, GET query and strong ETag of a recommendation request.
+
+    Parameters:
+    recommender (WhiskyRecommender): Recommender serving the request.
+    parameters (dict): Validated request, as returned by `parse_recommend_request`.
+
+    Returns:
+    tuple: (selection, query, etag), the sorted dataset names of the selection (empty when
+           none of the names resolve), the canonical query string (without "?") and the ETag
+           value (without quotes).
+
+    Raises:
+    ValueError: If the filters are not a dictionary.
+    """
+    selection = recommender.canonical_selection(parameters["user_whiskies"])
+    filters = parameters.get("filters")
+    canonical_filters(filters)  # Rejects filters that are not a dictionary
+    filters_json = (
+        json.dumps(
+            _canonical_filter_values(filters), sort_keys=True, separators=(",", ":")
+        )
+        if filters
+        else ""
+    )
+
+    query_items = [("whisky", name) for name in selection]
+    query_items += [("k", parameters["k"]), ("mode", parameters["mode"])]
+    if filters_json:
+        query_items.append(("filters", filters_json))
+
+    key = json.dumps(
+        [
+            recommender.ranking_version,
+            selection,
+            parameters["k"],
+            parameters["mode"],
+            filters_json,
+        ]
+    )
+    etag = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    return selection, urlencode(query_items), etag
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Check whether an If-None-Match header value matches an ETag.
+
+    Parameters:
+    if_none_match (str): Header value, e.g. '"abc", "def"' or "*".
+    etag (str): ETag value, without quotes.
+
+    Returns:
+    bool: True if the client's cached copy is current.
+    """
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/").strip('"') == etag for candidate in candidates
+    )
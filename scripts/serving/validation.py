@@ -0,0 +1,99 @@
+"""
+Request Validation Module
+
+This module validates the JSON bodies of the recommendation and feedback endpoints. It is
+shared by the Flask app (`application.py`) and the asynchronous app (`asgi_application.py`),
+so that both serving modes accept and reject exactly the same requests with the same messages.
+
+Functions:
+    parse_recommend_request(data, max_recommendations): Validates a /recommend body.
+    parse_feedback(data): Validates a /submitFeedback body.
+"""
+
+from scripts.feedback.feedback_sink import FEEDBACK_FIELDS, REQUIRED_FIELDS
+from scripts.modeling.whisky_recommender_model import RECOMMENDATION_MODES
+
+
+def is_whisky_name_list(whisky_names):
+    """Return whether a request value is a list of whisky names."""
+    return isinstance(whisky_names, list) and all(
+        isinstance(name, str) for name in whisky_names
+    )
+
+
+def parse_num_recommendations(data, max_recommendations):
+    """Return the requested number of recommendations `k`, or None if it is invalid."""
+    k = data.get("k", 1)
+    if (
+        isinstance(k, bool)
+        or not isinstance(k, int)
+        or not 1 <= k <= max_recommendations
+    ):
+        return None
+    return k
+
+
+def parse_mode(data):
+    """Return the requested recommendation mode, or None if it is invalid."""
+    mode = data.get("mode", "exact")
+    return mode if mode in RECOMMENDATION_MODES else None
+
+
+def num_recommendations_error(max_recommendations):
+    """Return the message rejecting an invalid number of recommendations."""
+    return f"Invalid input, k must be an integer between 1 and {max_recommendations}"
+
+
+def mode_error():
+    """Return the message rejecting an invalid recommendation mode."""
+    return f"Invalid input, mode must be one of {', '.join(RECOMMENDATION_MODES)}"
+
+
+def parse_recommend_request(data, max_recommendations):
+    """
+    Validate the body of a recommendation request.
+
+    Parameters:
+    data (object): Decoded JSON body.
+    max_recommendations (int): Largest accepted number of recommendations.
+
+    Returns:
+    tuple: (parameters, error). On success, `parameters` holds the "user_whiskies", "k", "mode"
+           and "filters" to recommend with and `error` is None; otherwise `parameters` is None
+           and `error` is the message to return with a 400 status.
+    """
+    if not isinstance(data, dict) or not is_whisky_name_list(data.get("whisky_names")):
+        return None, "Invalid input, list of whisky names expected"
+    k = parse_num_recommendations(data, max_recommendations)
+    if k is None:
+        return None, num_recommendations_error(max_recommendations)
+    mode = parse_mode(data)
+    if mode is None:
+        return None, mode_error()
+
+    parameters = {
+        "user_whiskies": data["whisky_names"],
+        "k": k,
+        "mode": mode,
+        "filters": data.get("filters"),
+    }
+    return parameters, None
+
+
+def parse_feedback(data):
+    """
+    Validate the body of a feedback submission.
+
+    Parameters:
+    data (object): Decoded JSON body.
+
+    Returns:
+    tuple: (entry, error). On success, `entry` holds every feedback field, optional ones
+           defaulting to empty strings, and `error` is None; otherwise `entry` is None and
+           `error` is the message to return with a 400 status.
+    """
+    if not isinstance(data, dict) or not all(
+        field in data for field in REQUIRED_FIELDS
+    ):
+        return None, "Missing data"
+    return {field: data.get(field, "") for field in FEEDBACK_FIELDS}, None
@@ -0,0 +1,467 @@
+"""
+Recommendation Benchmark Suite
+
+This script benchmarks the recommendation path on synthetic catalogs matching the processed
+features schema (the metadata columns of `clean_features` and
+`one_hot_encode_post_treatment`, followed by `Note_*` tasting note columns). Each catalog is
+written as a feature store and the following scenarios are timed:
+
+    recommend_whisky      single selections through the module-level function, exact scan
+    recommend_cached      the same selection repeated, served by the result cache
+    recommend_approx      single selections with mode="approx" (IVF index)
+    recommend_filtered    selections restricted to one region
+    similar_neighbours    single-whisky selections answered by the neighbour table
+    recommend_many        batches of selections scored with one GEMM per chunk
+    flask_recommend       the Flask /recommend endpoint through the test client
+    asgi_recommend        the asynchronous app's /recommend endpoint, called on one event loop
+
+For each scenario, the p50/p95/p99 latency, throughput and peak traced memory are reported,
+and the results are saved as JSON. With --baseline, the results are compared to a saved run
+and the scenarios whose p95 latency or throughput regressed beyond --tolerance are flagged;
+the script then exits with status 1.
+
+Usage (from the repository root):
+    python -m tests.benchmarks.bench_recommendation --catalogs 1000x100 10000x300
+    python -m tests.benchmarks.bench_recommendation --output bench.json --baseline base.json
+
+Catalogs are given as <whiskies>x<notes>; the full range is 1000x100 up to 1000000x1000,
+the largest needing several GB of memory to generate.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Add the repository root to sys.path to access the scripts package when run as a script
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from scripts.modeling.whisky_recommender_model import (  # noqa: E402
+    build_neighbour_table,
+    get_recommender,
+    recommend_whisky,
+)
+from scripts.processing.feature_store import write_feature_store  # noqa: E402
+from scripts.serving.asgi_app import AsyncWhiskyApp  # noqa: E402
+
+DEFAULT_CATALOGS = ["1000x100", "10000x300", "100000x1000"]
+DEFAULT_QUERIES = 200
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_TOLERANCE = 0.2
+
+# Memory is traced on a separate run of the first calls, as tracing slows calls down
+MEMORY_TRACED_CALLS = 10
+
+REGIONS = ["Islay", "Speyside", "Highlands", "Lowlands", "Campbeltown", "Islands"]
+COUNTRIES = ["Scotland", "Ireland", "Japan", "USA"]
+POST_TREATMENT_COLUMNS = [
+    "Chill filtration - With",
+    "Artifical colouring - Without",
+    "Artifical colouring - With",
+    "Chill filtration - Without",
+]
+
+
+def parse_catalog(catalog):
+    """
+    Parse a catalog size given as <whiskies>x<notes>.
+
+    Parameters:
+    catalog (str): Catalog size, e.g. "10000x300".
+
+    Returns:
+    tuple: Number of whiskies and number of notes.
+    """
+    num_whiskies, num_notes = catalog.lower().split("x")
+    return int(num_whiskies), int(num_notes)
+
+
+def make_synthetic_catalog(num_whiskies, num_notes, num_styles=50, seed=0):
+    """
+    Generate a processed features DataFrame with a realistic structure.
+
+    Each whisky is a noisy variation of one of `num_styles` style profiles; scores are
+    rounded to integers between 0 and 10 like the averaged notes of the pipeline, which
+    leaves most of them at zero.
+
+    Parameters:
+    num_whiskies (int): Number of whiskies.
+    num_notes (int): Number of tasting notes.
+    num_styles (int): Number of underlying styles.
+    seed (int): Seed of the random generator.
+
+    Returns:
+    pd.DataFrame: Catalog with the metadata columns followed by the Note_* columns.
+    """
+    rng = np.random.default_rng(seed)
+    styles = rng.gamma(0.3, 4.0, size=(num_styles, num_notes)).astype(np.float32)
+    notes = styles[rng.integers(num_styles, size=num_whiskies)]
+    notes += rng.gamma(0.3, 1.0, size=(num_whiskies, num_notes)).astype(np.float32)
+    np.clip(np.rint(notes, out=notes), 0, 10, out=notes)
+
+    ids = np.arange(num_whiskies)
+    metadata = pd.DataFrame(
+        {
+            "whisky_url": "",
+            "distillery_name_inner": [f"Distillery {i % 500}" for i in ids],
+            "country": rng.choice(COUNTRIES, size=num_whiskies),
+            "region": rng.choice(REGIONS, size=num_whiskies),
+            "whisky_type": "Single Malt Whisky",
+            "bottler": "Original bottling",
+            "whisky_link": "",
+            "whisky_name_suffix": "",
+            "whisky_rating": rng.uniform(3, 5, size=num_whiskies).round(1),
+            "num_ratings": rng.integers(0, 2000, size=num_whiskies),
+            "num_reviews": rng.integers(0, 1000, size=num_whiskies),
+            "whisky_age": rng.choice(
+                ["NAS", "10", "12", "16", "18"], size=num_whiskies
+            ),
+            "alcohol_pct": rng.choice([40.0, 43.0, 46.0, 57.1], size=num_whiskies),
+            "full_name": [f"Whisky {i}" for i in ids],
+        }
+    )
+    for column in POST_TREATMENT_COLUMNS:
+        metadata[column] = rng.integers(0, 2, size=num_whiskies)
+
+    note_columns = [f"Note_{i}" for i in range(num_notes)]
+    return pd.concat(
+        [metadata, pd.DataFrame(notes, columns=note_columns)], axis=1, copy=False
+    )
+
+
+def summarize(scenario, catalog, latencies, num_items, peak_bytes):
+    """
+    Summarize the latencies of a scenario.
+
+    Parameters:
+    scenario (str): Scenario name.
+    catalog (str): Catalog size.
+    latencies (list of float): Duration of each call in seconds.
+    num_items (int): Number of recommendations served by all the calls.
+    peak_bytes (int): Peak memory traced during the scenario.
+
+    Returns:
+    dict: Latency percentiles in milliseconds, throughput in recommendations per second and
+          peak memory in megabytes.
+    """
+    latencies_ms = np.array(latencies) * 1000
+    total_seconds = float(np.sum(latencies))
+    return {
+        "catalog": catalog,
+        "scenario": scenario,
+        "calls": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+        "throughput_per_s": (
+            round(num_items / total_seconds, 2) if total_seconds else None
+        ),
+        "peak_memory_mb": round(peak_bytes / 2**20, 2),
+    }
+
+
+def time_calls(function, arguments, reset):
+    """
+    Call a function once per argument and time each call, then trace the peak memory of a
+    second run of the first calls.
+
+    Parameters:
+    function (callable): Function to time.
+    arguments (list): One argument per call.
+    reset (callable): Called before each run, e.g. to clear the result cache.
+
+    Returns:
+    tuple: Call durations in seconds and peak traced memory in bytes.
+    """
+    reset()
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - start)
+
+    reset()
+    tracemalloc.start()
+    for argument in arguments[:MEMORY_TRACED_CALLS]:
+        function(argument)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, peak_bytes
+
+
+def run_catalog(catalog, store_dir, num_queries, batch_size, k=10, seed=1):
+    """
+    Run every scenario on one synthetic catalog.
+
+    Parameters:
+    catalog (str): Catalog size, e.g. "10000x300".
+    store_dir (str): Directory the catalog's feature store is written to.
+    num_queries (int): Number of calls per scenario.
+    batch_size (int): Number of selections per recommend_many call.
+    k (int): Number of recommendations per selection.
+    seed (int): Seed of the random selections.
+
+    Returns:
+    list of dict: Summary of each scenario.
+    """
+    num_whiskies, num_notes = parse_catalog(catalog)
+    catalog_df = make_synthetic_catalog(num_whiskies, num_notes)
+    names = catalog_df["full_name"].to_numpy()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    write_feature_store(catalog_df, store_dir)
+    build_neighbour_table(store_dir)
+    recommender = get_recommender(store_dir)
+    load_seconds = time.perf_counter() - start
+    _, load_peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del catalog_df
+
+    rng = np.random.default_rng(seed)
+    selections = [
+        names[rng.choice(num_whiskies, size=3, replace=False)].tolist()
+        for _ in range(num_queries)
+    ]
+    singles = [[name] for name in names[rng.choice(num_whiskies, size=num_queries)]]
+
+    scenarios = {
+        "recommend_whisky": (
+            lambda selection: recommend_whisky(store_dir, selection, k=k),
+            selections,
+        ),
+        "recommend_cached": (
+            lambda selection: recommend_whisky(store_dir, selection, k=k),
+            [selections[0]] * num_queries,
+        ),
+        "recommend_approx": (
+            lambda selection: recommend_whisky(
+                store_dir, selection, k=k, mode="approx"
+            ),
+            selections,
+        ),
+        "recommend_filtered": (
+            lambda selection: recommend_whisky(
+                store_dir, selection, k=k, filters={"region": "Islay"}
+            ),
+            selections,
+        ),
+        "similar_neighbours": (
+            lambda selection: recommend_whisky(store_dir, selection, k=k),
+            singles,
+        ),
+        "recommend_many": (
+            lambda batch: recommender.recommend_many(batch, k=k),
+            [
+                selections[start : start + batch_size]
+                for start in range(0, num_queries, batch_size)
+            ],
+        ),
+    }
+
+    # Warm up the ANN index so that its build is not timed as a query
+    recommend_whisky(store_dir, selections[0], k=k, mode="approx")
+
+    # Every scenario serves num_queries recommendations
+    results = []
+    for scenario, (function, arguments) in scenarios.items():
+        latencies, peak_bytes = time_calls(function, arguments, recommender.cache.clear)
+        results.append(summarize(scenario, catalog, latencies, num_queries, peak_bytes))
+
+    application_module = load_application(store_dir)
+    results.append(run_flask_scenario(catalog, application_module, selections, k))
+    results.append(run_asgi_scenario(catalog, application_module, selections, k))
+    for result in results:
+        result["load_seconds"] = round(load_seconds, 3)
+        result["load_peak_memory_mb"] = round(load_peak_bytes / 2**20, 2)
+    return results
+
+
+def load_application(store_dir):
+    """
+    Import the Flask app module, or reload it, so that it serves the given feature store.
+
+    Returns:
+    module: The `application` module.
+    """
+    os.environ["WHISKY_DATA_FILE"] = store_dir
+    if "application" in sys.modules:
+        return importlib.reload(sys.modules["application"])
+    return importlib.import_module("application")
+
+
+def run_flask_scenario(catalog, application_module, selections, k):
+    """
+    Time the /recommend endpoint through the Flask test client.
+
+    Returns:
+    dict: Summary of the scenario.
+    """
+    client = application_module.application.test_client()
+
+    def post(selection):
+        response = client.post("/recommend", json={"whisky_names": selection, "k": k})
+        assert response.status_code == 200, response.get_json()
+
+    latencies, peak_bytes = time_calls(
+        post, selections, application_module.dataset.current().cache.clear
+    )
+    return summarize("flask_recommend", catalog, latencies, len(selections), peak_bytes)
+
+
+def run_asgi_scenario(catalog, application_module, selections, k):
+    """
+    Time the /recommend endpoint of the asynchronous app, serving the same dataset as the
+    Flask app, with requests sent one at a time on a single event loop.
+
+    Returns:
+    dict: Summary of the scenario.
+    """
+    app = AsyncWhiskyApp(
+        application_module.dataset,
+        application_module.feedback_sink,
+        application_module.catalog,
+        static_folder=application_module.application.static_folder,
+        max_recommendations=application_module.MAX_RECOMMENDATIONS,
+    )
+    loop = asyncio.new_event_loop()
+
+    async def send_request(selection):
+        body = json.dumps({"whisky_names": selection, "k": k}).encode("utf-8")
+        scope = {"type": "http", "method": "POST", "path": "/recommend", "headers": []}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app(scope, receive, send)
+        assert messages[0]["status"] == 200, messages[1]["body"]
+
+    def post(selection):
+        loop.run_until_complete(send_request(selection))
+
+    try:
+        latencies, peak_bytes = time_calls(
+            post, selections, application_module.dataset.current().cache.clear
+        )
+    finally:
+        app.scoring_executor.shutdown()
+        loop.close()
+    return summarize("asgi_recommend", catalog, latencies, len(selections), peak_bytes)
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare benchmark results to a baseline run.
+
+    Parameters:
+    results (list of dict): Scenario summaries of the current run.
+    baseline (list of dict): Scenario summaries of the baseline run.
+    tolerance (float): Allowed relative slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+    list of dict: One entry per regression, with the catalog, scenario, metric, baseline
+                  value and current value.
+    """
+    baseline_by_key = {(item["catalog"], item["scenario"]): item for item in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_by_key.get((result["catalog"], result["scenario"]))
+        if reference is None:
+            continue
+        checks = [
+            ("p95_ms", result["p95_ms"] > reference["p95_ms"] * (1 + tolerance)),
+            (
+                "throughput_per_s",
+                result["throughput_per_s"] is not None
+                and reference["throughput_per_s"] is not None
+                and result["throughput_per_s"]
+                < reference["throughput_per_s"] * (1 - tolerance),
+            ),
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append(
+                    {
+                        "catalog": result["catalog"],
+                        "scenario": result["scenario"],
+                        "metric": metric,
+                        "baseline": reference[metric],
+                        "current": result[metric],
+                    }
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recommendation path on synthetic catalogs."
+    )
+    parser.add_argument("--catalogs", nargs="+", default=DEFAULT_CATALOGS)
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Optional JSON output file")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare to")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for catalog in args.catalogs:
+            store_dir = os.path.join(work_dir, f"catalog_{catalog}")
+            catalog_results = run_catalog(
+                catalog, store_dir, args.queries, args.batch_size, k=args.k
+            )
+            results.extend(catalog_results)
+            for result in catalog_results:
+                print(
+                    f"{catalog:>14} {result['scenario']:<20} "
+                    f"p50={result['p50_ms']:8.3f} ms  p95={result['p95_ms']:8.3f} ms  "
+                    f"p99={result['p99_ms']:8.3f} ms  "
+                    f"{result['throughput_per_s']:>10} rec/s  "
+                    f"peak={result['peak_memory_mb']:.1f} MB"
+                )
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['catalog']} {regression['scenario']} "
+                f"{regression['metric']}: {regression['baseline']} -> "
+                f"{regression['current']}"
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import threading
+from urllib.parse import urlencode
+
+from scripts.feedback.feedback_sink import FeedbackSink
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+from scripts.monitoring.startup import StartupReport
+from scripts.serving.asgi_app import AsyncWhiskyApp
+from scripts.serving.catalog import Catalog
+from scripts.serving.validation import parse_feedback, parse_recommend_request
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+SAMPLE_FEATURES_FILE = os.path.join(
+    ROOT_DIR, "data", "processed", "2023_09", "whisky_features_100.csv"
+)
+FRONTEND_DIR = os.path.join(ROOT_DIR, "frontend")
+
+
+class StaticDataset:
+    def __init__(self, recommender):
+        self.recommender = recommender
+
+    def current(self):
+        return self.recommender
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.batches = []
+
+    def write(self, csv_content):
+        self.batches.append(csv_content)
+
+
+class BlockingRecommender:
+    dataset_version = ranking_version = "blocking"
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def canonical_selection(self, user_whiskies):
+        return tuple(sorted(set(user_whiskies)))
+
+    def recommend(self, user_whiskies, k, mode, filters):
+        self.started.set()
+        self.release.wait(5)
+        return {"Recommended Whisky": "Oban 14"}
+
+
+def make_app(recommender=None, **options):
+    """
+    Build the asynchronous app over the sample dataset.
+
+    Returns:
+        AsyncWhiskyApp: app with a recording feedback writer
+    """
+    recommender = recommender or WhiskyRecommender(SAMPLE_FEATURES_FILE)
+    return AsyncWhiskyApp(
+        StaticDataset(recommender),
+        FeedbackSink(RecordingWriter()),
+        Catalog.from_csv(os.path.join(FRONTEND_DIR, "distillery_data.csv")),
+        static_folder=FRONTEND_DIR,
+        max_recommendations=50,
+        **options,
+    )
+
+
+async def call(app, method, path, payload=None, headers=()):
+    """
+    Send one HTTP request to an ASGI app.
+
+    Returns:
+        tuple: status, response headers and body
+    """
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string.encode(),
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+    }
+    received = iter([{"type": "http.request", "body": body, "more_body": False}])
+    messages = []
+
+    async def receive():
+        return next(received)
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    response_headers = {
+        name.decode(): value.decode() for name, value in messages[0]["headers"]
+    }
+    return messages[0]["status"], response_headers, messages[1]["body"]
+
+
+class TestAsyncWhiskyApp:
+
+    def test_recommend_matches_engine(self):
+        """
+        Test that /recommend answers like the engine, and rejects invalid requests with the
+        messages of the Flask app.
+        """
+        app = make_app()
+        recommender = app.dataset.current()
+        names = list(recommender.names[:3])
+
+        status, headers, body = asyncio.run(
+            call(app, "POST", "/recommend", {"whisky_names": names, "k": 3})
+        )
+        assert status == 200
+        assert headers["content-type"] == "application/json"
+        assert json.loads(body)["recommended_whisky"] == json.loads(
+            json.dumps(recommender.recommend(names, k=3))
+        )
+
+        for payload in [{"whisky_names": "Oban"}, {"whisky_names": names, "k": 0}, []]:
+            status, _, body = asyncio.run(call(app, "POST", "/recommend", payload))
+            assert status == 400
+            assert json.loads(body)["error"] == parse_recommend_request(payload, 50)[1]
+
+        status, _, _ = asyncio.run(call(app, "PUT", "/recommend"))
+        assert status == 405
+        app.close()
+
+    def test_conditional_get_recommend(self):
+        """
+        Test that GET /recommend redirects to its canonical URL, whose response carries a
+        strong ETag answered with a 304, and that POST responses carry the same ETag.
+        """
+        app = make_app()
+        names = list(app.dataset.current().names[:2])
+        query = urlencode(
+            [("whisky", names[1]), ("whisky", names[0].upper()), ("k", 3)]
+        )
+
+        status, headers, _ = asyncio.run(call(app, "GET", f"/recommend?{query}"))
+        assert status == 302
+        canonical_url = headers["location"]
+        assert canonical_url == "/recommend?" + urlencode(
+            [("whisky", name) for name in sorted(names)] + [("k", 3), ("mode", "exact")]
+        )
+
+        status, headers, body = asyncio.run(call(app, "GET", canonical_url))
+        assert status == 200
+        assert headers["cache-control"].startswith("public, max-age=")
+        etag = headers["etag"]
+        assert len(json.loads(body)["recommended_whisky"]["Top Recommendations"]) == 3
+
+        status, _, body = asyncio.run(
+            call(app, "GET", canonical_url, headers=[("If-None-Match", etag)])
+        )
+        assert status == 304 and body == b""
+
+        status, headers, _ = asyncio.run(
+            call(app, "POST", "/recommend", {"whisky_names": names[::-1], "k": 3})
+        )
+        assert status == 200
+        assert headers["etag"] == etag
+        assert headers["content-location"] == canonical_url
+        app.close()
+
+    def test_rejects_requests_beyond_the_concurrency_limit(self):
+        """
+        Test that requests beyond `max_concurrency` get a 429 at once instead of queueing.
+        """
+        recommender = BlockingRecommender()
+        app = make_app(recommender, max_concurrency=1, scoring_threads=1)
+        payload = {"whisky_names": ["Oban 14"]}
+
+        async def scenario():
+            first = asyncio.create_task(call(app, "POST", "/recommend", payload))
+            for _ in range(5000):
+                if recommender.started.is_set() or first.done():
+                    break
+                await asyncio.sleep(0.001)
+            assert recommender.started.is_set()
+            rejected = await call(app, "POST", "/recommend", payload)
+            recommender.release.set()
+            return await first, rejected
+
+        (first_status, _, _), (status, headers, _) = asyncio.run(scenario())
+        assert first_status == 200
+        assert status == 429
+        assert headers["retry-after"] == "1"
+        assert app.rejected == 1 and app.in_flight == 0
+        app.close()
+
+    def test_submit_feedback(self):
+        """
+        Test that valid feedback is queued for the sink and incomplete feedback is rejected.
+        """
+        app = make_app()
+        feedback = {
+            "whisky1": "Ardbeg 10 TEN",
+            "whisky2": "Oban 14",
+            "whisky3": "Talisker 10",
+            "recommendedWhisky": "Lagavulin 16",
+            "feedback1": "yes",
+            "timestamp": "2024-05-01T12:00:00.000Z",
+        }
+        status, _, _ = asyncio.run(call(app, "POST", "/submitFeedback", feedback))
+        assert status == 200
+
+        incomplete = {"whisky1": "Oban 14"}
+        status, _, body = asyncio.run(call(app, "POST", "/submitFeedback", incomplete))
+        assert status == 400
+        assert json.loads(body)["error"] == parse_feedback(incomplete)[1]
+
+        app.close()
+        assert app.feedback_sink.written == 1
+
+    def test_static_files_and_catalog(self):
+        """
+        Test that the frontend and the catalog are served, and unknown paths are not found.
+        """
+        app = make_app()
+        status, headers, body = asyncio.run(call(app, "GET", "/"))
+        assert status == 200
+        assert headers["content-type"] == "text/html"
+        with open(os.path.join(FRONTEND_DIR, "index.html"), "rb") as file:
+            assert body == file.read()
+
+        status, headers, _ = asyncio.run(call(app, "GET", "/catalog"))
+        assert status == 200
+        status, _, _ = asyncio.run(
+            call(app, "GET", "/catalog", headers=[("If-None-Match", headers["etag"])])
+        )
+        assert status == 304
+
+        for path in ["/missing.js", "/../application.py"]:
+            status, _, _ = asyncio.run(call(app, "GET", path))
+            assert status == 404
+        app.close()
+
+    def test_startup_report(self):
+        """
+        Test that the startup report is served and records the first request.
+        """
+        report = StartupReport(started_at=0.0)
+        app = make_app(startup_report=report)
+        status, _, body = asyncio.run(call(app, "GET", "/startup"))
+        assert status == 200
+        assert json.loads(body)["time_to_first_request_seconds"] > 0
+        app.close()
@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.modeling.attribute_index import AttributeIndex, canonical_filters
+from scripts.modeling.whisky_recommender_model import (
+    STAGE_SECONDS_METRIC,
+    WhiskyRecommender,
+)
+from scripts.monitoring.metrics import REGISTRY
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+@pytest.fixture
+def whisky_df():
+    """
+    Fixture to load the sample processed features.
+
+    Returns:
+        pandas.DataFrame: Loaded DataFrame
+    """
+    return pd.read_csv(SAMPLE_FEATURES_FILE)
+
+
+@pytest.fixture
+def attribute_index(whisky_df):
+    """
+    Fixture to build the attribute index of the sample processed features.
+
+    Returns:
+        AttributeIndex: Index over the sample metadata
+    """
+    return AttributeIndex(
+        {column: whisky_df[column].to_numpy() for column in whisky_df}
+    )
+
+
+class TestAttributeIndex:
+
+    def test_masks_match_pandas_filtering(self, whisky_df, attribute_index):
+        """
+        Test that combined filters select the same rows as pandas boolean filtering.
+        """
+        mask = attribute_index.mask(
+            {
+                "region": ["Islay", "Speyside"],
+                "min_abv": 43,
+                "max_abv": 46,
+                "min_rating": 4.0,
+                "post_treatment": "Chill filtration - Without",
+            }
+        )
+        expected = (
+            whisky_df["region"].isin(["Islay", "Speyside"])
+            & whisky_df["alcohol_pct"].between(43, 46)
+            & (whisky_df["whisky_rating"] >= 4.0)
+            & (whisky_df["Chill filtration - Without"] == 1)
+        )
+        np.testing.assert_array_equal(mask, expected.to_numpy())
+
+    def test_no_filters(self, attribute_index):
+        """
+        Test that missing filters do not restrict the recommendations.
+        """
+        assert attribute_index.mask(None) is None
+        assert attribute_index.mask({}) is None
+
+    @pytest.mark.parametrize(
+        "filters",
+        [
+            {"colour": "amber"},
+            {"min_abv": "strong"},
+            {"post_treatment": "Not a flag"},
+            ["region", "Islay"],
+        ],
+    )
+    def test_invalid_filters_raise(self, attribute_index, filters):
+        """
+        Test that unknown filters and invalid values are rejected.
+        """
+        with pytest.raises(ValueError):
+            attribute_index.mask(filters)
+
+    def test_canonical_filters_ignore_order(self):
+        """
+        Test that filters differing only by order share a cache key.
+        """
+        assert canonical_filters(
+            {"region": ["Islay", "Speyside"], "min_abv": 43}
+        ) == canonical_filters({"min_abv": 43, "region": ["Speyside", "Islay"]})
+
+    def test_canonical_filters_keep_value_types(self):
+        """
+        Test that values differing only by type get different cache keys, so that an
+        invalid filter value is never answered from the cache of a valid one.
+        """
+        assert canonical_filters({"min_abv": 46}) != canonical_filters(
+            {"min_abv": "46"}
+        )
+        assert canonical_filters({"min_abv": 46}) != canonical_filters(
+            {"min_abv": 46.0}
+        )
+
+    def test_filtered_recommendations(self, whisky_df):
+        """
+        Test that filtered recommendations are the best eligible whiskies, for single and
+        batched selections.
+        """
+        recommender = WhiskyRecommender(SAMPLE_FEATURES_FILE)
+        filters = {"region": "Islay"}
+        selection = ["Highland Park 12"]
+
+        unfiltered = recommender.recommend(selection, k=len(recommender))
+        islay = set(whisky_df.loc[whisky_df["region"] == "Islay", "full_name"])
+        expected = [
+            item["Whisky"]
+            for item in unfiltered["Top Recommendations"]
+            if item["Whisky"] in islay
+        ][:5]
+
+        result = recommender.recommend(selection, k=5, filters=filters)
+        assert [item["Whisky"] for item in result["Top Recommendations"]] == expected
+
+        batch_result = recommender.recommend_many([selection], k=5, filters=filters)[0]
+        assert batch_result["Top Recommendations"] == result["Top Recommendations"]
+
+    def test_filtered_approximate_recommendations_fall_back_to_exact(self):
+        """
+        Test that approximate recommendations scan all the eligible whiskies when the
+        probed clusters hold fewer than k of them, for single and batched selections.
+        """
+        recommender = WhiskyRecommender(SAMPLE_FEATURES_FILE, ann_n_probe=1)
+        filters = {"region": "Islay"}
+        selection = ["Highland Park 12"]
+
+        exact = recommender.recommend(selection, k=5, filters=filters)
+        result = recommender.recommend(selection, k=5, mode="approx", filters=filters)
+        batch_result = recommender.recommend_many(
+            [selection], k=5, mode="approx", filters=filters
+        )[0]
+        assert len(exact["Top Recommendations"]) == 5
+        assert result["Top Recommendations"] == exact["Top Recommendations"]
+        assert batch_result["Top Recommendations"] == exact["Top Recommendations"]
+
+    def test_filtering_is_timed_as_its_own_stage(self):
+        """
+        Test that building the filter mask is timed apart from the name lookup.
+        """
+        recommender = WhiskyRecommender(SAMPLE_FEATURES_FILE, cache_size=0)
+        recommender.recommend(["Highland Park 12"], k=5, filters={"region": "Islay"})
+        stages = {
+            histogram["labels"]["stage"]
+            for histogram in REGISTRY.snapshot()["histograms"]
+            if histogram["name"] == STAGE_SECONDS_METRIC
+        }
+        assert {"filtering", "name_lookup"} <= stages
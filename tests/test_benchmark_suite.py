@@ -0,0 +1,66 @@
+from tests.benchmarks.bench_recommendation import (
+    compare_results,
+    make_synthetic_catalog,
+)
+
+
+class TestBenchmarkSuite:
+
+    def test_synthetic_catalog_matches_processed_schema(self):
+        """
+        Test that synthetic catalogs have the metadata columns and integer note scores of the
+        processed features.
+        """
+        catalog_df = make_synthetic_catalog(200, 30)
+        note_columns = [c for c in catalog_df.columns if c.startswith("Note_")]
+        assert len(catalog_df) == 200
+        assert len(note_columns) == 30
+        assert catalog_df.columns[13] == "full_name"
+        assert "Chill filtration - Without" in catalog_df.columns
+        notes = catalog_df[note_columns].to_numpy()
+        assert notes.min() >= 0 and notes.max() <= 10
+        assert (notes == notes.round()).all()
+
+    def test_regressions_are_flagged(self):
+        """
+        Test that only slowdowns beyond the tolerance are reported.
+        """
+        baseline = [
+            {
+                "catalog": "1000x100",
+                "scenario": "recommend_whisky",
+                "p95_ms": 1.0,
+                "throughput_per_s": 1000.0,
+            },
+            {
+                "catalog": "1000x100",
+                "scenario": "recommend_many",
+                "p95_ms": 10.0,
+                "throughput_per_s": 5000.0,
+            },
+        ]
+        results = [
+            {
+                "catalog": "1000x100",
+                "scenario": "recommend_whisky",
+                "p95_ms": 1.1,
+                "throughput_per_s": 950.0,
+            },
+            {
+                "catalog": "1000x100",
+                "scenario": "recommend_many",
+                "p95_ms": 13.0,
+                "throughput_per_s": 3000.0,
+            },
+            {
+                "catalog": "1000x100",
+                "scenario": "flask_recommend",
+                "p95_ms": 5.0,
+                "throughput_per_s": 100.0,
+            },
+        ]
+        regressions = compare_results(results, baseline, tolerance=0.2)
+        assert [(r["scenario"], r["metric"]) for r in regressions] == [
+            ("recommend_many", "p95_ms"),
+            ("recommend_many", "throughput_per_s"),
+        ]
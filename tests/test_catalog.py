@@ -0,0 +1,70 @@
+import csv
+import gzip
+import json
+import os
+
+from scripts.serving.catalog import Catalog, PrefixIndex
+
+DISTILLERY_DATA_FILE = os.path.join(
+    os.path.dirname(__file__), "..", "frontend", "distillery_data.csv"
+)
+
+
+class TestCatalog:
+
+    def test_document_matches_distillery_table(self):
+        """
+        Test that the compressed document maps every distillery to its whiskies.
+        """
+        catalog = Catalog.from_csv(DISTILLERY_DATA_FILE)
+        with open(DISTILLERY_DATA_FILE, newline="", encoding="utf-8") as file:
+            distillery_data = {
+                (row["distillery"], row["whisky_name"]) for row in csv.DictReader(file)
+            }
+
+        document = json.loads(gzip.decompress(catalog.compressed_document))
+        assert document == json.loads(catalog.document)
+        assert set(document["distilleries"]) == {
+            distillery for distillery, _ in distillery_data
+        }
+        assert len(catalog) == len(distillery_data)
+        assert "12 0,2 Liter" in document["distilleries"]["Bunnahabhain"]
+
+    def test_etag_follows_content(self):
+        """
+        Test that the ETag is stable for the same table and changes with its content.
+        """
+        distillery_data = [("Ardbeg", "10 TEN"), ("Oban", "14")]
+        catalog = Catalog(distillery_data)
+        assert Catalog(list(distillery_data)).etag == catalog.etag
+        assert Catalog([("Ardbeg", "10 TEN"), ("Oban", "18")]).etag != catalog.etag
+
+    def test_autocomplete(self):
+        """
+        Test that queries complete distilleries and full names from the start of any word,
+        ignoring case and accents.
+        """
+        catalog = Catalog.from_csv(DISTILLERY_DATA_FILE)
+
+        completions = catalog.autocomplete("ARD")
+        assert completions["distilleries"] == ["Ardbeg", "Ardmore"]
+        assert {item["distillery"] for item in completions["whiskies"]} == {
+            "Ardbeg",
+            "Ardmore",
+        }
+
+        completions = catalog.autocomplete("uigé")
+        assert [item["full_name"] for item in completions["whiskies"]] == [
+            "Ardbeg Uigeadail"
+        ]
+        assert len(catalog.autocomplete("12", limit=3)["whiskies"]) == 3
+        assert catalog.autocomplete("  ") == {"distilleries": [], "whiskies": []}
+
+    def test_prefix_index(self):
+        """
+        Test that each value is returned once, in key order, up to the limit.
+        """
+        index = PrefixIndex([("oban 14", 1), ("14", 1), ("oa", 2), ("ob", 3), ("p", 4)])
+        assert index.search("o") == [2, 3, 1]
+        assert index.search("ob", limit=1) == [3]
+        assert index.search("x") == []
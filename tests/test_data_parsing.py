@@ -2,6 +2,22 @@ import pandas as pd
 import pytest
 import os
 
+from scripts.processing.data_parsing_and_cleaning import (
+    clean_features,
+    discover_vocabularies,
+    load_and_merge_data,
+    load_processing_state,
+    one_hot_encode_average_notes,
+    one_hot_encode_post_treatment,
+    parse_literal_cells,
+    parse_raw_cells,
+    process_in_chunks,
+    process_incrementally,
+    process_whisky_details,
+    record_hashes,
+    save_processing_state,
+)
+
 CSV_DIRECTORY = "./"
 
 
@@ -79,3 +95,315 @@ class TestDataColumns:
             expected_columns (list): Expected column names
         """
         assert df.columns.to_list() == expected_columns
+
+
+def make_details():
+    """
+    Build raw whisky details in the scraped format.
+
+    Returns:
+        pandas.DataFrame: Raw details of three whiskies
+    """
+    return pd.DataFrame(
+        {
+            "post_treatment": [
+                "['Chill filtration - With', 'Artifical colouring - With']",
+                None,
+                "['Chill filtration - With']",
+            ],
+            "nosing_notes": [
+                "{'Peat Smoke:': '100', 'Sweet:': '50'}",
+                "{}",
+                "{\"Nature's Notes:\": '45'}",
+            ],
+            "tasting_notes": [
+                "{'Peat Smoke:': '80', 'Sweet:': '25'}",
+                None,
+                "{'Sweet:': '30'}",
+            ],
+            "finish_notes": ["{'Peat Smoke:': '60'}", "{'Oak:': '30'}", "{}"],
+        }
+    )
+
+
+class TestEncoding:
+
+    def test_parse_literal_cells(self):
+        """
+        Test that cells are parsed as literals, including strings with quotes, and that
+        anything else is rejected instead of executed.
+        """
+        cells = parse_literal_cells(make_details()["nosing_notes"])
+        assert cells == [
+            {"Peat Smoke:": "100", "Sweet:": "50"},
+            {},
+            {"Nature's Notes:": "45"},
+        ]
+        with pytest.raises(ValueError):
+            parse_literal_cells(pd.Series(["__import__('os').getcwd()"]))
+
+    def test_one_hot_encode_post_treatment(self):
+        """
+        Test that every post-treatment value becomes a 0/1 column, in sorted order.
+        """
+        encoded = one_hot_encode_post_treatment(make_details())
+        assert encoded.columns[-2:].to_list() == [
+            "Artifical colouring - With",
+            "Chill filtration - With",
+        ]
+        assert encoded["Chill filtration - With"].to_list() == [1, 0, 1]
+        assert encoded["Artifical colouring - With"].to_list() == [1, 0, 0]
+
+    def test_one_hot_encode_average_notes(self):
+        """
+        Test that each note column holds the rounded mean of the nosing, tasting and
+        finish scores divided by 10, missing scores counting as 0.
+        """
+        details = make_details()
+        parsed_cells = parse_raw_cells(details)
+        encoded = one_hot_encode_average_notes(details, parsed_cells)
+
+        assert encoded.columns[-4:].to_list() == [
+            "Note_Nature's_Notes",
+            "Note_Oak",
+            "Note_Peat_Smoke",
+            "Note_Sweet",
+        ]
+        assert encoded["Note_Peat_Smoke"].to_list() == [8, 0, 0]
+        assert encoded["Note_Sweet"].to_list() == [2, 0, 1]
+        assert encoded["Note_Oak"].to_list() == [0, 1, 0]
+        assert encoded["Note_Nature's_Notes"].to_list() == [0, 0, 2]
+
+        # A fixed vocabulary keeps the same columns whatever the rows hold
+        encoded = one_hot_encode_average_notes(
+            make_details(), parsed_cells, vocabulary=["Sweet:", "Vanilla:"]
+        )
+        assert encoded.columns[-2:].to_list() == ["Note_Sweet", "Note_Vanilla"]
+        assert encoded["Note_Vanilla"].to_list() == [0, 0, 0]
+
+    def test_full_name(self):
+        """
+        Test that the full name leaves out a missing age or suffix.
+        """
+        details = pd.DataFrame(
+            {
+                "distillery_name_inner": ["Lagavulin", "Ardbeg", "Oban"],
+                "whisky_age_inner": ["16 Years", None, "14 Years"],
+                "alcohol_pct_inner": ["43%", "54.2%", "43%"],
+                "num_ratings": ["(1,204)", "(10)", "(3)"],
+                "num_reviews": ["12", None, "x"],
+                "whisky_name_suffix": [None, "Uigeadail", "Distillers Edition"],
+            }
+        )
+        cleaned = clean_features(details)
+        # A missing age leaves two spaces, as in the names already in the dataset
+        assert cleaned["full_name"].to_list() == [
+            "Lagavulin 16",
+            "Ardbeg  Uigeadail",
+            "Oban 14 Distillers Edition",
+        ]
+        assert cleaned["num_ratings"].to_list() == [1204.0, 10.0, 3.0]
+        assert cleaned["num_reviews"].to_list() == [12, 0, 0]
+
+
+def make_records():
+    """
+    Build merged raw records, as returned by `load_and_merge_data`.
+
+    Returns:
+        pandas.DataFrame: Raw records of three whiskies
+    """
+    records = make_details()
+    records.insert(0, "whisky_url", ["/lagavulin-16", "/ardbeg", "/oban-14"])
+    records["distillery_name_inner"] = ["Lagavulin", "Ardbeg", "Oban"]
+    records["whisky_age_inner"] = ["16 Years", None, "14 Years"]
+    records["alcohol_pct_inner"] = ["43%", "54.2%", "43%"]
+    records["whisky_name_suffix"] = [None, "Uigeadail", None]
+    records["num_ratings"] = ["(1,204)", "(10)", "(3)"]
+    records["num_reviews"] = [12, 0, 1]
+    return records
+
+
+def write_run(records, output_path, state_path):
+    """
+    Process raw records in full, and write their features and state.
+
+    Parameters:
+        records (pandas.DataFrame): Raw records
+        output_path (str): Features CSV file
+        state_path (str): State file
+    """
+    processed, post_treatment_vocabulary, note_vocabulary = process_whisky_details(
+        records.copy()
+    )
+    processed.to_csv(output_path, index=False)
+    save_processing_state(
+        state_path,
+        records,
+        record_hashes(records),
+        post_treatment_vocabulary,
+        note_vocabulary,
+    )
+
+
+class TestIncrementalProcessing:
+
+    def test_record_hashes(self):
+        """
+        Test that a record's hash only changes with its own content.
+        """
+        records = make_records()
+        hashes = record_hashes(records)
+        assert len(set(hashes)) == 3
+
+        records.loc[1, "finish_notes"] = "{'Oak:': '40'}"
+        changed_hashes = record_hashes(records)
+        assert [a == b for a, b in zip(hashes, changed_hashes)] == [True, False, True]
+
+    def test_incremental_run_matches_full_run(self, tmp_path):
+        """
+        Test that merging the new and changed records into the previous features gives
+        the features of a full run, including the column of a new note.
+        """
+        output_path = str(tmp_path / "features.csv")
+        state_path = str(tmp_path / "state.json")
+        write_run(make_records(), output_path, state_path)
+
+        # One record removed, one changed with a new note, one added
+        records = make_records().iloc[1:]
+        records.loc[2, "nosing_notes"] = (
+            "{\"Nature's Notes:\": '45', 'Sea Salt:': '90'}"
+        )
+        records = pd.concat([records, make_records().iloc[[0]]]).reset_index(drop=True)
+        records.loc[2, "whisky_url"] = "/lagavulin-8"
+
+        processed, _, note_vocabulary, counts = process_incrementally(
+            records,
+            record_hashes(records),
+            load_processing_state(state_path),
+            output_path,
+        )
+        assert counts == {"new": 1, "changed": 1, "unchanged": 1, "removed": 1}
+        assert "Sea Salt:" in note_vocabulary
+
+        expected, _, _ = process_whisky_details(records.copy())
+        pd.testing.assert_frame_equal(processed, expected)
+
+    def test_incremental_run_keeps_unused_note_columns(self, tmp_path):
+        """
+        Test that the column of a note no longer scraped stays, with zeros.
+        """
+        output_path = str(tmp_path / "features.csv")
+        state_path = str(tmp_path / "state.json")
+        write_run(make_records(), output_path, state_path)
+
+        records = make_records()
+        records.loc[1, "finish_notes"] = "{}"
+        processed, _, _, counts = process_incrementally(
+            records,
+            record_hashes(records),
+            load_processing_state(state_path),
+            output_path,
+        )
+        assert counts["changed"] == 1
+        assert processed["Note_Oak"].to_list() == [0, 0, 0]
+
+    def test_incremental_run_rejects_other_raw_columns(self, tmp_path):
+        """
+        Test that records with other raw columns than the last run are rejected, so that
+        they are processed in full.
+        """
+        output_path = str(tmp_path / "features.csv")
+        state_path = str(tmp_path / "state.json")
+        write_run(make_records(), output_path, state_path)
+
+        records = make_records()
+        records["bottler"] = "Distillery Bottling"
+        with pytest.raises(ValueError):
+            process_incrementally(
+                records,
+                record_hashes(records),
+                load_processing_state(state_path),
+                output_path,
+            )
+
+    def test_load_processing_state(self, tmp_path):
+        """
+        Test that a missing or unreadable state is ignored.
+        """
+        state_path = tmp_path / "state.json"
+        assert load_processing_state(str(state_path)) is None
+        state_path.write_text("{not json")
+        assert load_processing_state(str(state_path)) is None
+
+
+def write_raw_files(directory, records):
+    """
+    Write raw records as a details CSV file and a main page CSV file.
+
+    Parameters:
+        directory (pathlib.Path): Destination directory
+        records (pandas.DataFrame): Merged raw records, as built by `make_records`
+
+    Returns:
+        tuple: Paths of the details file and of the main page file
+    """
+    details_path = str(directory / "details.csv")
+    main_page_path = str(directory / "main_page.csv")
+    main_page = records[
+        ["whisky_url", "whisky_name_suffix", "num_ratings", "num_reviews"]
+    ].rename(columns={"whisky_url": "whisky_link"})
+    main_page.insert(2, "whisky_rating", [4.5, 4.0, 3.5])
+    records.drop(columns=["whisky_name_suffix", "num_ratings", "num_reviews"]).to_csv(
+        details_path, index=False
+    )
+    main_page.to_csv(main_page_path, index=False)
+    return details_path, main_page_path
+
+
+class TestStreamingProcessing:
+
+    def test_discover_vocabularies(self, tmp_path):
+        """
+        Test that the vocabularies of the whole details file are discovered, sorted.
+        """
+        details_path, _ = write_raw_files(tmp_path, make_records())
+        post_treatment_vocabulary, note_vocabulary = discover_vocabularies(
+            details_path, chunk_size=1
+        )
+        assert post_treatment_vocabulary == [
+            "Artifical colouring - With",
+            "Chill filtration - With",
+        ]
+        assert note_vocabulary == ["Nature's Notes:", "Oak:", "Peat Smoke:", "Sweet:"]
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 10])
+    def test_chunks_match_in_memory_processing(self, tmp_path, chunk_size):
+        """
+        Test that processing in chunks writes the features of in-memory processing,
+        with the same columns in every chunk and duplicate notes dropped across chunks.
+        """
+        records = make_records()
+        # A whisky sharing the notes of the first one, in a later chunk
+        duplicate = records.iloc[[0]].assign(whisky_url="/lagavulin-16-again")
+        details_path, main_page_path = write_raw_files(tmp_path, records)
+        pd.concat(
+            [pd.read_csv(details_path), duplicate[pd.read_csv(details_path).columns]]
+        ).to_csv(details_path, index=False)
+
+        output_path = str(tmp_path / "features.csv")
+        num_rows, distillery_data = process_in_chunks(
+            details_path, main_page_path, output_path, chunk_size
+        )
+
+        expected, _, _ = process_whisky_details(
+            load_and_merge_data(details_path, main_page_path)
+        )
+        assert num_rows == 3
+        with open(output_path) as file:
+            assert file.read() == expected.to_csv(index=False)
+        assert distillery_data.to_numpy().tolist() == [
+            ["Lagavulin", "16"],
+            ["Ardbeg", "Uigeadail"],
+            ["Oban", "14"],
+        ]
@@ -0,0 +1,109 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from scripts.modeling.dataset_snapshot import (
+    CURRENT_POINTER_FILE,
+    SnapshotReloader,
+    current_snapshot,
+    publish_snapshot,
+)
+from scripts.processing.feature_store import write_feature_store
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+@pytest.fixture
+def snapshot_root(tmp_path):
+    """
+    Fixture to write two feature store snapshots and publish the first one.
+
+    Returns:
+        str: Path to the snapshot root
+    """
+    whisky_df = pd.read_csv(SAMPLE_FEATURES_FILE)
+    write_feature_store(whisky_df.iloc[:50], str(tmp_path / "v1"))
+    write_feature_store(whisky_df, str(tmp_path / "v2"))
+    publish_snapshot(str(tmp_path), "v1")
+    return str(tmp_path)
+
+
+class TestDatasetSnapshot:
+
+    def test_publish_points_at_snapshot(self, snapshot_root):
+        """
+        Test that publishing a snapshot atomically rewrites the pointer file.
+        """
+        assert current_snapshot(snapshot_root) == os.path.join(snapshot_root, "v1")
+        publish_snapshot(snapshot_root, "v2")
+        assert current_snapshot(snapshot_root) == os.path.join(snapshot_root, "v2")
+        assert not os.path.exists(
+            os.path.join(snapshot_root, CURRENT_POINTER_FILE + ".tmp")
+        )
+
+    def test_invalid_snapshot_is_not_published(self, snapshot_root):
+        """
+        Test that the pointer file is left untouched when the snapshot does not load.
+        """
+        with pytest.raises(FileNotFoundError):
+            publish_snapshot(snapshot_root, "missing")
+        assert current_snapshot(snapshot_root) == os.path.join(snapshot_root, "v1")
+
+    def test_reloader_swaps_in_published_snapshot(self, snapshot_root):
+        """
+        Test that the reloader swaps engines once a new snapshot is published, keeping the
+        old engine intact for requests that already hold it.
+        """
+        reloader = SnapshotReloader(snapshot_root, check_interval_seconds=3600)
+        old_recommender = reloader.current()
+        assert len(old_recommender) == 50
+
+        publish_snapshot(snapshot_root, "v2")
+        assert reloader.current() is old_recommender
+
+        assert reloader.maybe_reload()
+        new_recommender = reloader.current()
+        assert new_recommender is not old_recommender
+        assert len(new_recommender) == len(pd.read_csv(SAMPLE_FEATURES_FILE))
+        assert len(old_recommender) == 50
+        assert reloader.reloads == 1
+        reloader.close()
+
+    def test_reloader_loads_snapshots_in_the_background(self, snapshot_root):
+        """
+        Test that new snapshots are loaded by the reloader's thread, started by the first
+        request, while requests keep getting the current engine without waiting.
+        """
+        reloader = SnapshotReloader(snapshot_root, check_interval_seconds=0.01)
+        old_recommender = reloader.current()
+        publish_snapshot(snapshot_root, "v2")
+
+        deadline = time.monotonic() + 10
+        while reloader.current() is old_recommender and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(reloader.current()) == len(pd.read_csv(SAMPLE_FEATURES_FILE))
+        assert reloader.reloads == 1
+        reloader.close()
+
+    def test_failed_reload_keeps_serving_previous_snapshot(self, snapshot_root):
+        """
+        Test that a broken snapshot is logged and the previous engine kept.
+        """
+        reloader = SnapshotReloader(snapshot_root, check_interval_seconds=3600)
+        old_recommender = reloader.current()
+
+        with open(os.path.join(snapshot_root, CURRENT_POINTER_FILE), "w") as file:
+            file.write("missing\n")
+        assert not reloader.maybe_reload()
+        assert reloader.current() is old_recommender
+        assert reloader.failed_reloads == 1
+        reloader.close()
@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+from scripts.processing.feature_store import (
+    MANIFEST_FILE,
+    FeatureStoreSchemaError,
+    is_feature_store,
+    load_feature_store,
+    write_feature_store,
+)
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+@pytest.fixture
+def feature_store(tmp_path):
+    """
+    Fixture to write the sample processed features to a feature store.
+
+    Returns:
+        str: Path to the feature store directory
+    """
+    store_dir = str(tmp_path / "feature_store")
+    write_feature_store(pd.read_csv(SAMPLE_FEATURES_FILE), store_dir)
+    return store_dir
+
+
+class TestFeatureStore:
+
+    def test_round_trip_matches_csv(self, feature_store):
+        """
+        Test that the stored features and metadata match the CSV they were written from.
+        """
+        whisky_df = pd.read_csv(SAMPLE_FEATURES_FILE)
+        note_columns = [c for c in whisky_df.columns if c.startswith("Note_")]
+
+        assert is_feature_store(feature_store)
+        store = load_feature_store(feature_store)
+        assert isinstance(store.features, np.memmap)
+        assert store.feature_names.tolist() == note_columns
+        np.testing.assert_array_equal(
+            store.features, whisky_df[note_columns].to_numpy(dtype=np.float32)
+        )
+        assert store.metadata["full_name"].tolist() == whisky_df["full_name"].tolist()
+        np.testing.assert_allclose(
+            store.metadata["whisky_rating"], whisky_df["whisky_rating"]
+        )
+
+    def test_features_are_selected_by_name(self, feature_store):
+        """
+        Test that requested features are returned in the requested order.
+        """
+        store = load_feature_store(feature_store)
+        names = store.feature_names.tolist()[::-1]
+        selected = load_feature_store(feature_store, feature_names=names)
+        np.testing.assert_array_equal(selected.features, store.features[:, ::-1])
+
+        with pytest.raises(FeatureStoreSchemaError):
+            load_feature_store(feature_store, feature_names=names + ["Note_Unknown"])
+
+    def test_manifest_mismatch_raises(self, feature_store):
+        """
+        Test that a store whose files disagree with the manifest is rejected.
+        """
+        manifest_path = os.path.join(feature_store, MANIFEST_FILE)
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        manifest["num_rows"] += 1
+        with open(manifest_path, "w") as file:
+            json.dump(manifest, file)
+
+        with pytest.raises(FeatureStoreSchemaError):
+            load_feature_store(feature_store)
+
+    def test_recommender_loads_store_like_csv(self, feature_store):
+        """
+        Test that the engine gives the same recommendations from the store as from the CSV.
+        """
+        from_csv = WhiskyRecommender(SAMPLE_FEATURES_FILE, cache_size=0)
+        from_store = WhiskyRecommender(feature_store, cache_size=0)
+
+        assert from_store.feature_names.tolist() == from_csv.feature_names.tolist()
+        np.testing.assert_allclose(
+            from_store.normalized_features, from_csv.normalized_features, rtol=1e-6
+        )
+        selection = from_csv.names[:3].tolist()
+        assert from_store.recommend(selection, k=5) == from_csv.recommend(
+            selection, k=5
+        )
@@ -0,0 +1,220 @@
+import io
+import os
+
+from scripts.feedback.aggregation import (
+    FeedbackAggregator,
+    S3FeedbackArchive,
+    parse_rating,
+)
+from scripts.feedback.feedback_sink import (
+    FeedbackSink,
+    LocalFeedbackWriter,
+    S3FeedbackWriter,
+    serialize_batch,
+)
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+def make_entry(recommended, rating="5", feedback1="know"):
+    """
+    Build a feedback entry for the selection Lagavulin 16 / Ardbeg 10 TEN.
+
+    Returns:
+        dict: feedback entry
+    """
+    return {
+        "whisky1": "Lagavulin 16",
+        "whisky2": "Ardbeg 10 TEN",
+        "whisky3": " ",
+        "recommendedWhisky": recommended,
+        "feedback1": feedback1,
+        "timestamp": "2024-05-01T10:00:00.000Z",
+        "rating": rating,
+        "feedback2": "",
+        "experience": "expert",
+    }
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        keys = sorted(
+            key
+            for bucket, key in self.objects
+            if bucket == Bucket and key.startswith(Prefix)
+        )
+        # Two pages, like a listing of more than one page of keys
+        for page in (keys[:1], keys[1:]):
+            yield {"Contents": [{"Key": key} for key in page]}
+
+
+class TestFeedbackAggregator:
+
+    def test_parse_rating(self):
+        """
+        Test that only integer ratings between 1 and 5 are kept.
+        """
+        assert [parse_rating(value) for value in ["4", 4, "4.0", "5"]] == [4, 4, 4, 5]
+        for value in ["4.5", "0", "6", "", "None", None, "abc"]:
+            assert parse_rating(value) is None
+
+    def test_counts_and_scores(self):
+        """
+        Test the per-whisky and per-pair counters, and that scores change on publication.
+        """
+        aggregator = FeedbackAggregator()
+        aggregator.update(make_entry("Oban 14", rating="5"))
+        aggregator.update(make_entry("oban 14", rating="3"))
+        aggregator.update(make_entry("Oban 14", rating="None", feedback1="dont-know"))
+
+        assert aggregator.stats("OBAN 14") == {
+            "submissions": 3,
+            "known": 2,
+            "ratings": 2,
+            "mean_rating": 4.0,
+        }
+        assert aggregator.whisky_score("Oban 14") == 0.0
+
+        version = aggregator.publish()
+        assert aggregator.whisky_score("Oban 14") > 0
+        selection = ["ardbeg 10 ten", "Lagavulin 16"]
+        assert aggregator.pair_scores(selection) == {
+            "oban 14": aggregator.whisky_score("Oban 14")
+        }
+        assert aggregator.publish() == version  # Nothing new to publish
+
+    def test_rebuild_from_archive_and_snapshot(self, tmp_path):
+        """
+        Test that the archive is counted once, and a process restarting from the snapshot
+        only reads the files written since.
+        """
+        source_dir = tmp_path / "2024_05"
+        snapshot_path = str(tmp_path / "feedback_stats.json")
+        writer = LocalFeedbackWriter(str(source_dir))
+        writer.write(serialize_batch([make_entry("Oban 14"), make_entry("Oban 14")]))
+
+        aggregator = FeedbackAggregator.restore([str(source_dir)], snapshot_path)
+        assert aggregator.stats("Oban 14")["submissions"] == 2
+        assert os.path.isfile(snapshot_path)
+
+        # Written by another process after the snapshot
+        writer.write(serialize_batch([make_entry("Talisker 10", rating="1")]))
+        restored = FeedbackAggregator.restore([str(source_dir)], snapshot_path)
+        assert restored.stats("Oban 14")["submissions"] == 2
+        assert restored.stats("Talisker 10")["submissions"] == 1
+        assert restored.ingest_archive() == 0
+        assert restored.whisky_score("Talisker 10") < 0
+
+    def test_sink_batches_are_counted_once(self, tmp_path):
+        """
+        Test that batches written by the sink are counted, and not again from the archive.
+        """
+        source_dir = str(tmp_path / "2024_05")
+        aggregator = FeedbackAggregator([source_dir])
+        sink = FeedbackSink(
+            LocalFeedbackWriter(source_dir),
+            max_batch_seconds=0.01,
+            on_written=aggregator.add_batch,
+        )
+        sink.submit(make_entry("Oban 14"))
+        sink.close()
+
+        assert aggregator.stats("Oban 14")["submissions"] == 1
+        assert aggregator.ingest_archive() == 0
+        assert aggregator.stats("Oban 14")["submissions"] == 1
+
+    def test_workers_sharing_a_snapshot_over_s3(self, tmp_path):
+        """
+        Test that workers writing to S3 and snapshotting to the same file count each other's
+        batches, so that the snapshot saved last holds all of them, and a restart from it
+        reads the batches written since from the archive.
+        """
+        client = FakeS3Client()
+        client.put_object("bucket", "reports/summary.json", b"{}")  # Not feedback
+        writer = S3FeedbackWriter("bucket", client=client)
+        snapshot_path = str(tmp_path / "feedback_stats.json")
+        workers = [
+            FeedbackAggregator(
+                snapshot_path=snapshot_path,
+                archive=S3FeedbackArchive("bucket", client=client),
+            )
+            for _ in range(2)
+        ]
+
+        for worker, recommended in zip(workers, ["Oban 14", "Talisker 10"]):
+            entries = [make_entry(recommended)]
+            worker.add_batch(entries, writer.write(serialize_batch(entries)))
+        workers[1].refresh(force=True)
+        workers[0].refresh(force=True)  # Saved last
+        for worker in workers:
+            assert worker.stats("Oban 14")["submissions"] == 1
+            assert worker.stats("Talisker 10")["submissions"] == 1
+
+        # Written by the second worker after the last snapshot
+        entries = [make_entry("Talisker 10", rating="1")]
+        workers[1].add_batch(entries, writer.write(serialize_batch(entries)))
+
+        restored = FeedbackAggregator.restore(
+            snapshot_path=snapshot_path,
+            archive=S3FeedbackArchive("bucket", client=client),
+        )
+        assert restored.stats("Oban 14")["submissions"] == 1
+        assert restored.stats("Talisker 10")["submissions"] == 2
+        assert restored.ingest_archive() == 0
+
+
+class TestFeedbackBlending:
+
+    def test_feedback_reranks_recommendations(self):
+        """
+        Test that well-rated whiskies move up when feedback is blended in, and that the
+        cache does not serve rankings computed with previous scores.
+        """
+        selection = ["Lagavulin 16", "Ardbeg 10 TEN"]
+        aggregator = FeedbackAggregator()
+        recommender = WhiskyRecommender(
+            SAMPLE_FEATURES_FILE, feedback=aggregator, feedback_weight=1.0
+        )
+        baseline = [
+            match["Whisky"]
+            for match in recommender.recommend(selection, k=5)["Top Recommendations"]
+        ]
+
+        for _ in range(20):
+            aggregator.update(make_entry(baseline[-1], rating="5"))
+        aggregator.publish()
+        reranked = recommender.recommend(selection, k=5)
+        assert reranked["Recommended Whisky"] == baseline[-1]
+        assert [
+            match["Whisky"]
+            for match in recommender.recommend_many([selection], k=5)[0][
+                "Top Recommendations"
+            ]
+        ] == [match["Whisky"] for match in reranked["Top Recommendations"]]
+
+        unblended = WhiskyRecommender(SAMPLE_FEATURES_FILE, feedback=aggregator)
+        assert unblended.ranking_version == unblended.dataset_version
+        assert [
+            match["Whisky"]
+            for match in unblended.recommend(selection, k=5)["Top Recommendations"]
+        ] == baseline
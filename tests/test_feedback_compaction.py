@@ -0,0 +1,170 @@
+import os
+
+import pandas as pd
+import pytest
+
+from scripts.feedback import compaction
+from scripts.feedback.compaction import (
+    MISSING_RATING,
+    compact_feedback,
+    list_partitions,
+    load_feedback,
+    parse_ratings,
+)
+from scripts.feedback.feedback_sink import LocalFeedbackWriter, serialize_batch
+
+
+def make_entry(timestamp, rating="4", whisky="Ardbeg 10"):
+    """
+    Build a feedback entry.
+
+    Returns:
+        dict: feedback entry
+    """
+    return {
+        "whisky1": whisky,
+        "whisky2": "Lagavulin 16",
+        "whisky3": "Talisker 10",
+        "recommendedWhisky": "Laphroaig 10",
+        "feedback1": "know",
+        "timestamp": timestamp,
+        "rating": rating,
+        "feedback2": "",
+        "experience": "expert",
+    }
+
+
+def write_single_submission(directory, entry):
+    """
+    Write a feedback file in the one-file-per-submission layout of earlier app versions.
+    """
+    header = list(entry)
+    file_name = f"feedback_{entry['timestamp'].replace(':', '_')}.csv"
+    with open(os.path.join(directory, file_name), "w") as file:
+        file.write(",".join(f'"{field}"' for field in header) + "\n")
+        file.write(",".join(f'"{entry[field]}"' for field in header))
+
+
+class TestFeedbackCompaction:
+
+    def test_compacts_into_typed_date_partitions(self, tmp_path):
+        """
+        Test that single-submission and batch files end up in one partition per day with
+        typed ratings and timestamps.
+        """
+        source_dir = tmp_path / "2024_05"
+        source_dir.mkdir()
+        write_single_submission(source_dir, make_entry("2024-05-01T10:00:00.000Z"))
+        write_single_submission(
+            source_dir, make_entry("2024-05-02T09:30:00.000Z", rating="None")
+        )
+        LocalFeedbackWriter(str(source_dir)).write(
+            serialize_batch(
+                [
+                    make_entry(
+                        "2024-05-01T08:00:00.000Z", rating="5", whisky="Oban 14"
+                    ),
+                    make_entry("not a timestamp"),
+                ]
+            )
+        )
+
+        compacted_dir = str(tmp_path / "compacted")
+        compact_feedback([str(source_dir)], compacted_dir)
+        assert list_partitions(compacted_dir) == {
+            "date=2024-05-01": 2,
+            "date=2024-05-02": 1,
+            "date=unknown": 1,
+        }
+
+        feedback = load_feedback(compacted_dir)
+        assert len(feedback) == 4
+        assert str(feedback["rating"].dtype) == "Int16"
+        assert feedback["rating"].isna().sum() == 1
+        assert str(feedback["timestamp"].dt.tz) == "UTC"
+
+        # Entries of a day are ordered by timestamp
+        first_day = load_feedback(
+            compacted_dir, start_date="2024-05-01", end_date="2024-05-01"
+        )
+        assert list(first_day["whisky1"]) == ["Oban 14", "Ardbeg 10"]
+        assert list(first_day["rating"]) == [5, 4]
+        assert first_day["timestamp"].iloc[0] == pd.Timestamp("2024-05-01T08:00:00Z")
+
+    def test_loads_selected_columns(self, tmp_path):
+        """
+        Test that only the requested columns are returned, and unknown columns are rejected.
+        """
+        source_dir = tmp_path / "2024_05"
+        source_dir.mkdir()
+        write_single_submission(source_dir, make_entry("2024-05-01T10:00:00.000Z"))
+        compacted_dir = str(tmp_path / "compacted")
+        compact_feedback([str(source_dir)], compacted_dir)
+
+        feedback = load_feedback(compacted_dir, columns=["rating", "recommendedWhisky"])
+        assert list(feedback.columns) == ["rating", "recommendedWhisky"]
+
+        with pytest.raises(ValueError):
+            load_feedback(compacted_dir, columns=["flavour"])
+
+    def test_incremental_compaction(self, tmp_path):
+        """
+        Test that a second run only adds the files written since the first one.
+        """
+        source_dir = tmp_path / "2024_05"
+        source_dir.mkdir()
+        write_single_submission(source_dir, make_entry("2024-05-01T10:00:00.000Z"))
+        compacted_dir = str(tmp_path / "compacted")
+        compact_feedback([str(source_dir)], compacted_dir)
+
+        write_single_submission(source_dir, make_entry("2024-05-01T11:00:00.000Z"))
+        write_single_submission(source_dir, make_entry("2024-05-03T11:00:00.000Z"))
+        manifest = compact_feedback([str(source_dir)], compacted_dir)
+        assert len(manifest["sources"]) == 3
+        assert list_partitions(compacted_dir) == {
+            "date=2024-05-01": 2,
+            "date=2024-05-03": 1,
+        }
+
+        # Nothing new: the partitions are left as they are
+        compact_feedback([str(source_dir)], compacted_dir)
+        assert len(load_feedback(compacted_dir)) == 3
+        assert len(load_feedback(compacted_dir, start_date="2024-05-02")) == 1
+
+    def test_parse_ratings(self):
+        """
+        Test that only integer ratings from 1 to 5 are kept.
+        """
+        ratings = parse_ratings(["4", "5.0", "4.5", "0", "7", "-1", "", "None", "good"])
+        assert ratings.tolist() == [4, 5] + [MISSING_RATING] * 7
+
+    def test_interrupted_compaction_is_not_duplicated(self, tmp_path, monkeypatch):
+        """
+        Test that a run interrupted before its manifest is written leaves the compacted
+        feedback as it was, and that the next run compacts the same files exactly once.
+        """
+        source_dir = tmp_path / "2024_05"
+        source_dir.mkdir()
+        write_single_submission(source_dir, make_entry("2024-05-01T10:00:00.000Z"))
+        compacted_dir = str(tmp_path / "compacted")
+        compact_feedback([str(source_dir)], compacted_dir)
+
+        write_single_submission(source_dir, make_entry("2024-05-01T11:00:00.000Z"))
+        write_manifest = compaction._write_manifest
+
+        def crash(compacted_dir, manifest):
+            raise OSError("Disk full")
+
+        monkeypatch.setattr(compaction, "_write_manifest", crash)
+        with pytest.raises(OSError):
+            compact_feedback([str(source_dir)], compacted_dir)
+        assert list_partitions(compacted_dir) == {"date=2024-05-01": 1}
+        assert len(load_feedback(compacted_dir)) == 1
+
+        monkeypatch.setattr(compaction, "_write_manifest", write_manifest)
+        compact_feedback([str(source_dir)], compacted_dir)
+        assert list_partitions(compacted_dir) == {"date=2024-05-01": 2}
+        assert len(load_feedback(compacted_dir)) == 2
+        assert sorted(
+            name for name in os.listdir(compacted_dir) if name.startswith("date=")
+        ) == ["date=2024-05-01.2"]
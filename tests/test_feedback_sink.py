@@ -0,0 +1,232 @@
+import csv
+import io
+import os
+import threading
+import time
+
+from scripts.feedback.feedback_sink import (
+    FEEDBACK_FIELDS,
+    FeedbackSink,
+    LocalFeedbackWriter,
+    S3FeedbackWriter,
+    serialize_batch,
+)
+
+
+def make_entry(number):
+    """
+    Build a feedback entry with all the required fields.
+
+    Returns:
+        dict: feedback entry
+    """
+    return {
+        "whisky1": f"Whisky {number}",
+        "whisky2": "Ardbeg 10",
+        "whisky3": "Lagavulin 16",
+        "recommendedWhisky": "Laphroaig 10",
+        "feedback1": "yes",
+        "timestamp": f"2024-05-01T12:00:{number:02d}Z",
+        "rating": str(number % 5),
+    }
+
+
+def read_rows(csv_content):
+    return list(csv.DictReader(io.StringIO(csv_content)))
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.batches = []
+
+    def write(self, csv_content):
+        self.batches.append(csv_content)
+
+
+class BlockingWriter(RecordingWriter):
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, csv_content):
+        self.started.set()
+        self.release.wait(5)
+        super().write(csv_content)
+
+
+class FailingWriter(RecordingWriter):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def write(self, csv_content):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise OSError("Archive unreachable")
+        super().write(csv_content)
+        return f"archive/batch_{len(self.batches)}.csv"
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+
+class TestFeedbackSink:
+
+    def test_serialize_batch_quotes_values(self):
+        """
+        Test that values holding commas, quotes and new lines survive a CSV round trip.
+        """
+        entry = make_entry(1)
+        entry["feedback2"] = 'Smoky, "peaty"\nand sweet'
+        rows = read_rows(serialize_batch([entry, make_entry(2)]))
+
+        assert len(rows) == 2
+        assert list(rows[0]) == FEEDBACK_FIELDS
+        assert rows[0]["feedback2"] == 'Smoky, "peaty"\nand sweet'
+        assert rows[1]["experience"] == ""
+
+    def test_batches_by_size_and_flushes_on_close(self):
+        """
+        Test that full batches are written as one file each and the last, partial batch is
+        written on close.
+        """
+        writer = RecordingWriter()
+        sink = FeedbackSink(writer, max_batch_size=4, max_batch_seconds=60)
+        for number in range(10):
+            assert sink.submit(make_entry(number))
+        sink.close()
+
+        assert [len(read_rows(batch)) for batch in writer.batches] == [4, 4, 2]
+        rows = [row for batch in writer.batches for row in read_rows(batch)]
+        assert [row["whisky1"] for row in rows] == [f"Whisky {n}" for n in range(10)]
+        assert sink.written == 10
+
+    def test_batches_by_time(self):
+        """
+        Test that a batch is written after `max_batch_seconds` even if it is not full.
+        """
+        writer = RecordingWriter()
+        sink = FeedbackSink(writer, max_batch_size=100, max_batch_seconds=0.01)
+        sink.submit(make_entry(1))
+        for _ in range(200):
+            if writer.batches:
+                break
+            time.sleep(0.01)
+        assert len(writer.batches) == 1
+        sink.close()
+
+    def test_rejects_when_queue_is_full(self):
+        """
+        Test that submissions are rejected rather than blocking once the queue is full.
+        """
+        writer = BlockingWriter()
+        sink = FeedbackSink(writer, max_batch_size=1, max_queue_size=1)
+        assert sink.submit(make_entry(0))
+        assert writer.started.wait(5)  # The worker is busy writing the first entry
+        assert sink.submit(make_entry(1))
+        assert not sink.submit(make_entry(2))
+        assert sink.rejected == 1
+
+        writer.release.set()
+        sink.close()
+        assert sink.written == 2
+
+    def test_local_writer(self, tmp_path):
+        """
+        Test that local batches are complete CSV files with unique names.
+        """
+        writer = LocalFeedbackWriter(str(tmp_path / "feedback"))
+        first = writer.write(serialize_batch([make_entry(1)]))
+        second = writer.write(serialize_batch([make_entry(2)]))
+
+        assert first != second
+        assert sorted(os.listdir(tmp_path / "feedback")) == sorted(
+            [os.path.basename(first), os.path.basename(second)]
+        )
+        with open(first) as file:
+            assert read_rows(file.read())[0]["whisky1"] == "Whisky 1"
+
+    def test_s3_writer_reuses_client(self):
+        """
+        Test that every batch is uploaded through the same client under the prefix.
+        """
+        client = FakeS3Client()
+        sink = FeedbackSink(
+            S3FeedbackWriter("bucket", prefix="feedback/", client=client),
+            max_batch_size=2,
+        )
+        for number in range(5):
+            sink.submit(make_entry(number))
+        sink.close()
+
+        assert len(client.objects) == 3
+        assert all(
+            bucket == "bucket" and key.startswith("feedback/feedback_batch_")
+            for bucket, key in client.objects
+        )
+
+    def test_retries_failed_writes(self):
+        """
+        Test that a batch whose write fails is retried and then counted as written.
+        """
+        writer = FailingWriter(failures=2)
+        written = []
+        sink = FeedbackSink(
+            writer,
+            max_batch_size=2,
+            retry_backoff_seconds=0,
+            on_written=lambda entries, location: written.append(location),
+        )
+        sink.submit(make_entry(1))
+        sink.submit(make_entry(2))
+        sink.close()
+
+        assert writer.attempts == 3
+        assert len(writer.batches) == 1
+        assert written == ["archive/batch_1.csv"]
+        assert (sink.written, sink.spilled, sink.failed_batches) == (2, 0, 0)
+
+    def test_spills_batches_that_cannot_be_written(self, tmp_path):
+        """
+        Test that a batch still failing after every attempt is spilled to the fallback
+        writer as an ordinary batch file, without being reported as written.
+        """
+        writer = FailingWriter(failures=100)
+        written = []
+        sink = FeedbackSink(
+            writer,
+            max_batch_size=2,
+            write_attempts=3,
+            retry_backoff_seconds=0,
+            on_written=lambda entries, location: written.append(location),
+            fallback_writer=LocalFeedbackWriter(str(tmp_path / "spill")),
+        )
+        sink.submit(make_entry(1))
+        sink.submit(make_entry(2))
+        sink.close()
+
+        assert writer.attempts == 3
+        assert written == []
+        assert (sink.written, sink.spilled, sink.failed_batches) == (0, 2, 0)
+        (spilled_file,) = os.listdir(tmp_path / "spill")
+        with open(tmp_path / "spill" / spilled_file) as file:
+            rows = read_rows(file.read())
+        assert [row["whisky1"] for row in rows] == ["Whisky 1", "Whisky 2"]
+
+    def test_counts_lost_batches_without_fallback(self):
+        """
+        Test that a batch that can neither be written nor spilled is counted as failed.
+        """
+        sink = FeedbackSink(
+            FailingWriter(failures=100), write_attempts=2, retry_backoff_seconds=0
+        )
+        sink.submit(make_entry(1))
+        sink.close()
+        assert (sink.written, sink.spilled, sink.failed_batches) == (0, 0, 1)
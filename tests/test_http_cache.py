@@ -0,0 +1,143 @@
+import importlib
+import os
+import sys
+from urllib.parse import urlencode
+
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+from scripts.serving.http_cache import (
+    canonical_recommendation,
+    etag_matches,
+    parse_recommend_query,
+)
+from scripts.serving.validation import parse_recommend_request
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+def make_parameters(names, k=3, mode="exact", filters=None):
+    """
+    Build validated /recommend parameters.
+
+    Returns:
+        dict: parameters as returned by parse_recommend_request
+    """
+    data = {"whisky_names": names, "k": k, "mode": mode}
+    if filters is not None:
+        data["filters"] = filters
+    return parse_recommend_request(data, 50)[0]
+
+
+class TestHTTPCache:
+
+    def test_parse_recommend_query(self):
+        """
+        Test that query parameters map to the equivalent JSON body.
+        """
+        data, error = parse_recommend_query(
+            [
+                ("whisky", "Oban 14"),
+                ("whisky", "Talisker 10"),
+                ("k", "5"),
+                ("mode", "approx"),
+                ("filters", '{"region":["Islay"]}'),
+            ]
+        )
+        assert error is None
+        assert data == {
+            "whisky_names": ["Oban 14", "Talisker 10"],
+            "k": 5,
+            "mode": "approx",
+            "filters": {"region": ["Islay"]},
+        }
+
+        data, _ = parse_recommend_query([("whisky", "Oban 14"), ("k", "many")])
+        assert parse_recommend_request(data, 50)[1].startswith("Invalid input, k")
+        assert parse_recommend_query([("filters", "{region")])[0] is None
+
+    def test_canonical_recommendation(self):
+        """
+        Test that the order and spelling of the selection do not change the canonical query
+        or ETag, while the options and the dataset version do.
+        """
+        recommender = WhiskyRecommender(SAMPLE_FEATURES_FILE)
+        names = list(recommender.names[:2])
+
+        selection, query, etag = canonical_recommendation(
+            recommender, make_parameters(names)
+        )
+        assert selection == tuple(sorted(names))
+        assert query == urlencode(
+            [("whisky", name) for name in sorted(names)] + [("k", 3), ("mode", "exact")]
+        )
+        respelled = [names[1].lower(), f"  {names[0].upper()} ", names[1]]
+        assert canonical_recommendation(recommender, make_parameters(respelled)) == (
+            selection,
+            query,
+            etag,
+        )
+
+        other_etags = {
+            canonical_recommendation(recommender, make_parameters(names, k=4))[2],
+            canonical_recommendation(
+                recommender, make_parameters(names, filters={"min_abv": 46})
+            )[2],
+            canonical_recommendation(
+                recommender, make_parameters(names, filters={"min_abv": "46"})
+            )[2],
+        }
+        assert etag not in other_etags and len(other_etags) == 3
+
+        recommender.dataset_version = "another version"
+        assert canonical_recommendation(recommender, make_parameters(names))[2] != etag
+
+    def test_etag_matches(self):
+        """
+        Test the If-None-Match comparison, including lists, weak tags and "*".
+        """
+        assert etag_matches('"abc"', "abc")
+        assert etag_matches('"xyz", W/"abc"', "abc")
+        assert etag_matches("*", "abc")
+        assert not etag_matches('"abcd"', "abc")
+        assert not etag_matches("", "abc")
+
+    def test_flask_conditional_get(self, monkeypatch, tmp_path):
+        """
+        Test the redirect, 200 and 304 flow of GET /recommend in the Flask app.
+        """
+        monkeypatch.setenv("WHISKY_DATA_FILE", SAMPLE_FEATURES_FILE)
+        monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+        monkeypatch.setenv("FEEDBACK_STATS_FILE", str(tmp_path / "feedback_stats.json"))
+        monkeypatch.setenv("FEEDBACK_SPILL_DIR", str(tmp_path / "spill"))
+        if "application" in sys.modules:
+            application_module = importlib.reload(sys.modules["application"])
+        else:
+            application_module = importlib.import_module("application")
+        client = application_module.application.test_client()
+        names = list(application_module.dataset.current().names[:2])
+
+        query = urlencode([("whisky", names[1]), ("whisky", names[0]), ("k", 2)])
+        response = client.get(f"/recommend?{query}")
+        assert response.status_code == 302
+        canonical_url = response.headers["Location"]
+
+        response = client.get(canonical_url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert response.get_json()["recommended_whisky"]["Recommended Whisky"]
+
+        response = client.get(canonical_url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        response = client.post("/recommend", json={"whisky_names": names, "k": 2})
+        assert response.headers["ETag"] == etag
+        assert response.headers["Content-Location"] == canonical_url
+
+        response = client.get("/recommend?whisky=Unknown%20bottle")
+        assert response.status_code == 400
@@ -0,0 +1,103 @@
+import json
+import os
+
+from scripts.monitoring.metrics import (
+    MetricsRegistry,
+    load_snapshots,
+    merge_snapshots,
+    render_prometheus,
+)
+
+
+class TestMetrics:
+
+    def test_histogram_buckets_and_counters(self):
+        """
+        Test that observations land in the first bucket holding them.
+        """
+        registry = MetricsRegistry(buckets=(0.01, 0.1, 1.0))
+        for value in [0.005, 0.05, 0.05, 5.0]:
+            registry.observe("latency_seconds", value, stage="similarity")
+        registry.increment("requests_total", endpoint="/recommend")
+        registry.increment("requests_total", endpoint="/recommend")
+
+        snapshot = registry.snapshot()
+        histogram = snapshot["histograms"][0]
+        assert histogram["buckets"] == [1, 2, 0]
+        assert histogram["count"] == 4
+        assert snapshot["counters"] == [
+            {"name": "requests_total", "labels": {"endpoint": "/recommend"}, "value": 2}
+        ]
+
+    def test_workers_are_aggregated(self, tmp_path):
+        """
+        Test that the snapshots flushed by several processes are summed.
+        """
+        workers = [MetricsRegistry(buckets=(0.1, 1.0)) for _ in range(2)]
+        for pid, worker in zip([os.getpid(), os.getppid()], workers):
+            worker.observe("latency_seconds", 0.05)
+            worker.increment("requests_total", status="200")
+            (tmp_path / f"metrics_{pid}.json").write_text(json.dumps(worker.snapshot()))
+
+        merged = merge_snapshots(load_snapshots(str(tmp_path)))
+        assert merged["counters"][0]["value"] == 2
+        assert merged["histograms"][0]["buckets"] == [2, 0]
+
+    def test_totals_are_kept_when_a_process_stops(self, tmp_path):
+        """
+        Test that the snapshot left by a process that is no longer running, e.g. a restarted
+        worker, is added to the accumulated snapshot of the stopped processes once, so that
+        the merged totals do not drop.
+        """
+        stopped_worker = MetricsRegistry(buckets=(0.1, 1.0))
+        stopped_worker.increment("requests_total")
+        stopped_worker.observe("latency_seconds", 0.05)
+        running_worker = MetricsRegistry(buckets=(0.1, 1.0))
+        running_worker.increment("requests_total")
+        # Beyond the largest process id Linux allows, so never a running process
+        stopped = tmp_path / "metrics_4194305.json"
+        stopped.write_text(json.dumps(stopped_worker.snapshot()))
+        (tmp_path / f"metrics_{os.getpid()}.json").write_text(
+            json.dumps(running_worker.snapshot())
+        )
+
+        for _ in range(2):
+            merged = merge_snapshots(load_snapshots(str(tmp_path)))
+            assert merged["counters"][0]["value"] == 2
+            assert merged["histograms"][0]["buckets"] == [1, 0]
+        assert not stopped.exists()
+        assert (tmp_path / "metrics_dead.json").exists()
+
+        # A second worker stopping adds to the accumulated totals
+        (tmp_path / "metrics_4194306.json").write_text(
+            json.dumps(stopped_worker.snapshot())
+        )
+        merged = merge_snapshots(load_snapshots(str(tmp_path)))
+        assert merged["counters"][0]["value"] == 3
+        assert merged["histograms"][0]["count"] == 2
+
+    def test_flush_and_collect(self, tmp_path):
+        """
+        Test that collecting flushes the current process and merges its snapshot.
+        """
+        registry = MetricsRegistry(metrics_dir=str(tmp_path))
+        registry.increment("requests_total")
+        assert registry.collect()["counters"][0]["value"] == 1
+        assert len(list(tmp_path.glob("metrics_*.json"))) == 1
+
+    def test_prometheus_text_format(self):
+        """
+        Test that histograms are rendered with cumulative buckets, sum and count.
+        """
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.observe("whisky_request_seconds", 0.05, endpoint="/recommend")
+        registry.observe("whisky_request_seconds", 0.5, endpoint="/recommend")
+
+        text = render_prometheus(registry.snapshot())
+        assert "# TYPE whisky_request_seconds histogram" in text
+        assert 'whisky_request_seconds_bucket{endpoint="/recommend",le="0.1"} 1' in text
+        assert 'whisky_request_seconds_bucket{endpoint="/recommend",le="1.0"} 2' in text
+        assert (
+            'whisky_request_seconds_bucket{endpoint="/recommend",le="+Inf"} 2' in text
+        )
+        assert 'whisky_request_seconds_count{endpoint="/recommend"} 2' in text
@@ -0,0 +1,57 @@
+from scripts.modeling.name_index import NameResolver, normalize_name
+
+NAMES = [
+    "Ardbeg 10 TEN",
+    "Ardbeg  Uigeadail",
+    "Lagavulin 16",
+    "Laphroaig 10",
+    "Bruichladdich Port Charlotte 10",
+    "Lagavulin 16",
+]
+
+
+class TestNameResolver:
+
+    def test_normalize_name(self):
+        """
+        Test that case, accents, punctuation and repeated spaces are normalized away.
+        """
+        assert normalize_name("  Ardbeg  Uigeadail ") == "ardbeg uigeadail"
+        assert (
+            normalize_name("Glenmorangie Signet (Crème)") == "glenmorangie signet creme"
+        )
+
+    def test_resolves_variants_to_dataset_names(self):
+        """
+        Test that variants of a name resolve to the dataset name and unknown names do not.
+        """
+        resolver = NameResolver(NAMES)
+        assert len(resolver) == 5
+        assert resolver.resolve("ardbeg 10 ten") == "Ardbeg 10 TEN"
+        assert resolver.resolve("Ardbeg Uigeadail") == "Ardbeg  Uigeadail"
+        assert resolver.resolve("Talisker 10") is None
+
+    def test_suggests_closest_names(self):
+        """
+        Test that suggestions are ranked by trigram similarity.
+        """
+        resolver = NameResolver(NAMES)
+        suggestions = resolver.suggest("Lagavulin", num_suggestions=2)
+        assert suggestions[0][0] == "Lagavulin 16"
+        assert len(suggestions) <= 2
+        assert all(0 < similarity <= 1 for _, similarity in suggestions)
+        assert resolver.suggest("zzzz") == []
+
+    def test_resolve_many(self):
+        """
+        Test that batches report resolved names and suggestions for the others.
+        """
+        resolver = NameResolver(NAMES)
+        resolved, unresolved = resolver.resolve_many(["LAGAVULIN 16", "Laphroig 10"])
+        assert resolved == {
+            "query": "LAGAVULIN 16",
+            "whisky": "Lagavulin 16",
+            "suggestions": [],
+        }
+        assert unresolved["whisky"] is None
+        assert unresolved["suggestions"][0]["Whisky"] == "Laphroaig 10"
@@ -0,0 +1,60 @@
+import numpy as np
+
+from scripts.modeling.note_explanation import explain_recommendations
+
+NOTE_NAMES = np.array(
+    ["Note_Peat_Smoke", "Note_Sweet", "Note_Sherry", "Note_Fruit", "Note_Oak"]
+)
+
+
+def explain_one_by_one(recommended_notes, user_profile, high_note_threshold=8, top_n=3):
+    """Reference implementation comparing the notes one at a time."""
+    common = [
+        idx
+        for idx, (recommended_note, user_note) in enumerate(
+            zip(recommended_notes, user_profile)
+        )
+        if recommended_note >= high_note_threshold and user_note >= high_note_threshold
+    ]
+    common.sort(key=lambda idx: recommended_notes[idx], reverse=True)
+    additional = [idx for idx in range(len(recommended_notes)) if idx not in common]
+    additional.sort(key=lambda idx: recommended_notes[idx], reverse=True)
+    return NOTE_NAMES[common[:top_n]].tolist(), NOTE_NAMES[additional[:top_n]].tolist()
+
+
+class TestExplainRecommendations:
+
+    def test_common_notes_use_the_user_profile(self):
+        """
+        Test that common high notes must be high in both the profile and the recommendation.
+        """
+        recommended_notes = np.array([9, 2, 8, 10, 1])
+        user_profile = np.array([9.5, 9, 7.9, 8, 0])
+        [(common, additional)] = explain_recommendations(
+            recommended_notes, user_profile, NOTE_NAMES
+        )
+        assert common == ["Note_Fruit", "Note_Peat_Smoke"]
+        assert additional == ["Note_Sherry", "Note_Sweet", "Note_Oak"]
+
+    def test_batch_matches_note_by_note_reference(self):
+        """
+        Test that the vectorized batch explanation matches a note-by-note implementation.
+        """
+        rng = np.random.default_rng(0)
+        recommended_notes = rng.integers(0, 11, size=(50, len(NOTE_NAMES)))
+        user_profiles = rng.integers(0, 11, size=(50, len(NOTE_NAMES))).astype(float)
+
+        for top_n, threshold in [(3, 8), (2, 5)]:
+            explanations = explain_recommendations(
+                recommended_notes,
+                user_profiles,
+                NOTE_NAMES,
+                high_note_threshold=threshold,
+                top_n=top_n,
+            )
+            for notes, profile, explanation in zip(
+                recommended_notes, user_profiles, explanations
+            ):
+                assert explanation == explain_one_by_one(
+                    notes, profile, threshold, top_n
+                )
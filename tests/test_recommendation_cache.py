@@ -0,0 +1,63 @@
+from scripts.modeling.recommendation_cache import RecommendationCache, make_cache_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRecommendationCache:
+
+    def test_key_ignores_order_and_duplicates(self):
+        """
+        Test that selections differing only by order or duplicates share a key.
+        """
+        key = make_cache_key(
+            "v1", ["Lagavulin 16", "Ardbeg 10 TEN", "Laphroaig 10"], k=1
+        )
+        assert key == make_cache_key(
+            "v1", ["Laphroaig 10", "Lagavulin 16", "Ardbeg 10 TEN", "Laphroaig 10"], k=1
+        )
+        assert key != make_cache_key(
+            "v2", ["Lagavulin 16", "Ardbeg 10 TEN", "Laphroaig 10"], k=1
+        )
+        assert key != make_cache_key(
+            "v1", ["Lagavulin 16", "Ardbeg 10 TEN", "Laphroaig 10"], k=3
+        )
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """
+        Test that the cache stays bounded and evicts the least recently used entry.
+        """
+        cache = RecommendationCache(max_size=2, ttl_seconds=None)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert cache.stats() == {
+            "size": 2,
+            "hits": 3,
+            "misses": 1,
+            "evictions": 1,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def test_entries_expire_after_ttl(self):
+        """
+        Test that entries are no longer served once their time-to-live has passed.
+        """
+        clock = FakeClock()
+        cache = RecommendationCache(max_size=10, ttl_seconds=60, clock=clock)
+        cache.put("a", 1)
+        clock.now = 59
+        assert cache.get("a") == 1
+        clock.now = 60
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
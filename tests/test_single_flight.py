@@ -0,0 +1,164 @@
+import itertools
+import os
+import threading
+import time
+
+import pytest
+
+from scripts.modeling.single_flight import SingleFlight
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def run_concurrently(function, count):
+    """
+    Call a function from several threads at once.
+
+    Returns:
+        tuple: threads (started) and the list their results or exceptions are appended to
+    """
+    results = []
+
+    def target():
+        try:
+            results.append(function())
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_one_computation(self):
+        """
+        Test that concurrent calls of a key wait for the first one and share its result.
+        """
+        single_flight = SingleFlight(timeout_seconds=5)
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {"Recommended Whisky": "Oban 14"}
+
+        threads, results = run_concurrently(lambda: single_flight.do("key", compute), 8)
+        wait_until(lambda: single_flight.stats()["coalesced"] == 7)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert all(result is results[0] for result in results)
+        assert single_flight.stats() == {
+            "in_flight": 0,
+            "leaders": 1,
+            "coalesced": 7,
+            "timeouts": 0,
+        }
+
+        # Later calls compute again
+        assert single_flight.do("key", compute) == results[0]
+        assert len(calls) == 2
+
+    def test_exception_is_shared(self):
+        """
+        Test that the callers waiting for a failed computation get its exception.
+        """
+        single_flight = SingleFlight(timeout_seconds=5)
+        release = threading.Event()
+
+        def compute():
+            release.wait(5)
+            raise ValueError("No whiskies left")
+
+        threads, results = run_concurrently(lambda: single_flight.do("key", compute), 3)
+        wait_until(lambda: single_flight.stats()["coalesced"] == 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert [type(result) for result in results] == [ValueError] * 3
+        assert single_flight.stats()["in_flight"] == 0
+
+    def test_timeout_falls_back_to_computing(self):
+        """
+        Test that a caller stops waiting after the timeout and computes the result itself.
+        """
+        single_flight = SingleFlight(timeout_seconds=0.01)
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return "leader"
+
+        threads, results = run_concurrently(lambda: single_flight.do("key", slow), 1)
+        wait_until(lambda: single_flight.stats()["in_flight"] == 1)
+        assert single_flight.do("key", lambda: "fallback") == "fallback"
+        release.set()
+        threads[0].join()
+
+        assert results == ["leader"]
+        assert single_flight.stats()["timeouts"] == 1
+        assert single_flight.stats()["coalesced"] == 0
+
+
+class TestRecommenderCoalescing:
+
+    def test_identical_requests_are_computed_once(self, monkeypatch):
+        """
+        Test that concurrent identical requests, spelled differently, are computed once.
+        """
+        recommender = WhiskyRecommender(SAMPLE_FEATURES_FILE, cache_size=0)
+        release = threading.Event()
+        compute = recommender.compute_recommendation
+        calls = []
+
+        def blocking_compute(*args, **kwargs):
+            calls.append(1)
+            release.wait(5)
+            return compute(*args, **kwargs)
+
+        monkeypatch.setattr(recommender, "compute_recommendation", blocking_compute)
+        spellings = itertools.cycle(
+            [["Lagavulin 16", "Ardbeg 10 TEN"], ["ardbeg 10 ten", "LAGAVULIN 16"]]
+        )
+        threads, results = run_concurrently(
+            lambda: recommender.recommend(next(spellings), k=3), 6
+        )
+        wait_until(lambda: recommender.single_flight.stats()["coalesced"] == 5)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert all(result == results[0] for result in results)
+        # Every caller gets its own copy of the shared result
+        assert len({id(result) for result in results}) == 6
+
+    def test_errors_propagate(self):
+        """
+        Test that the error of a failed computation reaches the caller.
+        """
+        recommender = WhiskyRecommender(SAMPLE_FEATURES_FILE)
+        with pytest.raises(ValueError):
+            recommender.recommend(["Not A Whisky"])
@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.modeling.sparse_features import CSRMatrix, is_sparse_enough, score_profiles
+from scripts.modeling.whisky_recommender_model import WhiskyRecommender
+from scripts.processing.feature_store import (
+    CSR_FORMAT,
+    load_feature_store,
+    write_feature_store,
+)
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+
+def make_sparse_features(num_rows=50, num_columns=40, density=0.1, seed=0):
+    """
+    Build a random mostly-zero feature matrix with a few all-zero rows.
+
+    Returns:
+        np.ndarray: float32 matrix
+    """
+    rng = np.random.default_rng(seed)
+    features = rng.integers(1, 10, size=(num_rows, num_columns)).astype(np.float32)
+    features[rng.random((num_rows, num_columns)) > density] = 0
+    features[[3, 17]] = 0
+    return features
+
+
+class TestCSRMatrix:
+
+    def test_round_trip_and_row_selection(self):
+        """
+        Test that the CSR matrix holds the dense values and selects rows in order.
+        """
+        features = make_sparse_features()
+        sparse = CSRMatrix.from_dense(features)
+        np.testing.assert_array_equal(sparse.toarray(), features)
+        assert sparse.nnz == np.count_nonzero(features)
+
+        rows = np.array([17, 0, 5, 5])
+        np.testing.assert_array_equal(sparse[rows].toarray(), features[rows])
+        np.testing.assert_array_equal(sparse[10:20].toarray(), features[10:20])
+
+    def test_products_match_dense(self):
+        """
+        Test that products with vectors and matrices match the dense computation.
+        """
+        features = make_sparse_features()
+        sparse = CSRMatrix.from_dense(features)
+        profiles = np.random.default_rng(1).random((7, features.shape[1]))
+        profiles = profiles.astype(np.float32)
+
+        np.testing.assert_allclose(
+            sparse @ profiles[0], features @ profiles[0], rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            score_profiles(sparse, profiles), profiles @ features.T, rtol=1e-5
+        )
+
+    def test_normalize_rows(self):
+        """
+        Test that rows are scaled to unit length and all-zero rows stay zero.
+        """
+        features = make_sparse_features()
+        normalized = CSRMatrix.from_dense(features).normalize_rows()
+        norms = np.linalg.norm(normalized.toarray(), axis=1)
+        expected = (np.abs(features).sum(axis=1) > 0).astype(np.float32)
+        np.testing.assert_allclose(norms, expected, rtol=1e-6)
+
+    def test_density_threshold(self):
+        """
+        Test that the sparse layout is only chosen for mostly-zero matrices.
+        """
+        features = make_sparse_features()
+        assert is_sparse_enough(features, 0.25)
+        assert not is_sparse_enough(features, 0.01)
+        assert not is_sparse_enough(features, None)
+
+    def test_sparse_engine_matches_dense_engine(self, tmp_path):
+        """
+        Test that recommendations are the same with CSR and dense features, from a CSV file
+        and from a sparse feature store.
+        """
+        dense = WhiskyRecommender(SAMPLE_FEATURES_FILE, sparse_density_threshold=None)
+        sparse = WhiskyRecommender(SAMPLE_FEATURES_FILE, sparse_density_threshold=1.0)
+        assert isinstance(sparse.normalized_features, CSRMatrix)
+
+        store_dir = str(tmp_path / "feature_store")
+        manifest = write_feature_store(
+            pd.read_csv(SAMPLE_FEATURES_FILE), store_dir, sparse_density_threshold=1.0
+        )
+        assert manifest["matrix_format"] == CSR_FORMAT
+        assert isinstance(load_feature_store(store_dir).features, CSRMatrix)
+        from_store = WhiskyRecommender(store_dir)
+
+        selections = [list(dense.names[:3]), list(dense.names[10:12])]
+        for recommender in [sparse, from_store]:
+            for selection in selections:
+                expected = dense.recommend(selection, k=5)["Top Recommendations"]
+                result = recommender.recommend(selection, k=5)["Top Recommendations"]
+                assert [item["Whisky"] for item in result] == [
+                    item["Whisky"] for item in expected
+                ]
+            batch = recommender.recommend_many(selections, k=3)
+            for result, expected in zip(batch, dense.recommend_many(selections, k=3)):
+                assert result["Recommended Whisky"] == expected["Recommended Whisky"]
+                np.testing.assert_allclose(
+                    [
+                        item["Cosine Similarity"]
+                        for item in result["Top Recommendations"]
+                    ],
+                    [
+                        item["Cosine Similarity"]
+                        for item in expected["Top Recommendations"]
+                    ],
+                    rtol=1e-5,
+                )
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+
+from scripts.monitoring.startup import StartupReport, parse_importtime
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..")
+SAMPLE_FEATURES_FILE = os.path.join(
+    ROOT_DIR, "data", "processed", "2023_09", "whisky_features_100.csv"
+)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestStartupReport:
+
+    def test_phases_ready_and_first_request(self):
+        """
+        Test that the report times the phases, and the ready and first request moments from
+        the start of the process.
+        """
+        clock = FakeClock(100.0)
+        report = StartupReport(started_at=99.0, clock=clock)
+        assert report.report()["time_to_first_request_seconds"] is None
+
+        with report.phase("dataset"):
+            pass
+        report.record_phase("imports", 0.25)
+        clock.now = 100.5
+        report.mark_ready()
+        clock.now = 102.0
+        report.record_request()
+        clock.now = 105.0
+        report.record_request()
+
+        summary = report.report()
+        assert list(summary["phases_seconds"]) == ["dataset", "imports"]
+        assert summary["phases_seconds"]["imports"] == 0.25
+        assert summary["ready_seconds"] == 1.5
+        assert summary["time_to_first_request_seconds"] == 3.0
+
+    def test_parse_importtime(self):
+        """
+        Test that the header of `python -X importtime` is skipped and timings are parsed.
+        """
+        lines = [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   numpy.version",
+            "import time:       593 |     261331 | pandas",
+            "unrelated output",
+        ]
+        assert parse_importtime(lines) == [
+            ("numpy.version", 120, 120),
+            ("pandas", 593, 261331),
+        ]
+
+    def test_serving_a_feature_store_does_not_import_pandas(self, tmp_path):
+        """
+        Test that loading a feature store and recommending from it only needs NumPy.
+        """
+        store_dir = str(tmp_path / "feature_store")
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "scripts.processing.feature_store",
+                SAMPLE_FEATURES_FILE,
+                store_dir,
+            ],
+            cwd=ROOT_DIR,
+            check=True,
+            capture_output=True,
+        )
+        script = (
+            "import sys\n"
+            "from scripts.modeling.whisky_recommender_model import WhiskyRecommender\n"
+            f"recommender = WhiskyRecommender({store_dir!r})\n"
+            "recommender.recommend(['Lagavulin 16'], k=3)\n"
+            "print(sorted({'pandas', 'sklearn', 'scipy'} & set(sys.modules)))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=ROOT_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,307 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.modeling.ann_index import ann_index_path
+from scripts.modeling.neighbour_table import neighbour_table_path
+from scripts.modeling.whisky_recommender_model import (
+    NO_MATCHING_WHISKIES_MESSAGE,
+    WhiskyRecommender,
+    build_ann_index,
+    build_neighbour_table,
+    recommend_whisky,
+    select_top_k,
+)
+
+SAMPLE_FEATURES_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "data",
+    "processed",
+    "2023_09",
+    "whisky_features_100.csv",
+)
+
+METADATA_COLUMNS = [
+    "whisky_url",
+    "distillery_name_inner",
+    "country",
+    "region",
+    "whisky_type",
+    "bottler",
+    "whisky_link",
+    "whisky_name_suffix",
+    "whisky_rating",
+    "num_ratings",
+    "num_reviews",
+    "whisky_age",
+    "alcohol_pct",
+    "full_name",
+    "Chill filtration - With",
+    "Artifical colouring - Without",
+    "Artifical colouring - With",
+    "Chill filtration - Without",
+]
+
+NOTE_COLUMNS = ["Note_Peat_Smoke", "Note_Sweet", "Note_Sherry", "Note_Fruit"]
+
+
+@pytest.fixture
+def features_file(tmp_path):
+    """
+    Fixture to write a small processed features CSV with a known similarity structure.
+
+    Returns:
+        str: Path to the CSV file
+    """
+    notes = {
+        "Smoky A": [10, 2, 0, 1],
+        "Smoky B": [9, 3, 0, 1],
+        "Smoky C": [8, 1, 1, 0],
+        "Sherried A": [0, 8, 10, 5],
+        "Sherried B": [1, 7, 9, 6],
+        "Fruity A": [0, 6, 1, 10],
+    }
+    rows = []
+    for name, note_values in notes.items():
+        row = {column: "" for column in METADATA_COLUMNS}
+        row.update({"full_name": name, "whisky_rating": 4.0, "alcohol_pct": 43.0})
+        row.update(dict(zip(NOTE_COLUMNS, note_values)))
+        rows.append(row)
+    csv_filepath = tmp_path / "whisky_features.csv"
+    pd.DataFrame(rows, columns=METADATA_COLUMNS + NOTE_COLUMNS).to_csv(
+        csv_filepath, index=False
+    )
+    return str(csv_filepath)
+
+
+class TestWhiskyRecommender:
+
+    def test_features_are_normalized_float32(self, features_file):
+        """
+        Test that the scoring matrix is float32 with unit-length rows.
+        """
+        recommender = WhiskyRecommender(features_file)
+        assert recommender.normalized_features.dtype == np.float32
+        np.testing.assert_allclose(
+            np.linalg.norm(recommender.normalized_features, axis=1), 1.0, rtol=1e-6
+        )
+        assert list(recommender.feature_names) == NOTE_COLUMNS
+
+    def test_recommends_most_similar_unselected_whisky(self, features_file):
+        """
+        Test that the recommendation is the closest whisky not selected by the user.
+        """
+        recommender = WhiskyRecommender(features_file)
+        result = recommender.recommend(["Smoky A", "Smoky B"])
+        assert result["Recommended Whisky"] == "Smoky C"
+        assert result["Top Three Common High Tasting Notes"] == ["Note_Peat_Smoke"]
+
+    def test_selection_names_are_normalized(self, features_file):
+        """
+        Test that case and spacing differences do not drop whiskies from the selection.
+        """
+        recommender = WhiskyRecommender(features_file)
+        result = recommender.recommend(["smoky a", "Smoky  B "])
+        assert result["Recommended Whisky"] == "Smoky C"
+
+    def test_unknown_whiskies_raise(self, features_file):
+        """
+        Test that a selection without any known whisky is rejected.
+        """
+        recommender = WhiskyRecommender(features_file)
+        with pytest.raises(ValueError):
+            recommender.recommend(["Not A Whisky"])
+
+    def test_matches_sklearn_cosine_similarity(self):
+        """
+        Test that the engine ranks the sample dataset like sklearn's cosine similarity.
+        """
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        whisky_df = pd.read_csv(SAMPLE_FEATURES_FILE)
+        user_whiskies = ["Lagavulin 16", "Ardbeg 10 TEN", "Laphroaig 10"]
+        user_features = whisky_df[whisky_df["full_name"].isin(user_whiskies)]
+        user_features = user_features.drop_duplicates(subset="full_name")
+        cosine_sim = cosine_similarity(
+            [user_features.iloc[:, 18:].mean(axis=0)], whisky_df.iloc[:, 18:]
+        )[0]
+        cosine_sim[whisky_df["full_name"].isin(user_whiskies).to_numpy()] = -1
+        expected = whisky_df["full_name"].iloc[int(np.argmax(cosine_sim))]
+
+        result = recommend_whisky(SAMPLE_FEATURES_FILE, user_whiskies)
+        assert result["Recommended Whisky"] == expected
+
+    def test_recommend_many_matches_single_recommendations(self, features_file):
+        """
+        Test that batch scoring gives the same results as one-by-one scoring.
+        """
+        recommender = WhiskyRecommender(features_file)
+        selections = [
+            ["Smoky A", "Smoky B"],
+            ["Sherried A"],
+            ["Not A Whisky"],
+            ["Fruity A", "Sherried B", "Fruity A"],
+        ]
+        results = recommender.recommend_many(selections, chunk_size=2)
+
+        assert results[2] == {"error": NO_MATCHING_WHISKIES_MESSAGE}
+        for selection, result in zip(selections, results):
+            if "error" not in result:
+                assert result == recommender.recommend(selection)
+
+    def test_top_k_recommendations_are_ranked(self, features_file):
+        """
+        Test that the top k recommendations are ranked and exclude the user's selections.
+        """
+        recommender = WhiskyRecommender(features_file)
+        result = recommender.recommend(["Sherried A"], k=10)
+        ranked = result["Top Recommendations"]
+
+        # Every whisky except the selected one is returned, best first
+        assert len(ranked) == 5
+        assert [entry["Whisky"] for entry in ranked][:2] == ["Sherried B", "Fruity A"]
+        scores = [entry["Cosine Similarity"] for entry in ranked]
+        assert scores == sorted(scores, reverse=True)
+        assert result["Recommended Whisky"] == ranked[0]["Whisky"]
+
+    def test_select_top_k_matches_full_sort(self):
+        """
+        Test that the partial selection returns the same ranking as a full sort.
+        """
+        rng = np.random.default_rng(0)
+        cosine_sim = rng.random((3, 200))
+        cosine_sim[:, :5] = -np.inf
+        for scores, (rows, top_scores) in zip(cosine_sim, select_top_k(cosine_sim, 7)):
+            expected = np.argsort(-scores)[:7]
+            np.testing.assert_array_equal(rows, expected)
+            np.testing.assert_array_equal(top_scores, scores[expected])
+
+    def test_approximate_mode_probing_all_lists_matches_exact(self, features_file):
+        """
+        Test that the ANN index returns the exact ranking when every cluster is probed.
+        """
+        recommender = WhiskyRecommender(features_file, ann_n_probe=1000)
+        exact = recommender.recommend(["Smoky A"], k=3)
+        approx = recommender.recommend(["Smoky A"], k=3, mode="approx")
+        assert approx == exact
+        assert recommender.recommend_many([["Smoky A"]], k=3, mode="approx") == [exact]
+
+    def test_ann_index_is_persisted_next_to_features(self, features_file):
+        """
+        Test that a saved index is found and reused by a new engine.
+        """
+        index_path = build_ann_index(features_file, n_lists=2)
+        assert os.path.exists(index_path)
+        assert WhiskyRecommender(features_file).get_ann_index().num_lists == 2
+
+    def test_ann_index_is_stored_next_to_a_feature_store_directory(self):
+        """
+        Test that the index of a feature store directory given with a trailing slash is
+        not stored inside the directory, which is replaced on every rebuild.
+        """
+        store = os.path.join("data", "processed", "store")
+        expected = os.path.join("data", "processed", "store.ivf.npz")
+        assert ann_index_path(store + os.sep) == expected
+        assert ann_index_path(store) == expected
+
+    def test_ann_index_probes_at_least_one_list(self, features_file):
+        """
+        Test that a number of lists to probe below one still probes the closest list.
+        """
+        index = WhiskyRecommender(features_file).get_ann_index()
+        profile = np.ones(index.centroids.shape[1]) / np.sqrt(index.centroids.shape[1])
+        expected = index.probe(profile, n_probe=1)
+        assert len(expected) > 0
+        for n_probe in [0, -1]:
+            np.testing.assert_array_equal(index.probe(profile, n_probe), expected)
+
+    def test_ann_index_of_another_dataset_version_is_rebuilt(self, features_file):
+        """
+        Test that a saved index is ignored once the features it was built on change, even if
+        the number of whiskies is the same.
+        """
+        build_ann_index(features_file, n_lists=2)
+        whisky_df = pd.read_csv(features_file)
+        whisky_df[NOTE_COLUMNS] = whisky_df[NOTE_COLUMNS].to_numpy()[::-1]
+        whisky_df.to_csv(features_file, index=False)
+
+        recommender = WhiskyRecommender(features_file)
+        index = recommender.get_ann_index()
+        assert index.dataset_version == recommender.dataset_version
+        assert index.num_lists != 2
+
+    def test_unknown_mode_raises(self, features_file):
+        """
+        Test that an unsupported mode is rejected.
+        """
+        with pytest.raises(ValueError):
+            WhiskyRecommender(features_file).recommend(["Smoky A"], mode="fast")
+
+    def test_repeated_selection_is_served_from_cache(self, features_file):
+        """
+        Test that the same selection in another order hits the cache.
+        """
+        recommender = WhiskyRecommender(features_file)
+        first = recommender.recommend(["Smoky A", "Smoky B"])
+        first["Recommended Whisky"] = "Modified by the caller"
+        second = recommender.recommend(["Smoky B", "Smoky A", "Smoky A"])
+
+        assert second["Recommended Whisky"] == "Smoky C"
+        assert recommender.cache.stats()["hits"] == 1
+
+    def test_loading_a_new_dataset_invalidates_cache(self, features_file):
+        """
+        Test that results computed on a previous dataset are not served after a reload.
+        """
+        recommender = WhiskyRecommender(features_file)
+        recommender.recommend(["Smoky A"])
+
+        whisky_df = pd.read_csv(features_file)
+        whisky_df.loc[whisky_df["full_name"] == "Smoky C", "Note_Peat_Smoke"] = 0
+        whisky_df.to_csv(features_file, index=False)
+        recommender.load_dataset(features_file)
+
+        assert len(recommender.cache) == 0
+        assert recommender.recommend(["Smoky A"])["Recommended Whisky"] == "Smoky B"
+
+    def test_single_whisky_selection_uses_neighbour_table(self, features_file):
+        """
+        Test that the memory-mapped neighbour table gives the same ranking as the scan.
+        """
+        expected = WhiskyRecommender(features_file).recommend(["Sherried A"], k=4)
+        build_neighbour_table(features_file, top_n=3)
+        recommender = WhiskyRecommender(features_file)
+
+        assert recommender.neighbour_table is not None
+        assert recommender.rank_from_neighbour_table(0, np.array([0]), 3) is not None
+        # Only 3 neighbours are stored, so k=4 falls back to the scan
+        assert recommender.rank_from_neighbour_table(0, np.array([0]), 4) is None
+        assert recommender.recommend(["Sherried A"], k=3) == {
+            **expected,
+            "Top Recommendations": expected["Top Recommendations"][:3],
+        }
+        assert recommender.recommend(["Sherried A"], k=4) == expected
+
+    def test_neighbour_table_is_stored_next_to_a_feature_store_directory(self):
+        """
+        Test that the table of a feature store directory given with a trailing slash is
+        not stored inside the directory, which is replaced on every rebuild.
+        """
+        store = os.path.join("data", "processed", "store")
+        expected = os.path.join("data", "processed", "store.neighbours.bin")
+        assert neighbour_table_path(store + os.sep) == expected
+        assert neighbour_table_path(store) == expected
+
+    def test_stale_neighbour_table_is_ignored(self, features_file):
+        """
+        Test that a table computed on another version of the dataset is not used.
+        """
+        build_neighbour_table(features_file)
+        whisky_df = pd.read_csv(features_file)
+        whisky_df.loc[0, "Note_Sweet"] = 5
+        whisky_df.to_csv(features_file, index=False)
+
+        assert WhiskyRecommender(features_file).neighbour_table is None